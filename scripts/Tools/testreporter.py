@@ -12,6 +12,7 @@ from CIME.XML.env_test              import EnvTest
 from CIME.XML.test_reporter         import TestReporter
 from CIME.utils                     import expect
 from CIME.XML.generic_xml import GenericXML
+from CIME.test_status_index import get_test_status_contents
 
 import glob
 
@@ -81,12 +82,13 @@ def get_testreporter_xml(testroot, testid, tagname, testtype):
     # Create lists on tests based on the testid in the testroot directory.
     #
     test_names=glob.glob("*"+testid)
+    test_status_contents=get_test_status_contents([test_name+"/TestStatus" for test_name in test_names])
     #
     # Loop over all tests and parse the test results
     #
     test_status={}
-    for test_name in test_names:
-        if not os.path.isfile(test_name+"/TestStatus"):
+    for test_name, contents in zip(test_names, test_status_contents):
+        if contents is None:
             continue
         test_status['COMMENT']=""
         test_status['BASELINE']='----'
@@ -95,16 +97,7 @@ def get_testreporter_xml(testroot, testid, tagname, testtype):
         test_status['NLCOMP']='----'
         test_status['STATUS']='----'
         test_status['TPUTCOMP']='----'
-        #
-        # Check to see if TestStatus is present, if not then continue
-        # I might want to set the status to fail
-        #
-        try:
-            lines = [line.rstrip('\n') for line in open(test_name+"/TestStatus")]
-        except (IOError, OSError):
-            test_status['STATUS']="FAIL"
-            test_status['COMMENT']="TestStatus missing. "
-            continue
+        lines = contents.splitlines()
         #
         # Loop over each line of TestStatus, and check for different types of failures.
         #
@@ -7,7 +7,7 @@ from CIME.utils import append_testlog, get_model, safe_copy, get_timestamp, CIME
 from CIME.test_status import *
 from CIME.hist_utils import copy_histfiles, compare_test, generate_teststatus, \
     compare_baseline, get_ts_synopsis, generate_baseline
-from CIME.provenance import save_test_time, get_test_success
+from CIME.provenance import save_test_time, save_test_phase_times, get_test_success
 from CIME.locked_files import LOCKED_DIR, lock_file, is_locked
 import CIME.build as build
 
@@ -186,6 +186,8 @@ class SystemTestsCommon(object):
                 baseline_root = self._case.get_value("BASELINE_ROOT")
                 if success:
                     save_test_time(baseline_root, self._casebaseid, time_taken)
+                    if self._case.get_value("SAVE_TIMING"):
+                        save_test_phase_times(baseline_root, self._casebaseid, {RUN_PHASE : time_taken})
 
                 # If overall things did not pass, offer the user some insight into what might have broken things
                 overall_status = self._test_status.get_overall_test_status(ignore_namelists=True)
@@ -50,7 +50,7 @@ class Archive(ArchiveBase):
                 logger.debug("No archive specs found for component {}".format(comp))
             else:
                 logger.debug("adding archive spec for {}".format(comp))
-                env_archive.add_child(specs, root=components_node)
+                env_archive.add_child(env_archive.copy(specs), root=components_node)
 
     def get_all_config_archive_files(self, files):
         """
@@ -3,6 +3,8 @@ Base class for archive files.  This class inherits from generic_xml.py
 """
 from CIME.XML.standard_module_setup import *
 from CIME.XML.generic_xml import GenericXML
+from CIME.rundir_index import RunDirIndex
+from CIME.file_transfer import COMPRESSION_METHODS
 
 logger = logging.getLogger(__name__)
 
@@ -58,11 +60,27 @@ class ArchiveBase(GenericXML):
             return self.text(node)
         return None
 
-    def get_latest_hist_files(self, casename, model, from_dir, suffix="", ref_case=None):
+    def get_file_compression(self, archive_entry, file_type):
+        """
+        get the compression method, from COMPRESSION_METHODS, for the file_type
+        (hist or log) files under root archive_entry
+        returns none if no method is set
+        """
+        method = None
+        if archive_entry is not None:
+            method = self.get_entry_value("{}_file_compression".format(file_type), archive_entry)
+        if method is None:
+            return "none"
+        valid_methods = COMPRESSION_METHODS if file_type == "hist" else ("none", "gzip")
+        expect(method in valid_methods, "{}_file_compression must be one of {}, got {}".format(
+            file_type, ", ".join(valid_methods), method))
+        return method
+
+    def get_latest_hist_files(self, casename, model, from_dir, suffix="", ref_case=None, dir_index=None):
         """
         get the most recent history files in directory from_dir with suffix if provided
         """
-        test_hists = self.get_all_hist_files(casename, model, from_dir, suffix=suffix, ref_case=ref_case)
+        test_hists = self.get_all_hist_files(casename, model, from_dir, suffix=suffix, ref_case=ref_case, dir_index=dir_index)
         latest_files = {}
         histlist = []
         for hist in test_hists:
@@ -73,10 +91,12 @@ class ArchiveBase(GenericXML):
             histlist.append(latest_files[key])
         return histlist
 
-    def get_all_hist_files(self, casename, model, from_dir, suffix="", ref_case=None):
+    def get_all_hist_files(self, casename, model, from_dir, suffix="", ref_case=None, dir_index=None):
         """
         gets all history files in directory from_dir with suffix (if provided)
         ignores files with ref_case in the name if ref_case is provided
+        dir_index is a RunDirIndex of from_dir, to share one listing of
+        from_dir between calls
         """
         dmodel = model
         if model == "cpl":
@@ -84,7 +104,8 @@ class ArchiveBase(GenericXML):
         # remove when component name is changed
         if model == "fv3gfs":
             model = "fv3"
-        hist_files = []
+        if dir_index is None:
+            dir_index = RunDirIndex(from_dir)
         extensions = self.get_hist_file_extensions(self.get_entry(dmodel))
         if suffix and len(suffix) > 0:
             has_suffix = True
@@ -92,17 +113,21 @@ class ArchiveBase(GenericXML):
             has_suffix = False
 
         # Strip any trailing $ if suffix is present and add it back after the suffix
+        strings = []
         for ext in extensions:
             if ext.endswith('$') and has_suffix:
                 ext = ext[:-1]
             string = model+r'\d?_?(\d{4})?\.'+ext
             if has_suffix:
                 string += '.'+suffix+'$'
+            strings.append(string)
 
-
+        # Match all extensions with one pattern
+        hist_files = []
+        if strings:
+            string = "|".join("(?:{})".format(item) for item in strings)
             logger.debug ("Regex is {}".format(string))
-            pfile = re.compile(string)
-            hist_files.extend([f for f in os.listdir(from_dir) if pfile.search(f) and (f.startswith(casename) or f.startswith(model))])
+            hist_files = [f for f in dir_index.search(string) if f.startswith(casename) or f.startswith(model)]
 
         if ref_case:
             expect(ref_case not in casename,"ERROR: ref_case name {} conflicts with casename {}".format(ref_case,casename))
@@ -0,0 +1,95 @@
+"""
+A shared, read-only view of the config files for processes creating many
+cases, such as create_test creating cases in-process.
+
+While a snapshot is active (see config_snapshot) each shared config file,
+that is any xml file other than a case's env_*.xml, is parsed once.  Every
+later GenericXML read of it, from any thread, shares that tree without
+checking the file again, even when GenericXML.DISABLE_CACHING is set.
+Objects opened read_only cannot modify the shared tree, writable ones get
+their own copy.  Changes made to config files while the snapshot is active
+are not seen.
+
+A child forked while a snapshot is active starts with a copy of every
+file loaded so far.  Comparing keys() before and after tells which files a
+child loaded itself, reading those in the parent shares them with later
+children.
+"""
+from CIME.XML.standard_module_setup import *
+
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Held while a file is parsed so each file is parsed only once. GenericXML
+# also holds it across fork, see generic_xml.
+LOAD_LOCK = threading.RLock()
+
+class ConfigSnapshot(object):
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def covers(self, infile):
+        """
+        Return True for files that are shared between cases
+
+        >>> snapshot = ConfigSnapshot()
+        >>> snapshot.covers("/cime/config/cesm/machines/config_machines.xml")
+        True
+        >>> snapshot.covers("/cases/mycase/env_run.xml")
+        False
+        """
+        return not os.path.basename(infile).startswith("env_")
+
+    def get(self, infile, schema, load):
+        """
+        Return (root element, included files) for infile. On the first
+        request load() is called to parse the file and must return those.
+        """
+        key = (os.path.abspath(infile), schema)
+        with LOAD_LOCK:
+            entry = self._entries.get(key)
+            if entry is None:
+                logger.debug("config snapshot miss: {}".format(infile))
+                entry = load()
+                self._entries[key] = entry
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def keys(self):
+        """
+        Return the (path, schema) of every file loaded so far
+        """
+        with LOAD_LOCK:
+            return list(self._entries)
+
+_CONFIG_SNAPSHOT = None
+def get_config_snapshot():
+    """
+    Return the active ConfigSnapshot or None
+    """
+    return _CONFIG_SNAPSHOT
+
+@contextmanager
+def config_snapshot():
+    """
+    Share the config files read in this context between all threads.
+    Snapshots do not nest, an inner context uses the outer snapshot.
+    """
+    global _CONFIG_SNAPSHOT
+    if _CONFIG_SNAPSHOT is not None:
+        yield _CONFIG_SNAPSHOT
+        return
+
+    _CONFIG_SNAPSHOT = ConfigSnapshot()
+    try:
+        yield _CONFIG_SNAPSHOT
+    finally:
+        logger.debug("config snapshot: {:d} files, {:d} shared reads".format(_CONFIG_SNAPSHOT.misses, _CONFIG_SNAPSHOT.hits))
+        _CONFIG_SNAPSHOT = None
@@ -7,6 +7,9 @@ from CIME.XML.headers import Headers
 from CIME.utils import convert_to_type
 logger = logging.getLogger(__name__)
 
+_ENTRY_ID_RE = re.compile(r"""<entry\s[^>]*?\bid=["']([^"']*)["']""")
+_ELEMENT_NAME_RE = re.compile(r"<(\w+)")
+
 class EnvBase(EntryID):
 
     def __init__(self, case_root, infile, schema=None, read_only=False):
@@ -27,9 +30,12 @@ class EnvBase(EntryID):
             headerobj = Headers()
             headernode = headerobj.get_header_node(os.path.basename(fullpath))
             self.add_child(headernode)
-        else:
+        elif not self.deferred:
             self._setup_cache()
 
+    def _post_deferred_read(self):
+        self._setup_cache()
+
     def _setup_cache(self):
         self._id_map = {}    # map id directly to nodes
         self._group_map = {} # map group name to entry id dict
@@ -57,32 +63,58 @@ class EnvBase(EntryID):
         EntryID.change_file(self, newfile, copy=copy)
         self._setup_cache()
 
-    def get_children(self, name=None, attributes=None, root=None):
-        if self.locked and name == "entry" and attributes is not None and attributes.keys() == ["id"]:
-            entry_id = attributes["id"]
-            if root is None or self.name(root) == "file":
-                if entry_id in self._id_map:
-                    return self._id_map[entry_id]
-                else:
-                    return []
+    def _get_entries_by_id(self, entry_id, root=None):
+        """
+        Look up entries by id in the maps built by _setup_cache
+        """
+        if root is None or self.name(root) == "file":
+            if entry_id in self._id_map:
+                return list(self._id_map[entry_id])
             else:
-                expect(self.name(root) == "group", "Unexpected elem '{}' for {}, attrs {}".format(self.name(root), self.filename, self.attrib(root)))
-                group_id = self.get(root, "id")
-                if group_id in self._group_map and entry_id in self._group_map[group_id]:
-                    return [self._group_map[group_id][entry_id]]
-                else:
-                    return []
+                return []
+        else:
+            expect(self.name(root) == "group", "Unexpected elem '{}' for {}, attrs {}".format(self.name(root), self.filename, self.attrib(root)))
+            group_id = self.get(root, "id")
+            if group_id in self._group_map and entry_id in self._group_map[group_id]:
+                return [self._group_map[group_id][entry_id]]
+            else:
+                return []
 
+    def get_children(self, name=None, attributes=None, root=None):
+        if self.locked and name == "entry" and attributes is not None and attributes.keys() == ["id"]:
+            return self._get_entries_by_id(attributes["id"], root=root)
         else:
             # Non-compliant look up
             return EntryID.get_children(self, name=name, attributes=attributes, root=root)
 
     def scan_children(self, nodename, attributes=None, root=None):
-        if self.locked and nodename == "entry" and attributes is not None and attributes.keys() == ["id"]:
-            return EnvBase.get_children(self, name=nodename, attributes=attributes, root=root)
+        if self.locked and nodename == "entry" and attributes is not None and list(attributes.keys()) == ["id"]:
+            return self._get_entries_by_id(attributes["id"], root=root)
         else:
             return EntryID.scan_children(self, nodename, attributes=attributes, root=root)
 
+    def get_value_names(self):
+        """
+        Return the set of names get_value can find in this file, for most
+        files the ids of its entries. Case routes lookups with these, a file
+        not yet parsed (see GenericXML.deferred) is only scanned.
+        """
+        if self.deferred:
+            with open(self.filename, "r") as fd:
+                return set(_ENTRY_ID_RE.findall(fd.read()))
+        if self.locked:
+            return set(self._id_map)
+        return set(self.get(node, "id") for node in self.scan_children("entry"))
+
+    def _get_element_names(self):
+        """
+        Return the set of tags of all elements in this file
+        """
+        if self.deferred:
+            with open(self.filename, "r") as fd:
+                return set(_ELEMENT_NAME_RE.findall(fd.read()))
+        return set(self.name(node) for node in self.scan_children("*"))
+
     def set_components(self, components):
         if hasattr(self, '_components'):
             # pylint: disable=attribute-defined-outside-init
@@ -106,23 +138,29 @@ class EnvBase(EntryID):
                     comp = attribute["compclass"]
                 return vid, comp, True
         else:
-            if hasattr(self, "_components") and self._components:
-                new_vid = None
-                for comp in self._components:
-                    if vid.endswith('_'+comp):
-                        new_vid = vid.replace('_'+comp, '', 1)
-                    elif vid.startswith(comp+'_'):
-                        new_vid = vid.replace(comp+'_', '', 1)
-                    elif '_' + comp + '_' in vid:
-                        new_vid = vid.replace(comp+'_','', 1)
-                    if new_vid is not None:
-                        break
-                if new_vid is not None:
-                    logger.debug("vid {} is a compvar with comp {}".format(vid, comp))
-                    return new_vid, comp, True
+            new_vid, comp = self.split_comp_var(vid)
+            if comp is not None:
+                logger.debug("vid {} is a compvar with comp {}".format(vid, comp))
+                return new_vid, comp, True
 
         return vid, None, False
 
+    def split_comp_var(self, vid):
+        """
+        Split a name like NTASKS_ATM into the base variable name and the
+        component class, (vid, None) if vid names no component of the case
+        """
+        if hasattr(self, "_components") and self._components:
+            for comp in self._components:
+                if vid.endswith('_'+comp):
+                    return vid.replace('_'+comp, '', 1), comp
+                elif vid.startswith(comp+'_'):
+                    return vid.replace(comp+'_', '', 1), comp
+                elif '_' + comp + '_' in vid:
+                    return vid.replace(comp+'_','', 1), comp
+
+        return vid, None
+
     def get_value(self, vid, attribute=None, resolved=True, subgroup=None):
         """
         Get a value for entry with id attribute vid.
@@ -79,6 +79,10 @@ class EnvBatch(EnvBase):
 
         return value
 
+    def get_value_names(self):
+        # get_value also finds batch settings by element name
+        return EnvBase.get_value_names(self) | self._get_element_names()
+
     def get_type_info(self, vid):
         gnodes = self.get_children("group")
         for gnode in gnodes:
@@ -25,6 +25,11 @@ class EnvMachPes(EnvBase):
             self.remove_child(node)
             self.add_child(node, position=1)
 
+    def get_value_names(self):
+        names = EnvBase.get_value_names(self)
+        names.add("NINST_MAX")
+        return names
+
     def get_value(self, vid, attribute=None, resolved=True, subgroup=None, max_mpitasks_per_node=None): # pylint: disable=arguments-differ
         # Special variable NINST_MAX is used to determine the number of
         # drivers in multi-driver mode.
@@ -52,7 +52,7 @@ class EnvMachSpecific(EnvBase):
 
             else:
                 for node in nodes:
-                    self.add_child(node)
+                    self.add_child(self.copy(node))
 
     def _get_modules_for_case(self, case, job=None):
         module_nodes = self.get_children("modules", root=self.get_child("module_system"))
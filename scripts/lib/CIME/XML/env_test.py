@@ -17,7 +17,7 @@ class EnvTest(EnvBase):
         EnvBase.__init__(self, case_root, infile, read_only=read_only)
 
     def add_test(self,testnode):
-        self.add_child(testnode)
+        self.add_child(self.copy(testnode))
         self.write()
 
     def set_initial_values(self, case):
@@ -110,6 +110,10 @@ class EnvTest(EnvBase):
                 newval = self.set_element_text(vid, value, root=tnode)
         return newval
 
+    def get_value_names(self):
+        # get_value also finds the settings of the test by element name
+        return EnvBase.get_value_names(self) | self._get_element_names()
+
     def get_value(self, vid, attribute=None, resolved=True, subgroup=None):
         value = EnvBase.get_value(self, vid, attribute, resolved, subgroup)
         if value is None:
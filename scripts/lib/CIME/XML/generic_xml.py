@@ -4,17 +4,75 @@ be used by other XML interface modules and not directly.
 """
 from CIME.XML.standard_module_setup import *
 from CIME.utils import safe_copy
+from CIME.XML.parse_cache import get_parse_cache
+from CIME.XML.schema_validator import get_schema_validator
+from CIME.XML.xml_backend import get_xml_backend
+from CIME.XML.config_snapshot import get_config_snapshot, LOAD_LOCK
 
-import xml.etree.ElementTree as ET
 #pylint: disable=import-error
 from distutils.spawn import find_executable
-import getpass
+import getpass, hashlib, weakref, threading, time
 import six
 from copy import deepcopy
 from collections import namedtuple
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+_NAMESPACES = {"xi" : "http://www.w3.org/2001/XInclude"}
+
+_REFERENCE_RE = re.compile(r'\${?(\w+)}?')
+_ENV_REF_RE   = re.compile(r'\$ENV\{(\w+)\}')
+_SHELL_REF_RE = re.compile(r'\$SHELL\{([^}]+)\}')
+_MATH_RE      = re.compile(r'\s[+-/*]\s')
+
+class ResolveRecord(object):
+    """
+    What a call to get_resolved_value depended on: the xml variables it
+    referenced, the environment variables it read (with the values seen) and,
+    if shell_outputs is a dict, the output of each $SHELL{} command run.
+    Commands already in shell_outputs are not run again.
+    """
+
+    def __init__(self, shell_outputs=None):
+        self.variables = set()
+        self.env_vars = {}
+        self.shell_outputs = shell_outputs
+
+def get_references(value):
+    """
+    Return the names of the variables referenced in value
+
+    >>> get_references("$A/${B}/x")
+    ['A', 'B']
+    """
+    return _REFERENCE_RE.findall(value)
+
+_DEFERRED_READS = threading.local()
+
+@contextmanager
+def deferred_reads():
+    """
+    Existing files opened read-only by GenericXML objects created in this
+    context are only parsed when their contents are first used.
+    """
+    saved = getattr(_DEFERRED_READS, "enabled", False)
+    _DEFERRED_READS.enabled = True
+    try:
+        yield
+    finally:
+        _DEFERRED_READS.enabled = saved
+
+def _file_has_content(filename, content):
+    """
+    Return True if filename exists and its sha1 matches that of the string content
+    """
+    if not os.path.isfile(filename):
+        return False
+    with open(filename, "rb") as fd:
+        ondisk = hashlib.sha1(fd.read()).digest()
+    return ondisk == hashlib.sha1(content.encode("utf-8")).digest()
+
 class _Element(object): # private class, don't want users constructing directly or calling methods on it
 
     def __init__(self, xml_element):
@@ -34,17 +92,206 @@ class _Element(object): # private class, don't want users constructing directly
     def __deepcopy__(self, _):
         return _Element(deepcopy(self.xml_element))
 
+class _ChildIndex(object):
+    """
+    Lookup tables from tag and attribute to the children of one element.
+    Children are kept as _Element wrappers, in document order, so lookups
+    neither rescan the parent nor allocate new wrappers.
+    """
+
+    def __init__(self, parent):
+        self.children = []
+        self.by_tag = {}
+        self.by_key = {}   # attrib name -> children having that attrib
+        self.by_value = {} # (attrib name, value) -> children
+        # lxml elements know their parent, ElementTree ones need _CHILD_PARENTS
+        self._track_parents = not hasattr(parent, "getparent")
+        for child in parent:
+            self.append(_Element(child), parent)
+
+    def append(self, node, parent):
+        child = node.xml_element
+        self.children.append(node)
+        self.by_tag.setdefault(child.tag, []).append(node)
+        for key, value in child.attrib.items():
+            self.by_key.setdefault(key, []).append(node)
+            self.by_value.setdefault((key, value), []).append(node)
+        if self._track_parents:
+            _CHILD_PARENTS.setdefault(child, weakref.WeakSet()).add(parent)
+
+    def remove(self, node, parent):
+        child = node.xml_element
+        tables = [self.children, self.by_tag.get(child.tag)]
+        tables.extend(self.by_key.get(key) for key in child.attrib)
+        tables.extend(self.by_value.get(item) for item in child.attrib.items())
+        for table in tables:
+            if table is not None:
+                # Like ElementTree, only drop the first occurrence
+                for idx, item in enumerate(table):
+                    if item.xml_element is child:
+                        del table[idx]
+                        break
+        if child in _CHILD_PARENTS:
+            _CHILD_PARENTS[child].discard(parent)
+
+    def _reindex(self, tags=True, keys=None):
+        """
+        Rebuild the tag table and the attribute tables for keys (all if None)
+        from self.children
+        """
+        if tags:
+            self.by_tag = {}
+            for node in self.children:
+                self.by_tag.setdefault(node.xml_element.tag, []).append(node)
+        if keys is None:
+            self.by_key, self.by_value = {}, {}
+        else:
+            for key in keys:
+                self.by_key.pop(key, None)
+            for item in [item for item in self.by_value if item[0] in keys]:
+                del self.by_value[item]
+        for node in self.children:
+            for key, value in node.xml_element.attrib.items():
+                if keys is None or key in keys:
+                    self.by_key.setdefault(key, []).append(node)
+                    self.by_value.setdefault((key, value), []).append(node)
+
+    def lookup(self, name, attributes):
+        candidates = self.children if name is None else self.by_tag.get(name, [])
+        if not attributes:
+            return list(candidates)
+
+        # Start from the most selective table, then check the rest directly
+        for key, value in attributes.items():
+            table = self.by_key.get(key, []) if value is None else self.by_value.get((key, value), [])
+            if len(table) < len(candidates):
+                candidates = table
+        if not candidates:
+            return []
+
+        matches = []
+        for node in candidates:
+            child = node.xml_element
+            if name is not None and child.tag != name:
+                continue
+            for key, value in attributes.items():
+                if key not in child.attrib or (value is not None and child.attrib[key] != value):
+                    break
+            else:
+                matches.append(node)
+        return matches
+
+# ElementTree elements cannot carry extra data and have no parent pointers, so
+# the indexes, and the parents each indexed child is listed under, live here.
+# Keying on the element lets every GenericXML object sharing a tree through
+# _FILEMAP see the same, consistent index.  lxml elements know their parent
+# and are never listed in _CHILD_PARENTS.
+_CHILD_INDEXES = weakref.WeakKeyDictionary()
+_CHILD_PARENTS = weakref.WeakKeyDictionary()
+
+# Trees shared through a config snapshot are indexed from several threads,
+# and cases may be created in children forked from any of them
+_INDEX_LOCK = threading.Lock()
+
+def _acquire_for_fork():
+    # A child must not start with a lock held by a thread it does not have.
+    # Snapshot loads index children, so take the locks in that order.
+    LOAD_LOCK.acquire()
+    _INDEX_LOCK.acquire()
+
+def _release_after_fork():
+    _INDEX_LOCK.release()
+    LOAD_LOCK.release()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_acquire_for_fork, # pylint: disable=no-member
+                        after_in_parent=_release_after_fork, after_in_child=_release_after_fork)
+
+def _get_child_index(parent):
+    index = _CHILD_INDEXES.get(parent)
+    if index is None:
+        with _INDEX_LOCK:
+            index = _CHILD_INDEXES.get(parent)
+            if index is None:
+                index = _ChildIndex(parent)
+                _CHILD_INDEXES[parent] = index
+    return index
+
+def _reindex_parents(child, tags=True, keys=None):
+    parents = [child.getparent()] if hasattr(child, "getparent") else _CHILD_PARENTS.get(child, ())
+    for parent in parents:
+        index = _CHILD_INDEXES.get(parent)
+        if index is not None:
+            index._reindex(tags=tags, keys=keys) # pylint: disable=protected-access
+
 class GenericXML(object):
 
     _FILEMAP = {}
     DISABLE_CACHING = False
     CacheEntry = namedtuple("CacheEntry", ["tree", "root", "modtime"])
+    # The ResolveRecord of the get_resolved_value call in progress, if any
+    _resolve_record = None
+    # (infile, schema) of a read postponed by deferred_reads
+    _deferred_read = None
 
     @classmethod
     def invalidate(cls, filename):
         if filename in cls._FILEMAP:
             del cls._FILEMAP[filename]
 
+    @property
+    def needsrewrite(self):
+        return self._needsrewrite
+
+    @needsrewrite.setter
+    def needsrewrite(self, value):
+        # Every modification marks the object for rewrite, counting those
+        # lets callers holding derived data (Case's resolved values) notice
+        # changes made behind their back.
+        if value:
+            self.generation = getattr(self, "generation", 0) + 1
+        self._needsrewrite = value
+
+    @property
+    def tree(self):
+        if self._deferred_read is not None:
+            self._complete_read()
+        return self._tree
+
+    @tree.setter
+    def tree(self, value):
+        self._tree = value
+
+    @property
+    def root(self):
+        if self._deferred_read is not None:
+            self._complete_read()
+        return self._root
+
+    @root.setter
+    def root(self, value):
+        self._root = value
+
+    @property
+    def deferred(self):
+        """
+        True if the file has not been parsed yet, see deferred_reads
+        """
+        return self._deferred_read is not None
+
+    def _complete_read(self):
+        infile, schema = self._deferred_read
+        self._deferred_read = None
+        start = time.time()
+        self.read(infile, schema)
+        self._post_deferred_read()
+        logger.debug("Read {} on first use in {:.3f} seconds".format(infile, time.time() - start))
+
+    def _post_deferred_read(self):
+        """
+        Subclasses finish any setup that needed the file contents here
+        """
+
     def __init__(self, infile=None, schema=None, root_name_override=None, root_attrib_override=None, read_only=True):
         """
         Initialize an object
@@ -55,13 +302,19 @@ class GenericXML(object):
         self.locked = False
         self.read_only = read_only
         self.filename = infile
+        self.generation = 0
         self.needsrewrite = False
+        self._include_files = []
+        self._schema = schema
         if infile is None:
             return
 
         if os.path.isfile(infile) and os.access(infile, os.R_OK):
             # If file is defined and exists, read it
-            self.read(infile, schema)
+            if read_only and getattr(_DEFERRED_READS, "enabled", False):
+                self._deferred_read = (infile, schema)
+            else:
+                self.read(infile, schema)
         else:
             # if file does not exist create a root xml element
             # and set it's id to file
@@ -69,14 +322,14 @@ class GenericXML(object):
             logger.debug("File {} does not exists.".format(infile))
             expect("$" not in infile,"File path not fully resolved {}".format(infile))
 
-            root = _Element(ET.Element("xml"))
+            root = _Element(get_xml_backend().Element("xml"))
 
             if root_name_override:
                 self.root = self.make_child(root_name_override, root=root, attributes=root_attrib_override)
             else:
                 self.root = self.make_child("file", root=root, attributes={"id":os.path.basename(infile), "version":"2.0"})
 
-            self.tree = ET.ElementTree(root)
+            self.tree = get_xml_backend().ElementTree(root.xml_element)
 
             self._FILEMAP[infile] = self.CacheEntry(self.tree, self.root, 0.0)
 
@@ -84,6 +337,25 @@ class GenericXML(object):
         """
         Read and parse an xml file into the object
         """
+        self.generation = getattr(self, "generation", 0) + 1
+
+        snapshot = get_config_snapshot()
+        if snapshot is not None and self.tree is None and snapshot.covers(infile):
+            root, include_files = snapshot.get(infile, schema, lambda: self._read_file(infile, schema))
+            if not self.read_only:
+                # The shared tree must not change
+                root = deepcopy(root)
+            self.tree = get_xml_backend().ElementTree(root)
+            self.root = _Element(root)
+            self._include_files = list(include_files)
+        else:
+            self._read_file(infile, schema)
+
+    def _read_file(self, infile, schema):
+        """
+        Read infile into the object using the in-process and persistent
+        caches, return the root element and the list of included files
+        """
         cached_read = False
         if not self.DISABLE_CACHING and infile in self._FILEMAP:
             timestamp_cache = self._FILEMAP[infile].modtime
@@ -95,8 +367,21 @@ class GenericXML(object):
                 self.tree, self.root, _ = self._FILEMAP[infile]
                 cached_read = True
 
+        # The persistent cache holds fully resolved trees, it cannot be used
+        # when merging an included file into an existing tree
+        parse_cache = get_parse_cache() if self.tree is None and self.read_only else None
+        if not cached_read and parse_cache is not None:
+            cached_root = parse_cache.load(infile, schema)
+            if cached_root is not None:
+                self.tree = get_xml_backend().ElementTree(cached_root)
+                self.root = _Element(cached_root)
+                cached_read = True
+                self._FILEMAP[infile] = self.CacheEntry(self.tree, self.root, os.path.getmtime(infile))
+
         if not cached_read:
             logger.debug("read: {}".format(infile))
+            if self.tree is None:
+                self._include_files = []
             file_open = (lambda x: open(x, 'r', encoding='utf-8')) if six.PY3 else (lambda x: open(x, 'r'))
             with file_open(infile) as fd:
                 self.read_fd(fd)
@@ -108,11 +393,16 @@ class GenericXML(object):
 
             self._FILEMAP[infile] = self.CacheEntry(self.tree, self.root, os.path.getmtime(infile))
 
+            if parse_cache is not None:
+                parse_cache.store(infile, self.root.xml_element, [infile] + self._include_files, schema=schema)
+
+        return self.root.xml_element, list(self._include_files)
+
     def read_fd(self, fd):
         expect(self.read_only or not self.filename or not self.needsrewrite, "Reading into object marked for rewrite, file {}"               .format(self.filename))
         read_only = self.read_only
         if self.tree:
-            addroot = _Element(ET.parse(fd).getroot())
+            addroot = _Element(get_xml_backend().parse(fd).getroot())
             # we need to override the read_only mechanism here to append the xml object
             self.read_only = False
             if addroot.xml_element.tag == self.name(self.root):
@@ -122,7 +412,7 @@ class GenericXML(object):
                 self.add_child(addroot)
             self.read_only = read_only
         else:
-            self.tree = ET.parse(fd)
+            self.tree = get_xml_backend().parse(fd)
             self.root = _Element(self.tree.getroot())
         include_elems = self.scan_children("xi:include")
         # First remove all includes found from the list
@@ -136,6 +426,7 @@ class GenericXML(object):
                 os.path.join(os.getcwd(), os.path.dirname(self.filename),
                              self.get(elem, "href")))
             logger.debug("Include file {}".format(path))
+            self._include_files.append(path)
             self.read(path)
 
     def lock(self):
@@ -155,6 +446,7 @@ class GenericXML(object):
                 os.makedirs(new_case)
             safe_copy(self.filename, newfile)
 
+        self._deferred_read = None
         self.tree = None
         self.filename = newfile
         self.read(newfile)
@@ -175,14 +467,17 @@ class GenericXML(object):
             if attrib_name == "id":
                 expect(not self.locked, "locked: cannot set attrib[{}]={} for node {} in file {}".format(attrib_name, value, self.name(node), self.filename))
             self.needsrewrite = True
-            return node.xml_element.set(attrib_name, value)
+            node.xml_element.set(attrib_name, value)
+            _reindex_parents(node.xml_element, tags=False, keys=(attrib_name,))
 
     def pop(self, node, attrib_name):
         expect(not self.read_only, "read_only: cannot pop attrib[{}] for node {} in file {}".format(attrib_name, self.name(node), self.filename))
         if attrib_name == "id":
             expect(not self.locked, "locked: cannot pop attrib[{}] for node {} in file {}".format(attrib_name, self.name(node), self.filename))
         self.needsrewrite = True
-        return node.xml_element.attrib.pop(attrib_name)
+        value = node.xml_element.attrib.pop(attrib_name)
+        _reindex_parents(node.xml_element, tags=False, keys=(attrib_name,))
+        return value
 
     def attrib(self, node):
         # Return a COPY. We do not want clients making changes directly
@@ -193,6 +488,7 @@ class GenericXML(object):
         if node.xml_element.tag != name:
             self.needsrewrite = True
             node.xml_element.tag = name
+            _reindex_parents(node.xml_element, tags=True, keys=())
 
     def set_text(self, node, text):
         expect(not self.read_only, "read_only: set node text {} for node {} in file {}".format(text, self.name(node), self.filename))
@@ -213,10 +509,21 @@ class GenericXML(object):
         expect(not self.locked and not self.read_only, "{}: cannot add child {} in file {}".format("read_only" if self.read_only else "locked", self.name(node), self.filename))
         self.needsrewrite = True
         root = root if root is not None else self.root
+        if get_xml_backend().get_parent(node.xml_element) is not None:
+            # An lxml element has one parent, add a copy rather than taking
+            # it away from its current parent
+            node = _Element(deepcopy(node.xml_element))
         if position is not None:
             root.xml_element.insert(position, node.xml_element)
+            _CHILD_INDEXES.pop(root.xml_element, None)
         else:
             root.xml_element.append(node.xml_element)
+            self._index_new_child(node, root)
+
+    def _index_new_child(self, node, root):
+        index = _CHILD_INDEXES.get(root.xml_element)
+        if index is not None:
+            index.append(node, root.xml_element)
 
     def copy(self, node):
         return deepcopy(node)
@@ -226,15 +533,19 @@ class GenericXML(object):
         self.needsrewrite = True
         root = root if root is not None else self.root
         root.xml_element.remove(node.xml_element)
+        index = _CHILD_INDEXES.get(root.xml_element)
+        if index is not None:
+            index.remove(node, root.xml_element)
 
     def make_child(self, name, attributes=None, root=None, text=None):
         expect(not self.locked and not self.read_only, "{}: cannot make child {} in file {}".format("read_only" if self.read_only else "locked", name, self.filename))
         root = root if root is not None else self.root
         self.needsrewrite = True
         if attributes is None:
-            node = _Element(ET.SubElement(root.xml_element, name))
+            node = _Element(get_xml_backend().SubElement(root.xml_element, name))
         else:
-            node = _Element(ET.SubElement(root.xml_element, name, attrib=attributes))
+            node = _Element(get_xml_backend().SubElement(root.xml_element, name, attrib=attributes))
+        self._index_new_child(node, root)
 
         if text:
             self.set_text(node, text)
@@ -245,9 +556,10 @@ class GenericXML(object):
         expect(not self.locked and not self.read_only, "{}: cannot make child {} in file {}".format("read_only" if self.read_only else "locked", text, self.filename))
         root = root if root is not None else self.root
         self.needsrewrite = True
-        et_comment = ET.Comment(text)
+        et_comment = get_xml_backend().Comment(text)
         node = _Element(et_comment)
         root.xml_element.append(node.xml_element)
+        self._index_new_child(node, root)
         return node
 
     def get_children(self, name=None, attributes=None, root=None):
@@ -258,41 +570,19 @@ class GenericXML(object):
         with the key attribute but you don't care what its value is.
         """
         root = root if root is not None else self.root
-        children = []
-        for child in root.xml_element:
-            if name is not None:
-                if child.tag != name:
-                    continue
-
-            if attributes is not None:
-                if child.attrib is None:
-                    continue
-                else:
-                    match = True
-                    for key, value in attributes.items():
-                        if key not in child.attrib:
-                            match = False
-                            break
-                        elif value is not None:
-                            if child.attrib[key] != value:
-                                match = False
-                                break
-
-                    if not match:
-                        continue
-
-            children.append(_Element(child))
-
-        return children
+        return _get_child_index(root.xml_element).lookup(name, attributes)
 
     def get_child(self, name=None, attributes=None, root=None, err_msg=None):
         children = self.get_children(root=root, name=name, attributes=attributes)
-        expect(len(children) == 1, err_msg if err_msg else "Expected one child, found {} with name '{}' and attribs '{}' in file {}".format(len(children), name, attributes, self.filename))
+        # Only build the error message on failure, this is called very frequently
+        if len(children) != 1:
+            expect(False, err_msg if err_msg else "Expected one child, found {} with name '{}' and attribs '{}' in file {}".format(len(children), name, attributes, self.filename))
         return children[0]
 
     def get_optional_child(self, name=None, attributes=None, root=None, err_msg=None):
         children = self.get_children(root=root, name=name, attributes=attributes)
-        expect(len(children) <= 1, err_msg if err_msg else "Multiple matches for name '{}' and attribs '{}' in file {}".format(name, attributes, self.filename))
+        if len(children) > 1:
+            expect(False, err_msg if err_msg else "Multiple matches for name '{}' and attribs '{}' in file {}".format(name, attributes, self.filename))
         return children[0] if children else None
 
     def get_element_text(self, element_name, attributes=None, root=None):
@@ -309,7 +599,7 @@ class GenericXML(object):
         return None
 
     def to_string(self, node, method="xml", encoding="us-ascii"):
-        return ET.tostring(node.xml_element, method=method, encoding=encoding)
+        return get_xml_backend().tostring(node.xml_element, method=method, encoding=encoding)
 
     #
     # API for operations over the entire file
@@ -341,24 +631,45 @@ class GenericXML(object):
 
         logger.debug("write: " + (outfile if isinstance(outfile, six.string_types) else str(outfile)))
 
-        xmlstr = self.get_raw_record()
+        xmlstr = self.get_formatted_record()
 
-        # xmllint provides a better format option for the output file
-        xmllint = find_executable("xmllint")
-        if xmllint is not None:
-            if isinstance(outfile, six.string_types):
-                run_cmd_no_fail("{} --format --output {} -".format(xmllint, outfile), input_str=xmlstr)
+        if isinstance(outfile, six.string_types):
+            # Leave an identical file alone, bumping its mtime would invalidate
+            # the caches of every other process that has read it
+            if not _file_has_content(outfile, xmlstr):
+                with open(outfile, "w") as xmlout:
+                    xmlout.write(xmlstr)
             else:
-                outfile.write(run_cmd_no_fail("{} --format -".format(xmllint), input_str=xmlstr))
-
+                logger.debug("write: {} unchanged".format(outfile))
         else:
-            with open(outfile,'w') as xmlout:
-                xmlout.write(xmlstr)
+            outfile.write(xmlstr.strip())
 
         self._FILEMAP[self.filename] = self.CacheEntry(self.tree, self.root, os.path.getmtime(self.filename))
 
         self.needsrewrite = False
 
+    def get_formatted_record(self, root=None):
+        """
+        Return the document under root formatted for output. The xml backend
+        formats it unless CIME_XML_WRITER=xmllint is set or the backend cannot
+        (the etree backend with a namespaced document), in which case xmllint
+        --format is used if available.
+        """
+        if root is None:
+            root = self.root
+
+        if os.environ.get("CIME_XML_WRITER", "python") != "xmllint":
+            xmlstr = get_xml_backend().format(root.xml_element)
+            if xmlstr is not None:
+                return xmlstr
+
+        xmlstr = self.get_raw_record(root)
+        xmllint = find_executable("xmllint")
+        if xmllint is not None:
+            return run_cmd_no_fail("{} --format -".format(xmllint), input_str=xmlstr) + "\n"
+
+        return xmlstr.decode() if isinstance(xmlstr, bytes) and not six.PY2 else xmlstr
+
     def scan_child(self, nodename, attributes=None, root=None):
         """
         Get an xml element matching nodename with optional attributes.
@@ -383,49 +694,23 @@ class GenericXML(object):
         return nodes[0] if nodes else None
 
     def scan_children(self, nodename, attributes=None, root=None):
-
-        logger.debug("(get_nodes) Input values: {}, {}, {}, {}".format(self.__class__.__name__, nodename, attributes, root))
+        """
+        Return all descendants of root (default self.root), in document order,
+        with tag nodename having all the given attributes. As in get_children,
+        an attribute value of None matches any value.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("(get_nodes) Input values: {}, {}, {}, {}".format(self.__class__.__name__, nodename, attributes, root))
 
         if root is None:
             root = self.root
-        nodes = []
-
-        namespace = {"xi" : "http://www.w3.org/2001/XInclude"}
-
-        xpath = ".//" + (nodename if nodename else "")
 
         if attributes:
-            # xml.etree has limited support for xpath and does not allow more than
-            # one attribute in an xpath query so we query seperately for each attribute
-            # and create a result with the intersection of those lists
-
-            for key, value in attributes.items():
-                if value is None:
-                    xpath = ".//{}[@{}]".format(nodename, key)
-                else:
-                    xpath = ".//{}[@{}=\'{}\']".format(nodename, key, value)
-
-                logger.debug("xpath is {}".format(xpath))
-
-                try:
-                    newnodes = root.xml_element.findall(xpath, namespace)
-                except Exception as e:
-                    expect(False, "Bad xpath search term '{}', error: {}".format(xpath, e))
-
-                if not nodes:
-                    nodes = newnodes
-                else:
-                    for node in nodes[:]:
-                        if node not in newnodes:
-                            nodes.remove(node)
-                if not nodes:
-                    return []
-
+            nodes = get_xml_backend().scan(root.xml_element, nodename, list(attributes.items()), _NAMESPACES)
         else:
+            xpath = ".//" + (nodename if nodename else "")
             logger.debug("xpath: {}".format(xpath))
-            nodes = root.xml_element.findall(xpath, namespace)
-
-        logger.debug("Returning {} nodes ({})".format(len(nodes), nodes))
+            nodes = root.xml_element.findall(xpath, _NAMESPACES)
 
         return [_Element(node) for node in nodes]
 
@@ -451,12 +736,16 @@ class GenericXML(object):
 
         return value if valnodes else None
 
-    def get_resolved_value(self, raw_value, allow_unresolved_envvars=False):
+    def get_resolved_value(self, raw_value, allow_unresolved_envvars=False, record=None):
         """
         A value in the xml file may contain references to other xml
         variables or to environment variables. These are refered to in
         the perl style with $name and $ENV{name}.
 
+        If a ResolveRecord is passed as record, the variables, environment
+        variables and shell commands the value depends on are noted in it,
+        including those reached through the values of referenced variables.
+
         >>> obj = GenericXML()
         >>> os.environ["FOO"] = "BAR"
         >>> os.environ["BAZ"] = "BARF"
@@ -468,12 +757,13 @@ class GenericXML(object):
         '0001-01-01'
         >>> obj.get_resolved_value("$SHELL{echo hi}") == 'hi'
         True
+        >>> record = ResolveRecord(shell_outputs={})
+        >>> obj.get_resolved_value("$ENV{FOO} $SHELL{echo hi} $NOTAVAR", record=record)
+        'BAR hi $NOTAVAR'
+        >>> sorted(record.variables), record.env_vars == {'FOO': 'BAR'}, record.shell_outputs == {'echo hi': 'hi'}
+        (['NOTAVAR'], True, True)
         """
         logger.debug("raw_value {}".format(raw_value))
-        reference_re = re.compile(r'\${?(\w+)}?')
-        env_ref_re   = re.compile(r'\$ENV\{(\w+)\}')
-        shell_ref_re = re.compile(r'\$SHELL\{([^}]+)\}')
-        math_re = re.compile(r'\s[+-/*]\s')
         item_data = raw_value
 
         if item_data is None:
@@ -482,30 +772,50 @@ class GenericXML(object):
         if not isinstance(item_data, six.string_types):
             return item_data
 
-        for m in env_ref_re.finditer(item_data):
+        if record is None:
+            # Called from get_value while resolving a variable for a record
+            record = self._resolve_record
+
+        for m in _ENV_REF_RE.finditer(item_data):
             logger.debug("look for {} in env".format(item_data))
             env_var = m.groups()[0]
             env_var_exists = env_var in os.environ
+            if record is not None:
+                record.env_vars[env_var] = os.environ.get(env_var)
             if not allow_unresolved_envvars:
                 expect(env_var_exists, "Undefined env var '{}'".format(env_var))
             if env_var_exists:
                 item_data = item_data.replace(m.group(), os.environ[env_var])
 
-        for s in shell_ref_re.finditer(item_data):
+        for s in _SHELL_REF_RE.finditer(item_data):
             logger.debug("execute {} in shell".format(item_data))
             shell_cmd = s.groups()[0]
-            item_data = item_data.replace(s.group(), run_cmd_no_fail(shell_cmd))
+            if record is not None and record.shell_outputs is not None:
+                if shell_cmd not in record.shell_outputs:
+                    record.shell_outputs[shell_cmd] = run_cmd_no_fail(shell_cmd)
+                output = record.shell_outputs[shell_cmd]
+            else:
+                output = run_cmd_no_fail(shell_cmd)
+            item_data = item_data.replace(s.group(), output)
 
-        for m in reference_re.finditer(item_data):
+        for m in _REFERENCE_RE.finditer(item_data):
             var = m.groups()[0]
             logger.debug("find: {}".format(var))
-            # The overridden versions of this method do not simply return None
-            # so the pylint should not be flagging this
-            ref = self.get_value(var) # pylint: disable=assignment-from-none
+            if record is not None:
+                record.variables.add(var)
+            # get_value resolves the value it finds, that resolution must
+            # add to the same record
+            saved_record, self._resolve_record = self._resolve_record, record
+            try:
+                # The overridden versions of this method do not simply return None
+                # so the pylint should not be flagging this
+                ref = self.get_value(var) # pylint: disable=assignment-from-none
+            finally:
+                self._resolve_record = saved_record
 
             if ref is not None:
                 logger.debug("resolve: " + str(ref))
-                item_data = item_data.replace(m.group(), self.get_resolved_value(str(ref)))
+                item_data = item_data.replace(m.group(), self.get_resolved_value(str(ref), record=record))
             elif var == "CIMEROOT":
                 cimeroot = get_cime_root()
                 item_data = item_data.replace(m.group(), cimeroot)
@@ -515,7 +825,7 @@ class GenericXML(object):
             elif var == "USER":
                 item_data = item_data.replace(m.group(), getpass.getuser())
 
-        if math_re.search(item_data):
+        if _MATH_RE.search(item_data):
             try:
                 tmp = eval(item_data)
             except Exception:
@@ -526,25 +836,36 @@ class GenericXML(object):
 
     def validate_xml_file(self, filename, schema):
         """
-        validate an XML file against a provided schema file using pylint
+        validate an XML file against a provided schema file
         """
         expect(os.path.isfile(filename),"xml file not found {}".format(filename))
         expect(os.path.isfile(schema),"schema file not found {}".format(schema))
-        xmllint = find_executable("xmllint")
-        if xmllint is not None:
-            logger.debug("Checking file {} against schema {}".format(filename, schema))
-            run_cmd_no_fail("{} --xinclude --noout --schema {} {}".format(xmllint, schema, filename))
-        else:
-            logger.warning("xmllint not found, could not validate file {}".format(filename))
+        deps, root = [], None
+        if filename == self.filename and self.root is not None:
+            deps = self._include_files
+            # Included files are merged differently than XInclude would, let
+            # the validator resolve those itself
+            root = None if deps else self.root.xml_element
+        get_schema_validator().validate(filename, schema, deps=deps, root=root)
+
+    def validate_changes(self):
+        """
+        Validate the in-memory document against the schema this file was read
+        with, so that a batch of changes can be checked before any is written
+        """
+        if self._schema is None or self._include_files or self.get_version() <= 1.0:
+            return
+        get_schema_validator().validate_tree(self.filename, self._schema, self.root.xml_element)
 
     def get_raw_record(self, root=None):
         logger.debug("writing file {}".format(self.filename))
         if root is None:
             root = self.root
+        backend = get_xml_backend()
         try:
-            xmlstr = ET.tostring(root.xml_element)
-        except ET.ParseError as e:
-            ET.dump(root.xml_element)
+            xmlstr = backend.tostring(root.xml_element)
+        except backend.ParseError as e:
+            backend.dump(root.xml_element)
             expect(False, "Could not write file {}, xml formatting error '{}'".format(self.filename, e))
         return xmlstr
 
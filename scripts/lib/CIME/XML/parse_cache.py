@@ -0,0 +1,195 @@
+"""
+Persistent, cross-process cache of parsed xml trees for GenericXML.
+
+GenericXML._FILEMAP only lives as long as one python process, so every
+create_newcase, xmlquery or create_test subprocess re-reads and re-validates
+the same config_*.xml files.  This cache stores the fully resolved document
+(xi:include files already merged) on disk together with the stamp of every
+file that went into it, so a later process can skip include resolution and
+schema validation entirely.
+
+The cache is opt-in.  It is enabled by setting the CIME_XML_CACHE_DIR
+environment variable or the xml_cache_dir option in the [main] section of
+~/.cime/config.  CIME_XML_CACHE_MAX_MB (default 64) bounds the size of the
+cache directory, least recently used entries are evicted first.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.utils import get_cime_config
+from CIME.XML.xml_backend import get_xml_backend
+
+import hashlib, json, tempfile
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".xmlcache"
+_DEFAULT_MAX_MB = 64
+
+def _file_stamp(path):
+    """
+    Return [abspath, mtime, size, sha1] for path
+
+    >>> import tempfile
+    >>> fd, name = tempfile.mkstemp()
+    >>> _ = os.write(fd, b"<a/>")
+    >>> os.close(fd)
+    >>> _file_stamp(name)[2:]
+    [4, 'db9aa86632c6f2cc99684a2dd15d2b64828e7622']
+    >>> os.remove(name)
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with open(path, "rb") as fd:
+        sha = hashlib.sha1(fd.read()).hexdigest()
+    return [path, st.st_mtime, st.st_size, sha]
+
+class ParseCache(object):
+    """
+    On-disk cache of resolved xml trees keyed on the absolute file path and
+    the schema used to validate it.
+
+    >>> import tempfile, shutil
+    >>> cachedir = tempfile.mkdtemp()
+    >>> xmldir = tempfile.mkdtemp()
+    >>> xmlfile = os.path.join(xmldir, "config.xml")
+    >>> with open(xmlfile, "w") as fd:
+    ...     _ = fd.write("<file><entry id='A'/></file>")
+    >>> cache = ParseCache(cachedir)
+    >>> cache.load(xmlfile) is None
+    True
+    >>> cache.store(xmlfile, get_xml_backend().fromstring("<file><entry id='A'/></file>"), [xmlfile])
+    >>> cache.load(xmlfile).tag
+    'file'
+    >>> cache.hits, cache.misses
+    (1, 1)
+    >>> with open(xmlfile, "w") as fd:
+    ...     _ = fd.write("<file><entry id='B'/></file>")
+    >>> cache.load(xmlfile) is None
+    True
+    >>> shutil.rmtree(cachedir); shutil.rmtree(xmldir)
+    """
+
+    def __init__(self, cache_dir, max_bytes=_DEFAULT_MAX_MB*1024*1024):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, infile, schema):
+        key = "{}|{}".format(os.path.abspath(infile), os.path.abspath(schema) if schema else "")
+        return os.path.join(self._cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + _SUFFIX)
+
+    def _is_current(self, stamp):
+        path, mtime, size, sha = stamp
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if st.st_size != size:
+            return False
+        if st.st_mtime == mtime:
+            return True
+        # Touched but possibly not modified (for example by a checkout), fall back to content
+        return _file_stamp(path)[3] == sha
+
+    def load(self, infile, schema=None):
+        """
+        Return the cached root element for infile or None on a miss
+        """
+        entry = self._entry_path(infile, schema)
+        backend = get_xml_backend()
+        try:
+            with open(entry, "rb") as fd:
+                header = json.loads(fd.readline().decode("utf-8"))
+                stamps = header["deps"] + ([header["schema"]] if header["schema"] else [])
+                if all(self._is_current(stamp) for stamp in stamps):
+                    root = backend.fromstring(fd.read())
+                    os.utime(entry, None)
+                    self.hits += 1
+                    logger.debug("xml parse cache hit: {}".format(infile))
+                    return root
+        except (IOError, OSError, ValueError, KeyError, backend.ParseError) as e:
+            logger.debug("xml parse cache unusable entry for {}: {}".format(infile, e))
+
+        self.misses += 1
+        logger.debug("xml parse cache miss: {}".format(infile))
+        return None
+
+    def store(self, infile, root, deps, schema=None):
+        """
+        Store the resolved tree under root for infile. deps is the list of
+        files (infile and any included files) the tree was built from.
+        """
+        try:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            header = {"deps"   : [_file_stamp(dep) for dep in deps],
+                      "schema" : _file_stamp(schema) if schema else None}
+            fd, tmpfile = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmpfd:
+                tmpfd.write(json.dumps(header).encode("utf-8") + b"\n")
+                tmpfd.write(get_xml_backend().tostring(root))
+            os.rename(tmpfile, self._entry_path(infile, schema))
+        except (IOError, OSError) as e:
+            logger.debug("Could not store {} in xml parse cache: {}".format(infile, e))
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits within max_bytes
+        """
+        entries = []
+        total = 0
+        for item in os.listdir(self._cache_dir):
+            if item.endswith(_SUFFIX):
+                path = os.path.join(self._cache_dir, item)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.debug("xml parse cache evicted {}".format(path))
+            except OSError:
+                pass
+
+    def clear(self):
+        if os.path.isdir(self._cache_dir):
+            for item in os.listdir(self._cache_dir):
+                if item.endswith(_SUFFIX):
+                    os.remove(os.path.join(self._cache_dir, item))
+
+_PARSE_CACHE = None
+def get_parse_cache():
+    """
+    Return the process wide ParseCache, or None if the cache is not enabled
+    """
+    global _PARSE_CACHE
+    if _PARSE_CACHE is None:
+        cache_dir = os.environ.get("CIME_XML_CACHE_DIR")
+        if not cache_dir:
+            cime_config = get_cime_config()
+            if cime_config.has_option("main", "XML_CACHE_DIR"):
+                cache_dir = cime_config.get("main", "XML_CACHE_DIR")
+        if not cache_dir:
+            return None
+
+        max_mb = int(os.environ.get("CIME_XML_CACHE_MAX_MB", _DEFAULT_MAX_MB))
+        _PARSE_CACHE = ParseCache(os.path.abspath(os.path.expanduser(cache_dir)), max_bytes=max_mb*1024*1024)
+
+    return _PARSE_CACHE
+
+def reset_parse_cache():
+    """
+    Useful to keep unit tests from interfering with each other
+    """
+    global _PARSE_CACHE
+    _PARSE_CACHE = None
@@ -0,0 +1,197 @@
+"""
+Schema validation for GenericXML.validate_xml_file.
+
+When lxml is importable each .xsd is compiled once per process, held in a
+small LRU keyed by schema path and mtime, and the already-parsed tree is
+validated in memory, without a copy when it was built by the lxml xml
+backend.  Otherwise validation falls back to running
+`xmllint --xinclude --noout --schema`, one process per file; only the
+stamps below save work then.
+
+Every successful validation leaves a stamp recording the (mtime, size) of the
+validated file, its included files and the schema.  A later process finding a
+matching stamp skips validation entirely.  Stamps live in CIME_XML_STAMP_DIR,
+by default ~/.cime/xml_stamps.  Each case adds stamps for its env_*.xml
+files, so only the _MAX_STAMPS most recently used are kept.
+"""
+from CIME.XML.standard_module_setup import *
+
+from CIME.XML.xml_backend import get_xml_backend
+
+#pylint: disable=import-error
+from distutils.spawn import find_executable
+from collections import OrderedDict
+import hashlib, tempfile
+
+logger = logging.getLogger(__name__)
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+_MAX_COMPILED_SCHEMAS = 16
+_MAX_STAMPS = 4096
+
+def _stamp(paths):
+    """
+    Return a string identifying the current state of all paths
+
+    >>> _stamp([]) == ""
+    True
+    """
+    items = []
+    for path in paths:
+        st = os.stat(path)
+        items.append("{} {!r} {}".format(os.path.abspath(path), st.st_mtime, st.st_size))
+    return "\n".join(items)
+
+class SchemaValidator(object):
+
+    def __init__(self, stamp_dir=None, max_stamps=_MAX_STAMPS):
+        self._stamp_dir = stamp_dir
+        self._max_stamps = max_stamps
+        self._compiled = OrderedDict()
+        self.validated = 0
+        self.skipped = 0
+
+    def _stamp_path(self, filename, schema):
+        key = "{}|{}".format(os.path.abspath(filename), os.path.abspath(schema))
+        return os.path.join(self._stamp_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _has_stamp(self, filename, schema, stamp):
+        if self._stamp_dir is None:
+            return False
+        stamp_path = self._stamp_path(filename, schema)
+        try:
+            with open(stamp_path, "r") as fd:
+                if fd.read() != stamp:
+                    return False
+            os.utime(stamp_path, None)
+            return True
+        except (IOError, OSError):
+            return False
+
+    def _write_stamp(self, filename, schema, stamp):
+        if self._stamp_dir is None:
+            return
+        try:
+            if not os.path.isdir(self._stamp_dir):
+                os.makedirs(self._stamp_dir)
+            stamp_path = self._stamp_path(filename, schema)
+            is_new = not os.path.exists(stamp_path)
+            fd, tmpfile = tempfile.mkstemp(dir=self._stamp_dir)
+            with os.fdopen(fd, "w") as tmpfd:
+                tmpfd.write(stamp)
+            os.rename(tmpfile, stamp_path)
+        except (IOError, OSError) as e:
+            logger.debug("Could not write validation stamp for {}: {}".format(filename, e))
+            return
+
+        if is_new:
+            self.prune()
+
+    def prune(self):
+        """
+        Remove least recently used stamps until at most max_stamps are left
+        """
+        entries = []
+        for item in os.listdir(self._stamp_dir):
+            path = os.path.join(self._stamp_dir, item)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+
+        for _, path in sorted(entries)[:max(len(entries) - self._max_stamps, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _get_compiled_schema(self, schema):
+        key = (os.path.abspath(schema), os.path.getmtime(schema))
+        if key in self._compiled:
+            compiled = self._compiled.pop(key)
+        else:
+            logger.debug("Compiling schema {}".format(schema))
+            compiled = lxml_etree.XMLSchema(lxml_etree.parse(schema))
+        # Most recently used entries live at the end
+        self._compiled[key] = compiled
+        while len(self._compiled) > _MAX_COMPILED_SCHEMAS:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def _validate_lxml(self, filename, schema, root):
+        compiled = self._get_compiled_schema(schema)
+        if root is not None:
+            doc = root if get_xml_backend().name == "lxml" else lxml_etree.fromstring(get_xml_backend().tostring(root))
+        else:
+            doc = lxml_etree.parse(filename)
+            doc.xinclude()
+        if not compiled.validate(doc):
+            # Report errors the way xmllint does
+            errors = ["{}:{}: Schemas validity error : {}".format(filename, error.line, error.message)
+                      for error in compiled.error_log]
+            expect(False, "{}\n{} fails to validate".format("\n".join(errors), filename))
+
+    def validate(self, filename, schema, deps=None, root=None):
+        """
+        Validate filename against schema. deps lists any files included by
+        filename, root is the already parsed, include-resolved tree if available.
+        """
+        stamp = _stamp([filename] + (deps if deps else []) + [schema])
+        if self._has_stamp(filename, schema, stamp):
+            logger.debug("File {} already validated against schema {}".format(filename, schema))
+            self.skipped += 1
+            return
+
+        if lxml_etree is not None:
+            logger.debug("Checking file {} against schema {} in memory".format(filename, schema))
+            self._validate_lxml(filename, schema, root)
+        else:
+            xmllint = find_executable("xmllint")
+            if xmllint is None:
+                logger.warning("xmllint not found, could not validate file {}".format(filename))
+                return
+            logger.debug("Checking file {} against schema {}".format(filename, schema))
+            run_cmd_no_fail("{} --xinclude --noout --schema {} {}".format(xmllint, schema, filename))
+
+        self.validated += 1
+        self._write_stamp(filename, schema, stamp)
+
+    def validate_tree(self, filename, schema, root):
+        """
+        Validate the in-memory tree root, which will be written to filename,
+        against schema.  No stamp is used or left, the tree has not been
+        written yet.
+        """
+        if lxml_etree is not None:
+            logger.debug("Checking changes to {} against schema {} in memory".format(filename, schema))
+            self._validate_lxml(filename, schema, root)
+        else:
+            xmllint = find_executable("xmllint")
+            if xmllint is None:
+                logger.warning("xmllint not found, could not validate changes to {}".format(filename))
+                return
+            logger.debug("Checking changes to {} against schema {}".format(filename, schema))
+            stat, _, errput = run_cmd("{} --noout --schema {} -".format(xmllint, schema), input_str=get_xml_backend().tostring(root))
+            expect(stat == 0, "{}\n{} fails to validate".format(errput, filename))
+
+        self.validated += 1
+
+_SCHEMA_VALIDATOR = None
+def get_schema_validator():
+    global _SCHEMA_VALIDATOR
+    if _SCHEMA_VALIDATOR is None:
+        stamp_dir = os.environ.get("CIME_XML_STAMP_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cime", "xml_stamps"))
+        _SCHEMA_VALIDATOR = SchemaValidator(stamp_dir if stamp_dir else None)
+    return _SCHEMA_VALIDATOR
+
+def reset_schema_validator():
+    """
+    Useful to keep unit tests from interfering with each other
+    """
+    global _SCHEMA_VALIDATOR
+    _SCHEMA_VALIDATOR = None
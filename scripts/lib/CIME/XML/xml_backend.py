@@ -0,0 +1,191 @@
+"""
+The ElementTree implementation behind GenericXML.
+
+Two backends provide the same small set of operations on elements:
+
+  etree  the standard library xml.etree.ElementTree, the reference backend
+  lxml   lxml.etree, which runs multi-attribute queries as compiled XPath and
+         pretty prints with libxml2 itself rather than in python
+
+The backend is chosen by the CIME_XML_BACKEND environment variable or the
+XML_BACKEND option in the [main] section of ~/.cime/config.  By default lxml
+is used when it is importable.
+
+Elements are plain ElementTree elements with the etree backend.  With lxml
+they are instances of _LxmlElement so that GenericXML can keep its child
+indexes in weak dictionaries, and an element has at most one parent: adding
+an element that already has a parent adds a copy, where ElementTree would
+share the element between both parents.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.utils import get_cime_config
+from CIME.XML.xml_writer import format_xml, can_format
+
+import xml.etree.ElementTree as ET
+import six
+
+logger = logging.getLogger(__name__)
+
+#pylint: disable=import-error
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+BACKENDS = ("etree", "lxml")
+
+class _EtreeBackend(object):
+    """
+    xml.etree.ElementTree, elements may be shared between parents and have
+    no parent pointer
+    """
+    name = "etree"
+    ParseError = ET.ParseError
+    Comment = ET.Comment
+    Element = ET.Element
+    SubElement = ET.SubElement
+    ElementTree = ET.ElementTree
+    dump = ET.dump
+
+    def parse(self, fd):
+        return ET.parse(fd)
+
+    def fromstring(self, text):
+        return ET.fromstring(text)
+
+    def tostring(self, elem, method="xml", encoding="us-ascii"):
+        return ET.tostring(elem, method=method, encoding=encoding)
+
+    def get_parent(self, elem): # pylint: disable=unused-argument
+        """
+        The parent of elem, ElementTree does not track it
+        """
+        return None
+
+    def scan(self, root, tag, predicates, namespaces):
+        """
+        Return the descendants of root with tag (any if None) having every
+        attribute in predicates, a list of (name, value) where a value of
+        None matches any value
+        """
+        if tag and ":" in tag:
+            prefix, local = tag.split(":", 1)
+            expect(prefix in namespaces, "Bad search term '{}', unknown namespace prefix".format(tag))
+            tag = "{{{}}}{}".format(namespaces[prefix], local)
+
+        # Check every predicate in a single walk of the subtree rather than
+        # intersecting one xpath query per attribute
+        nodes = []
+        for node in root.iter(tag if tag else None):
+            get = node.get
+            for key, value in predicates:
+                found = get(key)
+                if found is None or (value is not None and found != value):
+                    break
+            else:
+                nodes.append(node)
+
+        # iter includes root itself, which comes first
+        if nodes and nodes[0] is root:
+            nodes.pop(0)
+        return nodes
+
+    def format(self, elem):
+        """
+        Return the document rooted at elem formatted like xmllint --format,
+        or None if that is left to xmllint
+        """
+        return format_xml(elem) if can_format(elem) else None
+
+if lxml_etree is not None:
+    class _LxmlElement(lxml_etree.ElementBase):
+        """
+        Unlike lxml's own element class this one can be weakly referenced
+        """
+else:
+    _LxmlElement = None
+
+class _LxmlBackend(object):
+    """
+    lxml.etree, parsed like ElementTree parses: comments and processing
+    instructions are dropped
+    """
+    name = "lxml"
+
+    def __init__(self):
+        lookup = lxml_etree.ElementDefaultClassLookup(element=_LxmlElement)
+        self._parser = lxml_etree.XMLParser(remove_comments=True, remove_pis=True)
+        self._parser.set_element_class_lookup(lookup)
+        # Reading with blanks removed lets libxml2 choose the indentation,
+        # exactly as xmllint --format does
+        self._format_parser = lxml_etree.XMLParser(remove_blank_text=True)
+        self._xpaths = {}
+        self.ParseError = lxml_etree.ParseError
+        self.Comment = lxml_etree.Comment
+        self.SubElement = lxml_etree.SubElement
+        self.ElementTree = lxml_etree.ElementTree
+        self.dump = lxml_etree.dump
+
+    def Element(self, tag, attrib=None): # pylint: disable=invalid-name
+        return self._parser.makeelement(tag, attrib if attrib is not None else {})
+
+    def parse(self, fd):
+        return lxml_etree.parse(fd, self._parser)
+
+    def fromstring(self, text):
+        return lxml_etree.fromstring(text, self._parser)
+
+    def tostring(self, elem, method="xml", encoding="us-ascii"):
+        return lxml_etree.tostring(elem, method=method, encoding=encoding, xml_declaration=False)
+
+    def get_parent(self, elem):
+        return elem.getparent()
+
+    def scan(self, root, tag, predicates, namespaces):
+        # Compile each query shape once, values are passed as xpath variables
+        # so they need no quoting
+        key = (tag, tuple((name, value is None) for name, value in predicates))
+        xpath = self._xpaths.get(key)
+        if xpath is None:
+            path = "descendant::" + (tag if tag else "*")
+            for idx, (name, value) in enumerate(predicates):
+                path += "[@{}]".format(name) if value is None else "[@{}=$v{:d}]".format(name, idx)
+            xpath = lxml_etree.XPath(path, namespaces=namespaces)
+            self._xpaths[key] = xpath
+        return xpath(root, **dict(("v{:d}".format(idx), value)
+                                  for idx, (_, value) in enumerate(predicates) if value is not None))
+
+    def format(self, elem):
+        doc = lxml_etree.fromstring(lxml_etree.tostring(elem), self._format_parser)
+        # ElementTree does not keep unused namespace declarations either
+        lxml_etree.cleanup_namespaces(doc)
+        xmlstr = lxml_etree.tostring(doc, pretty_print=True, encoding="us-ascii", xml_declaration=False)
+        return '<?xml version="1.0"?>\n' + (xmlstr if six.PY2 else xmlstr.decode())
+
+_XML_BACKEND = None
+def get_xml_backend():
+    global _XML_BACKEND
+    if _XML_BACKEND is None:
+        name = os.environ.get("CIME_XML_BACKEND")
+        if not name:
+            cime_config = get_cime_config()
+            if cime_config.has_option("main", "XML_BACKEND"):
+                name = cime_config.get("main", "XML_BACKEND")
+        expect(name in BACKENDS or not name,
+               "Unknown xml backend '{}', expected one of {}".format(name, ", ".join(BACKENDS)))
+        if name == "lxml" and lxml_etree is None:
+            logger.warning("xml backend lxml requested but lxml is not importable, using etree")
+        if name != "etree" and lxml_etree is not None:
+            _XML_BACKEND = _LxmlBackend()
+        else:
+            _XML_BACKEND = _EtreeBackend()
+        logger.debug("Using xml backend {}".format(_XML_BACKEND.name))
+    return _XML_BACKEND
+
+def reset_xml_backend():
+    """
+    Select the backend again, trees built with the previous backend must
+    not be used afterwards
+    """
+    global _XML_BACKEND
+    _XML_BACKEND = None
@@ -0,0 +1,135 @@
+"""
+In-process pretty printer for GenericXML.write.
+
+format_xml reproduces the output of `xmllint --format` byte for byte for
+the documents CIME writes, so env and config files look the same whether or
+not xmllint was used to write them.  Whitespace-only text is dropped with the
+same rules libxml2 applies when parsing without blanks, and elements with
+mixed content are written unindented just as libxml2 does.
+"""
+from CIME.XML.standard_module_setup import *
+
+import xml.etree.ElementTree as ET
+import six
+
+logger = logging.getLogger(__name__)
+
+_INDENT = "  "
+_BLANKS = " \t\n\r"
+
+def _escape(text, table):
+    out = []
+    for char in text:
+        if char in table:
+            out.append(table[char])
+        elif ord(char) > 127:
+            out.append("&#x{:X};".format(ord(char)))
+        else:
+            out.append(char)
+    return "".join(out)
+
+_TEXT_ESCAPES = {"<" : "&lt;", ">" : "&gt;", "&" : "&amp;"}
+_ATTRIB_ESCAPES = {"<" : "&lt;", ">" : "&gt;", "&" : "&amp;", '"' : "&quot;",
+                   "\n" : "&#10;", "\r" : "&#13;", "\t" : "&#9;"}
+
+def _is_blank(text):
+    return not text.strip(_BLANKS)
+
+def _content(elem):
+    """
+    Return the children of elem as libxml2 would hold them after a parse
+    without blanks: a list of strings (text) and elements.
+    """
+    nodes = []
+
+    def add_text(text, at_end):
+        if not text:
+            return
+        if _is_blank(text):
+            if not nodes:
+                # Whitespace is only kept in an otherwise empty element
+                if not at_end:
+                    return
+            elif not (isinstance(nodes[-1], six.string_types) or isinstance(nodes[0], six.string_types)):
+                return
+        if nodes and isinstance(nodes[-1], six.string_types):
+            nodes[-1] += text
+        else:
+            nodes.append(text)
+
+    children = list(elem)
+    add_text(elem.text, not children)
+    for idx, child in enumerate(children):
+        nodes.append(child)
+        add_text(child.tail, idx == len(children) - 1)
+
+    return nodes
+
+def _dump(elem, level, do_format, out):
+    if elem.tag is ET.Comment:
+        out.append("<!--{}-->".format(elem.text))
+        return
+
+    out.append("<" + elem.tag)
+    for key, value in elem.attrib.items():
+        out.append(' {}="{}"'.format(key, _escape(value, _ATTRIB_ESCAPES)))
+
+    nodes = _content(elem)
+    if not nodes:
+        out.append("/>")
+        return
+
+    out.append(">")
+    do_format = do_format and not any(isinstance(node, six.string_types) for node in nodes)
+    if do_format:
+        out.append("\n")
+    for node in nodes:
+        if do_format:
+            out.append(_INDENT * (level + 1))
+        if isinstance(node, six.string_types):
+            # A raw carriage return in text does not survive xmllint's parse
+            out.append(_escape(node.replace("\r\n", "\n").replace("\r", "\n"), _TEXT_ESCAPES))
+        else:
+            _dump(node, level + 1, do_format, out)
+        if do_format:
+            out.append("\n")
+    if do_format:
+        out.append(_INDENT * level)
+    out.append("</{}>".format(elem.tag))
+
+def can_format(elem):
+    """
+    Namespaced documents need prefix bookkeeping that is left to xmllint
+
+    >>> can_format(ET.fromstring('<a><b c="d"/></a>'))
+    True
+    >>> can_format(ET.fromstring('<a xmlns:xi="http://www.w3.org/2001/XInclude"><xi:include/></a>'))
+    False
+    """
+    for node in elem.iter():
+        if node.tag is ET.Comment:
+            continue
+        if not isinstance(node.tag, six.string_types) or node.tag.startswith("{") or \
+           any(key.startswith("{") for key in node.attrib):
+            return False
+    return True
+
+def format_xml(elem):
+    """
+    Return the document rooted at elem formatted like `xmllint --format`
+
+    >>> print(format_xml(ET.fromstring('<a x="1"><b>text</b><c> <d/> </c><e>mixed <f> <g/> </f></e><h/></a>')).strip())
+    <?xml version="1.0"?>
+    <a x="1">
+      <b>text</b>
+      <c>
+        <d/>
+      </c>
+      <e>mixed <f><g/></f></e>
+      <h/>
+    </a>
+    """
+    out = ['<?xml version="1.0"?>\n']
+    _dump(elem, 0, True, out)
+    out.append("\n")
+    return "".join(out)
@@ -0,0 +1,219 @@
+"""
+Short term archiver file operations that are done after the next run
+segment has been submitted.
+
+With DOUT_S_ARCHIVE_BEHIND, st_archive copies everything the next run
+segment needs or may still write to (the last restart set, rpointer files
+and the history files needed to restart) right away, and only records the
+moves of the remaining closed files in an ArchiveManifest. The manifest is
+committed to DOUT_S_ROOT, the case is resubmitted, and the moves are then
+done while the next segment runs.
+
+A manifest goes through these states, each a file in MANIFEST_DIR:
+
+  <name>.pending               committed, nothing claimed it yet
+  <name>.running.<host>.<pid>  being run, its mtime is a heartbeat
+
+A manifest is claimed by renaming it, which only one process can do, and
+removed once all its operations are done. Each operation can be redone
+safely: a move or compression whose source is gone and target exists is
+skipped, and an interrupted move across file systems or compression
+leaves its source in place. So a
+pending manifest, or a running one whose heartbeat stopped, is simply run
+again by the next st_archive.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.file_transfer import FileTransfer, DEFAULT_TRANSFER_THREADS
+
+import itertools, json, socket, tempfile, threading, time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = ".st_archive_manifests"
+
+_PENDING = ".pending"
+_RUNNING = ".running."
+_HEARTBEAT_SEC = 60
+_STALE_SEC = 600
+
+_commit_count = itertools.count()
+
+def _get_manifest_dir(dout_s_root):
+    return os.path.join(dout_s_root, MANIFEST_DIR)
+
+class ArchiveManifest(object):
+    """
+    Records moves and copies, with the interface of FileTransfer, so they
+    can be committed and done later
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> manifest = ArchiveManifest()
+    >>> manifest.commit(tmpdir) is None
+    True
+    >>> manifest.move("/run/case.cam.h0.0001-01.nc", "/archive/atm/hist/case.cam.h0.0001-01.nc")
+    >>> os.path.basename(manifest.commit(tmpdir)).endswith(".pending")
+    True
+    >>> sorted(get_claimed_files(tmpdir))
+    ['/run/case.cam.h0.0001-01.nc']
+    >>> shutil.rmtree(tmpdir)
+    """
+
+    def __init__(self):
+        self._entries = []
+
+    def move(self, src_path, tgt_path):
+        self._entries.append(("move", src_path, tgt_path))
+
+    def copy(self, src_path, tgt_path):
+        self._entries.append(("copy", src_path, tgt_path))
+
+    def compress(self, src_path, tgt_path, method, keep_source=False):
+        self._entries.append(("compress", src_path, tgt_path, method, keep_source))
+
+    def commit(self, dout_s_root):
+        """
+        Write the manifest to dout_s_root, atomically, and return its path,
+        or None if nothing was recorded
+        """
+        if not self._entries:
+            return None
+
+        manifest_dir = _get_manifest_dir(dout_s_root)
+        if not os.path.isdir(manifest_dir):
+            os.makedirs(manifest_dir)
+
+        fd, tmp_path = tempfile.mkstemp(dir=manifest_dir, prefix=".tmp")
+        with os.fdopen(fd, "w") as tmp_fd:
+            json.dump(self._entries, tmp_fd)
+            tmp_fd.flush()
+            os.fsync(tmp_fd.fileno())
+
+        name = "{}.{}.{:d}.{:04d}".format(time.strftime("%Y%m%d-%H%M%S"), socket.gethostname().split(".")[0],
+                                          os.getpid(), next(_commit_count))
+        path = os.path.join(manifest_dir, name + _PENDING)
+        os.rename(tmp_path, path)
+        logger.info("Committed {:d} archive operations to {}".format(len(self._entries), path))
+        self._entries = []
+        return path
+
+def _list_manifests(dout_s_root):
+    manifest_dir = _get_manifest_dir(dout_s_root)
+    if not os.path.isdir(manifest_dir):
+        return []
+    return [os.path.join(manifest_dir, item) for item in sorted(os.listdir(manifest_dir))
+            if item.endswith(_PENDING) or _RUNNING in item]
+
+def _is_live(path):
+    """
+    True if path is claimed by a process that is still running it
+    """
+    if _RUNNING not in os.path.basename(path):
+        return False
+    try:
+        return time.time() - os.path.getmtime(path) < _STALE_SEC
+    except OSError:
+        return False
+
+def _read_entries(path):
+    with open(path, "r") as fd:
+        return json.load(fd)
+
+def get_claimed_files(dout_s_root):
+    """
+    Returns the set of source paths of all manifests that are not done yet
+    """
+    claimed = set()
+    for path in _list_manifests(dout_s_root):
+        try:
+            claimed.update(entry[1] for entry in _read_entries(path))
+        except (IOError, OSError, ValueError):
+            # claimed and finished since it was listed
+            continue
+    return claimed
+
+def _heartbeat(path, stop):
+    while not stop.wait(_HEARTBEAT_SEC):
+        try:
+            os.utime(path, None)
+        except OSError:
+            return
+
+def _run_manifest(path, transfer_threads):
+    """
+    Claim the manifest at path and do its operations. Returns False if
+    another process claimed it first.
+    """
+    name = os.path.basename(path)
+    name = name[:-len(_PENDING)] if name.endswith(_PENDING) else name[:name.index(_RUNNING)]
+    running_path = os.path.join(os.path.dirname(path), "{}{}{}.{:d}".format(
+        name, _RUNNING, socket.gethostname().split(".")[0], os.getpid()))
+    try:
+        os.rename(path, running_path)
+    except OSError:
+        return False
+    os.utime(running_path, None)
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(running_path, stop))
+    heartbeat.daemon = True
+    heartbeat.start()
+    try:
+        entries = _read_entries(running_path)
+        logger.info("Running {:d} archive operations from {}".format(len(entries), running_path))
+        with FileTransfer(num_threads=transfer_threads) as transfer:
+            for entry in entries:
+                op, src_path, tgt_path = entry[:3]
+                if os.path.exists(src_path):
+                    tgt_dir = os.path.dirname(tgt_path)
+                    if not os.path.isdir(tgt_dir):
+                        os.makedirs(tgt_dir)
+                    getattr(transfer, op)(src_path, tgt_path, *entry[3:])
+                elif op != "copy" and os.path.exists(tgt_path):
+                    logger.debug("{} was already archived to {}".format(src_path, tgt_path))
+                else:
+                    logger.warning("Cannot archive {}, it does not exist".format(src_path))
+    except BaseException:
+        # Hand it over to the next st_archive right away
+        os.rename(running_path, os.path.join(os.path.dirname(running_path), name + _PENDING))
+        raise
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    os.remove(running_path)
+    return True
+
+def run_manifests(dout_s_root, transfer_threads=DEFAULT_TRANSFER_THREADS):
+    """
+    Run all committed manifests in dout_s_root that no live process is
+    running, oldest first. Returns the number of manifests run.
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> for name in ["run", "archive"]:
+    ...     os.mkdir(os.path.join(tmpdir, name))
+    >>> for name in ["a.log.1.gz", "b.log.1.gz"]:
+    ...     open(os.path.join(tmpdir, "run", name), "w").close()
+    >>> manifest = ArchiveManifest()
+    >>> manifest.move(os.path.join(tmpdir, "run", "a.log.1.gz"), os.path.join(tmpdir, "archive", "logs", "a.log.1.gz"))
+    >>> manifest.move(os.path.join(tmpdir, "run", "b.log.1.gz"), os.path.join(tmpdir, "archive", "logs", "b.log.1.gz"))
+    >>> _ = manifest.commit(tmpdir)
+    >>> os.mkdir(os.path.join(tmpdir, "archive", "logs"))
+    >>> os.rename(os.path.join(tmpdir, "run", "a.log.1.gz"), os.path.join(tmpdir, "archive", "logs", "a.log.1.gz")) # as if moved before a crash
+    >>> run_manifests(tmpdir)
+    1
+    >>> os.listdir(os.path.join(tmpdir, "run")), sorted(os.listdir(os.path.join(tmpdir, "archive", "logs")))
+    ([], ['a.log.1.gz', 'b.log.1.gz'])
+    >>> os.listdir(os.path.join(tmpdir, MANIFEST_DIR))
+    []
+    >>> shutil.rmtree(tmpdir)
+    """
+    num_run = 0
+    for path in _list_manifests(dout_s_root):
+        if _is_live(path):
+            logger.info("Archive manifest {} is being run by another process".format(path))
+        elif _run_manifest(path, transfer_threads):
+            num_run += 1
+
+    return num_run
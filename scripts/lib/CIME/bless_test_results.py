@@ -78,14 +78,16 @@ def bless_test_results(baseline_name, baseline_root, test_root, compiler, test_i
     most_recent = sorted(timestamps)[-1]
     logger.info("Matched test batch is {}".format(most_recent))
 
-    broken_blesses = []
+    recent_test_status_files = []
     for test_status_file in test_status_files:
         if not most_recent in test_status_file:
             logger.info("Skipping {}".format(test_status_file))
-            continue
+        else:
+            recent_test_status_files.append(test_status_file)
 
+    broken_blesses = []
+    for test_status_file, ts in zip(recent_test_status_files, load_test_statuses(recent_test_status_files)):
         test_dir = os.path.dirname(test_status_file)
-        ts = TestStatus(test_dir=test_dir)
         test_name = ts.get_name()
         if test_name is None:
             case_dir = os.path.basename(test_dir)
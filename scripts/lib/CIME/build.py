@@ -1,11 +1,12 @@
 """
 functions for building CIME models
 """
-import glob, shutil, time, threading, subprocess, imp
+import glob, shutil, time, threading, subprocess, imp, errno, fcntl
 from CIME.XML.standard_module_setup  import *
 from CIME.utils                 import get_model, analyze_build_log, stringify_bool, run_and_log_case_status, get_timestamp, run_sub_or_cmd, run_cmd, get_batch_script_for_job, gzip_existing_file, safe_copy
 from CIME.provenance            import save_build_provenance as save_build_provenance_sub
 from CIME.locked_files          import lock_file, unlock_file
+from CIME.build_cache           import get_build_cache, hash_inputs, has_files
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,10 @@ _CMD_ARGS_FOR_BUILD = \
      "CAM_CONFIG_OPTS", "COMP_LND", "COMPARE_TO_NUOPC", "HOMME_TARGET",
      "OCN_SUBMODEL", "CISM_USE_TRILINOS", "USE_TRILINOS", "USE_ALBANY", "USE_PETSC")
 
+# The _CMD_ARGS_FOR_BUILD that are paths, so differ in every case
+_CMD_ARGS_FOR_BUILD_PATHS = \
+    ("CASEROOT", "CASETOOLS", "CIMEROOT", "EXEROOT", "INCROOT", "LIBROOT", "SHAREDLIBROOT")
+
 def get_standard_makefile_args(case, shared_lib=False):
     make_args = "CIME_MODEL={} ".format(case.get_value("MODEL"))
     make_args += " compile_threaded={} ".format(stringify_bool(case.get_build_threaded()))
@@ -27,6 +32,22 @@ def get_standard_makefile_args(case, shared_lib=False):
 
     return make_args
 
+def get_build_cache_values(case, shared_lib=False):
+    """
+    Return the settings in get_standard_makefile_args that are not paths, to
+    key cached builds on
+    """
+    values = {"MODEL" : case.get_value("MODEL"),
+              "GMAKE" : case.get_value("GMAKE"),
+              "compile_threaded" : case.get_build_threaded()}
+    if not shared_lib:
+        values["USE_KOKKOS"] = uses_kokkos(case)
+    for var in _CMD_ARGS_FOR_BUILD:
+        if var not in _CMD_ARGS_FOR_BUILD_PATHS:
+            values[var] = case.get_value(var)
+
+    return values
+
 def get_standard_cmake_args(case, sharedpath, shared_lib=False):
     cmake_args = "-DCIME_MODEL={} ".format(case.get_value("MODEL"))
     cmake_args += " -Dcompile_threaded={} ".format(stringify_bool(case.get_build_threaded()))
@@ -309,10 +330,95 @@ ERROR env_build HAS CHANGED
 
     return sharedpath
 
+###############################################################################
+def _get_sharedlib_cache_key(case, libs):
+###############################################################################
+    """
+    Hash the sources, Macros and settings the shared libraries in libs are
+    built from. Paths to sources are part of the key, build trees refer to
+    them.
+    """
+    cimeroot = case.get_value("CIMEROOT")
+    srcroot = case.get_value("SRCROOT")
+    caseroot = case.get_value("CASEROOT")
+    values = get_build_cache_values(case, shared_lib=True)
+    values.update({"libs" : libs, "USE_KOKKOS" : uses_kokkos(case), "MULTI_DRIVER" : case.get_value("MULTI_DRIVER"),
+                   "COMP_OCN" : case.get_value("COMP_OCN")})
+    paths = [os.path.join(cimeroot, "src", "share"),
+             os.path.join(cimeroot, "src", "externals"),
+             os.path.join(cimeroot, "src", "build_scripts"),
+             os.path.join(cimeroot, "src", "drivers", "mct", "shr")]
+    if os.path.abspath(srcroot) != os.path.abspath(cimeroot):
+        paths.append(os.path.join(srcroot, "externals"))
+
+    case_paths = [os.path.join(caseroot, "Macros.make"),
+                  os.path.join(caseroot, "Macros.cmake"),
+                  os.path.join(caseroot, "env_mach_specific.xml")]
+
+    return hash_inputs(values, paths, case_paths)
+
+# Left in a shared library directory filled from the build cache
+_SHAREDLIB_CACHE_KEY_FILE = ".build_cache_key"
+
+###############################################################################
+def _read_cache_key(key_file):
+###############################################################################
+    if not os.path.isfile(key_file):
+        return None
+    with open(key_file, "r") as fd:
+        return fd.read().strip()
+
+###############################################################################
+def _is_sharedlib_install_output(relpath):
+###############################################################################
+    """
+    True for the files the shared libraries install under EXEROOT/SHAREDPATH
+    that hold no absolute paths: the lib and include directories of the
+    libraries, and of csm_share under COMP_INTERFACE/ESMFDIR/NINST_VALUE.
+    Build directories, when SHAREDLIBROOT is EXEROOT, and kokkos' cmake and
+    make configs are left out.
+
+    >>> _is_sharedlib_install_output(os.path.join("lib", "libgptl.a"))
+    True
+    >>> _is_sharedlib_install_output(os.path.join("mct", "noesmf", "1", "include", "shr_kind_mod.mod"))
+    True
+    >>> _is_sharedlib_install_output(os.path.join("mct", "noesmf", "1", "csm_share", "Depends"))
+    False
+    >>> _is_sharedlib_install_output(os.path.join("pio", "CMakeCache.txt"))
+    False
+    >>> _is_sharedlib_install_output(os.path.join("lib", "cmake", "Kokkos", "KokkosConfig.cmake"))
+    False
+    """
+    parts = relpath.split(os.sep)
+    return len(parts) in (2, 5) and parts[-2] in ("lib", "include")
+
+###############################################################################
+def _lock_cprnc_dir(full_lib_path):
+###############################################################################
+    """
+    Create the cprnc directory shared by every case with this SHAREDLIBROOT
+    and compiler, and return an open file holding an exclusive lock on it.
+    Builds starting at the same time wait here while the one holding the
+    lock builds cprnc; the lock goes away with its process if it dies.
+    """
+    try:
+        os.makedirs(full_lib_path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    lock_fd = open(os.path.join(full_lib_path, ".cprnc.lock"), "w")
+    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+    return lock_fd
+
 ###############################################################################
 def _build_libraries(case, exeroot, sharedpath, caseroot, cimeroot, libroot, lid, compiler, buildlist, comp_interface):
 ###############################################################################
 
+    sharedlibroot = os.path.abspath(case.get_value("SHAREDLIBROOT"))
+    sharedlib_dir = os.path.join(sharedlibroot, sharedpath)
+    new_sharedlib_dir = not os.path.isdir(sharedlib_dir)
+
     shared_lib = os.path.join(exeroot, sharedpath, "lib")
     shared_inc = os.path.join(exeroot, sharedpath, "include")
     for shared_item in [shared_lib, shared_inc]:
@@ -331,51 +437,98 @@ def _build_libraries(case, exeroot, sharedpath, caseroot, cimeroot, libroot, lid
     if uses_kokkos(case):
         libs.append("kokkos")
 
-    sharedlibroot = os.path.abspath(case.get_value("SHAREDLIBROOT"))
     # Check if we need to build our own cprnc
+    cprnc_lock = None
     if case.get_value("TEST"):
         cprnc_loc = case.get_value("CCSM_CPRNC")
         full_lib_path = os.path.join(sharedlibroot, compiler, "cprnc")
         if not cprnc_loc or not os.path.exists(cprnc_loc):
-            case.set_value("CCSM_CPRNC", os.path.join(full_lib_path, "cprnc"))
-            if not os.path.isdir(full_lib_path):
-                os.makedirs(full_lib_path)
+            cprnc_loc = os.path.join(full_lib_path, "cprnc")
+            case.set_value("CCSM_CPRNC", cprnc_loc)
+            cprnc_lock = _lock_cprnc_dir(full_lib_path)
+            if os.path.exists(cprnc_loc):
+                # Built by a case that held the lock before this one
+                cprnc_lock.close()
+                cprnc_lock = None
+            else:
                 libs.insert(0,"cprnc")
 
-    logs = []
+    # The libraries installed into a new shared library directory can be
+    # restored from the build cache, unless there are SourceMods that only
+    # this case has. Only install outputs are cached, build directories are
+    # not, so the key of the restored libraries is left in the directory to
+    # tell later builds into it that they are up to date. Every case links
+    # against its own EXEROOT/SHAREDPATH, so a later case with the same
+    # SHAREDLIBROOT restores the libraries there too, the key left in it
+    # tells that it already has them.
+    build_cache = get_build_cache() if buildlist is None and \
+                  not has_files(os.path.join(caseroot, "SourceMods", "src.share")) else None
+    install_dir = os.path.join(exeroot, sharedpath)
+    key_file = os.path.join(sharedlib_dir, _SHAREDLIB_CACHE_KEY_FILE)
+    install_key_file = os.path.join(install_dir, _SHAREDLIB_CACHE_KEY_FILE)
+    cache_key = None
+    cached_libs = [lib for lib in libs if lib not in ("cprnc", "kokkos")]
+    if build_cache is not None and cached_libs and (new_sharedlib_dir or os.path.isfile(key_file)):
+        cache_key = _get_sharedlib_cache_key(case, cached_libs)
+        installed_key = _read_cache_key(install_key_file)
+        restored_key = _read_cache_key(key_file)
+        if restored_key is not None:
+            os.remove(key_file)
+
+        if (restored_key == cache_key and installed_key == cache_key) or \
+           build_cache.restore("sharedlibs", cache_key, {"install" : install_dir}):
+            if not os.path.isdir(sharedlib_dir):
+                os.makedirs(sharedlib_dir)
+            for path in [key_file, install_key_file]:
+                with open(path, "w") as fd:
+                    fd.write(cache_key)
+            libs = [lib for lib in libs if lib not in cached_libs]
+            cache_key = None
 
-    for lib in libs:
-        if buildlist is not None and lib not in buildlist:
-            continue
+    logs = []
 
-        if lib == "csm_share":
-            # csm_share adds its own dir name
-            full_lib_path = os.path.join(sharedlibroot, sharedpath)
-        elif lib == "mpi-serial":
-            full_lib_path = os.path.join(sharedlibroot, sharedpath, "mct", lib)
-        elif lib == "cprnc":
-            full_lib_path = os.path.join(sharedlibroot, compiler, "cprnc")
-        else:
-            full_lib_path = os.path.join(sharedlibroot, sharedpath, lib)
+    try:
+        for lib in libs:
+            if buildlist is not None and lib not in buildlist:
+                continue
+
+            if lib == "csm_share":
+                # csm_share adds its own dir name
+                full_lib_path = os.path.join(sharedlibroot, sharedpath)
+            elif lib == "mpi-serial":
+                full_lib_path = os.path.join(sharedlibroot, sharedpath, "mct", lib)
+            elif lib == "cprnc":
+                full_lib_path = os.path.join(sharedlibroot, compiler, "cprnc")
+            else:
+                full_lib_path = os.path.join(sharedlibroot, sharedpath, lib)
 
-        # pio build creates its own directory
-        if (lib != "pio" and not os.path.isdir(full_lib_path)):
-            os.makedirs(full_lib_path)
+            # pio build creates its own directory
+            if (lib != "pio" and not os.path.isdir(full_lib_path)):
+                os.makedirs(full_lib_path)
 
-        file_build = os.path.join(exeroot, "{}.bldlog.{}".format(lib, lid))
-        my_file = os.path.join(cimeroot, "src", "build_scripts", "buildlib.{}".format(lib))
-        logger.info("Building {} with output to file {}".format(lib,file_build))
+            file_build = os.path.join(exeroot, "{}.bldlog.{}".format(lib, lid))
+            my_file = os.path.join(cimeroot, "src", "build_scripts", "buildlib.{}".format(lib))
+            logger.info("Building {} with output to file {}".format(lib,file_build))
 
-        run_sub_or_cmd(my_file, [full_lib_path, os.path.join(exeroot, sharedpath), caseroot], 'buildlib',
-                       [full_lib_path, os.path.join(exeroot, sharedpath), case], logfile=file_build)
+            run_sub_or_cmd(my_file, [full_lib_path, os.path.join(exeroot, sharedpath), caseroot], 'buildlib',
+                           [full_lib_path, os.path.join(exeroot, sharedpath), case], logfile=file_build)
 
-        analyze_build_log(lib, file_build, compiler)
-        logs.append(file_build)
-        if lib == "pio":
-            bldlog = open(file_build, "r")
-            for line in bldlog:
-                if re.search("Current setting for", line):
-                    logger.warning(line)
+            analyze_build_log(lib, file_build, compiler)
+            logs.append(file_build)
+            if lib == "pio":
+                bldlog = open(file_build, "r")
+                for line in bldlog:
+                    if re.search("Current setting for", line):
+                        logger.warning(line)
+            elif lib == "cprnc":
+                cprnc_lock.close()
+                cprnc_lock = None
+    finally:
+        if cprnc_lock is not None:
+            cprnc_lock.close()
+
+    if cache_key is not None:
+        build_cache.store("sharedlibs", cache_key, {"install" : install_dir}, include=_is_sharedlib_install_output)
 
     # clm not a shared lib for E3SM
     if get_model() != "e3sm" and (buildlist is None or "lnd" in buildlist):
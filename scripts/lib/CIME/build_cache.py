@@ -0,0 +1,332 @@
+"""
+Persistent, content-addressed cache of build trees shared by all cases.
+
+Every create_test run gets a new SHAREDLIBROOT and EXEROOT, so libraries
+whose sources and settings have not changed are compiled again each time.
+Entries in this cache are directory trees stored under a key that hashes
+everything the build depends on: source files, Macros and the relevant xml
+settings. A matching entry is restored into place instead of compiling.
+
+The cache is opt-in.  It is enabled by setting the CIME_BUILD_CACHE_DIR
+environment variable or the build_cache_dir option in the [main] section of
+~/.cime/config.  CIME_BUILD_CACHE_MAX_MB (default 20480) bounds the size of
+the cache, least recently used entries are evicted first.  Restored files
+are copied, set CIME_BUILD_CACHE_HARDLINK=TRUE to hard link them instead;
+this is only safe if nothing rewrites the restored files in place.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.utils import get_cime_config
+
+import hashlib, json, shutil, tempfile
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_MAX_MB = 20480
+_META_FILE = "meta.json"
+_TREES_DIR = "trees"
+_STATS_FILE = "stats.log"
+
+def hash_inputs(values, paths=(), case_paths=()):
+    """
+    Return a hex digest of values, a dict of settings, and of the contents
+    of every file under paths. Paths that do not exist are hashed by name
+    only, so adding them later changes the digest. case_paths are hashed
+    by their position instead of their name, for files such as Macros.make
+    that are at a different place in each case.
+
+    >>> import tempfile, shutil
+    >>> srcdir = tempfile.mkdtemp()
+    >>> with open(os.path.join(srcdir, "a.F90"), "w") as fd:
+    ...     _ = fd.write("module a")
+    >>> key = hash_inputs({"DEBUG" : False}, [srcdir])
+    >>> key == hash_inputs({"DEBUG" : False}, [srcdir])
+    True
+    >>> key == hash_inputs({"DEBUG" : True}, [srcdir])
+    False
+    >>> with open(os.path.join(srcdir, "a.F90"), "w") as fd:
+    ...     _ = fd.write("module b")
+    >>> key == hash_inputs({"DEBUG" : False}, [srcdir])
+    False
+    >>> othercase = tempfile.mkdtemp()
+    >>> _ = shutil.copy2(os.path.join(srcdir, "a.F90"), othercase)
+    >>> hash_inputs({}, case_paths=[srcdir]) == hash_inputs({}, case_paths=[othercase])
+    True
+    >>> shutil.rmtree(srcdir); shutil.rmtree(othercase)
+    """
+    sha = hashlib.sha1()
+    sha.update(json.dumps(values, sort_keys=True).encode("utf-8"))
+    names = list(paths) + ["case path {:d}".format(idx) for idx in range(len(case_paths))]
+    for name, path in zip(names, list(paths) + list(case_paths)):
+        sha.update("\0{}\0".format(name).encode("utf-8"))
+        if os.path.isfile(path):
+            _hash_file(sha, path)
+        elif os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    filepath = os.path.join(dirpath, filename)
+                    sha.update("\0{}\0".format(os.path.relpath(filepath, path)).encode("utf-8"))
+                    if os.path.isfile(filepath):
+                        _hash_file(sha, filepath)
+
+    return sha.hexdigest()
+
+def has_files(path):
+    """
+    Return True if there is any file under the directory path
+    """
+    for _, _, filenames in os.walk(path):
+        if filenames:
+            return True
+
+    return False
+
+def _hash_file(sha, path):
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024*1024), b""):
+            sha.update(chunk)
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            if not os.path.islink(filepath):
+                total += os.path.getsize(filepath)
+    return total
+
+def _copy_tree(src, dst, link=False, include=None):
+    """
+    Copy the tree under src, or the file src, into dst, which may already
+    exist. Times are preserved so make considers the copies up to date.
+    With include, only the files whose path relative to src it accepts are
+    copied.
+    """
+    if os.path.isfile(src):
+        dstdir = os.path.dirname(dst)
+        if not os.path.isdir(dstdir):
+            os.makedirs(dstdir)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        shutil.copy2(src, dst)
+        return
+
+    for dirpath, _, filenames in os.walk(src):
+        dstdir = os.path.join(dst, os.path.relpath(dirpath, src))
+        if include is None and not os.path.isdir(dstdir):
+            os.makedirs(dstdir)
+        for filename in filenames:
+            srcfile = os.path.join(dirpath, filename)
+            dstfile = os.path.join(dstdir, filename)
+            if include is not None:
+                if not include(os.path.relpath(srcfile, src)):
+                    continue
+                if not os.path.isdir(dstdir):
+                    os.makedirs(dstdir)
+            if os.path.lexists(dstfile):
+                os.remove(dstfile)
+            if os.path.islink(srcfile):
+                os.symlink(os.readlink(srcfile), dstfile)
+            elif link:
+                try:
+                    os.link(srcfile, dstfile)
+                except OSError:
+                    shutil.copy2(srcfile, dstfile)
+            else:
+                shutil.copy2(srcfile, dstfile)
+
+class BuildCache(object):
+    """
+    On-disk cache of build trees. Each entry is stored under a kind, such
+    as "sharedlibs", and a key from hash_inputs, and holds one or more named
+    directory trees or files.
+
+    >>> import tempfile, shutil
+    >>> cachedir = tempfile.mkdtemp()
+    >>> blddir = tempfile.mkdtemp()
+    >>> with open(os.path.join(blddir, "libfoo.a"), "w") as fd:
+    ...     _ = fd.write("archive")
+    >>> cache = BuildCache(cachedir)
+    >>> cache.restore("sharedlibs", "abc", {"lib" : os.path.join(blddir, "restored")})
+    False
+    >>> cache.store("sharedlibs", "abc", {"lib" : blddir})
+    >>> cache.restore("sharedlibs", "abc", {"lib" : os.path.join(blddir, "restored")})
+    True
+    >>> open(os.path.join(blddir, "restored", "libfoo.a")).read()
+    'archive'
+    >>> cache.hits, cache.misses, cache.bytes_saved
+    (1, 1, 7)
+    >>> sorted(cache.get_stats()["sharedlibs"].items())
+    [('bytes_saved', 7), ('hits', 1), ('misses', 1)]
+    >>> shutil.rmtree(cachedir); shutil.rmtree(blddir)
+    """
+
+    def __init__(self, cache_dir, max_bytes=_DEFAULT_MAX_MB*1024*1024, link=False):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._link = link
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _entry_path(self, kind, key):
+        return os.path.join(self._cache_dir, kind, key)
+
+    def _record(self, kind, event, key, nbytes=0):
+        """
+        Append an event to the stats log shared by every process using the cache
+        """
+        try:
+            with open(os.path.join(self._cache_dir, _STATS_FILE), "a") as fd:
+                fd.write("{} {} {} {:d}\n".format(kind, event, key, nbytes))
+        except (IOError, OSError) as e:
+            logger.debug("Could not update build cache stats: {}".format(e))
+
+    def restore(self, kind, key, dests):
+        """
+        Restore the trees of the entry for kind and key into dests, a dict of
+        {tree name -> directory or file}. Return False on a miss.
+        """
+        entry = self._entry_path(kind, key)
+        try:
+            with open(os.path.join(entry, _META_FILE), "r") as fd:
+                meta = json.load(fd)
+            if set(meta["trees"]) == set(dests):
+                for name, dest in dests.items():
+                    _copy_tree(os.path.join(entry, _TREES_DIR, name), dest, link=self._link)
+
+                os.utime(os.path.join(entry, _META_FILE), None)
+                self.hits += 1
+                self.bytes_saved += meta["bytes"]
+                self._record(kind, "hit", key, meta["bytes"])
+                logger.info("Build cache hit for {} {}, restored {:d} bytes".format(kind, key, meta["bytes"]))
+                return True
+        except (IOError, OSError, ValueError, KeyError) as e:
+            logger.debug("Build cache unusable entry for {} {}: {}".format(kind, key, e))
+
+        self.misses += 1
+        self._record(kind, "miss", key)
+        logger.info("Build cache miss for {} {}".format(kind, key))
+        return False
+
+    def store(self, kind, key, srcs, include=None):
+        """
+        Store the trees in srcs, a dict of {tree name -> directory or file},
+        as the entry for kind and key. Build trees hold absolute paths to
+        themselves (CMakeCache.txt, generated makefiles, dependency files),
+        include selects the files that are valid anywhere, see _copy_tree.
+        """
+        entry = self._entry_path(kind, key)
+        if os.path.isdir(entry):
+            return
+
+        tmpdir = None
+        try:
+            kind_dir = os.path.dirname(entry)
+            if not os.path.isdir(kind_dir):
+                os.makedirs(kind_dir)
+
+            tmpdir = tempfile.mkdtemp(dir=kind_dir, suffix=".tmp")
+            for name, src in srcs.items():
+                _copy_tree(src, os.path.join(tmpdir, _TREES_DIR, name), include=include)
+
+            with open(os.path.join(tmpdir, _META_FILE), "w") as fd:
+                json.dump({"trees" : sorted(srcs), "bytes" : _tree_size(os.path.join(tmpdir, _TREES_DIR))}, fd)
+
+            os.rename(tmpdir, entry)
+            tmpdir = None
+            logger.debug("Build cache stored {} {}".format(kind, key))
+        except (IOError, OSError) as e:
+            # Another process may have stored the same entry first
+            logger.debug("Could not store {} {} in build cache: {}".format(kind, key, e))
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits within max_bytes
+        """
+        entries = []
+        total = 0
+        for kind in os.listdir(self._cache_dir):
+            kind_dir = os.path.join(self._cache_dir, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for key in os.listdir(kind_dir):
+                entry = os.path.join(kind_dir, key)
+                try:
+                    with open(os.path.join(entry, _META_FILE), "r") as fd:
+                        size = json.load(fd)["bytes"]
+                    mtime = os.path.getmtime(os.path.join(entry, _META_FILE))
+                except (IOError, OSError, ValueError, KeyError):
+                    continue
+                entries.append((mtime, size, entry))
+                total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.debug("Build cache evicted {}".format(entry))
+
+    def get_stats(self):
+        """
+        Return {kind -> {"hits", "misses", "bytes_saved"}} over every process
+        that has used this cache
+        """
+        stats = {}
+        stats_file = os.path.join(self._cache_dir, _STATS_FILE)
+        if os.path.isfile(stats_file):
+            with open(stats_file, "r") as fd:
+                for line in fd:
+                    items = line.split()
+                    if len(items) != 4:
+                        continue
+                    kind, event, _, nbytes = items
+                    kind_stats = stats.setdefault(kind, {"hits" : 0, "misses" : 0, "bytes_saved" : 0})
+                    if event == "hit":
+                        kind_stats["hits"] += 1
+                        kind_stats["bytes_saved"] += int(nbytes)
+                    else:
+                        kind_stats["misses"] += 1
+
+        return stats
+
+_BUILD_CACHE = None
+def get_build_cache():
+    """
+    Return the process wide BuildCache, or None if the cache is not enabled
+    """
+    global _BUILD_CACHE
+    if _BUILD_CACHE is None:
+        cache_dir = os.environ.get("CIME_BUILD_CACHE_DIR")
+        if not cache_dir:
+            cime_config = get_cime_config()
+            if cime_config.has_option("main", "BUILD_CACHE_DIR"):
+                cache_dir = cime_config.get("main", "BUILD_CACHE_DIR")
+        if not cache_dir:
+            return None
+
+        cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        max_mb = int(os.environ.get("CIME_BUILD_CACHE_MAX_MB", _DEFAULT_MAX_MB))
+        link = os.environ.get("CIME_BUILD_CACHE_HARDLINK", "FALSE").upper() == "TRUE"
+        _BUILD_CACHE = BuildCache(cache_dir, max_bytes=max_mb*1024*1024, link=link)
+
+    return _BUILD_CACHE
+
+def reset_build_cache():
+    """
+    Useful to keep unit tests from interfering with each other
+    """
+    global _BUILD_CACHE
+    _BUILD_CACHE = None
@@ -5,11 +5,15 @@ common utilities for buildlib
 from CIME.XML.standard_module_setup import *
 from CIME.case import Case
 from CIME.utils import parse_args_and_handle_standard_logging_options, setup_standard_logging_options, get_model, safe_copy
-from CIME.build import get_standard_makefile_args
+from CIME.build import get_standard_makefile_args, get_build_cache_values
+from CIME.build_cache import get_build_cache, hash_inputs, has_files
 
 import sys, os, argparse
 logger = logging.getLogger(__name__)
 
+# Left in a component build directory filled from the build cache
+_COMPLIB_CACHE_KEY_FILE = ".build_cache_key"
+
 ###############################################################################
 def parse_input(argv):
 ###############################################################################
@@ -77,19 +81,102 @@ def build_cime_component_lib(case, compname, libroot, bldroot, use_old=True):
         run_gmake(case, compclass, compname, libroot, bldroot)
 
 ###############################################################################
-def run_gmake(case, compclass, compname, libroot, bldroot, libname="", user_cppdefs=""):
+def _is_complib_output(relpath):
 ###############################################################################
-    gmake_args = get_standard_makefile_args(case)
+    """
+    True for the files of a component build directory that other builds use
+    and that hold no absolute paths: its modules. Objects, Depends, Srcfiles
+    and the like are left out.
+
+    >>> _is_complib_output("datm_comp_mod.mod")
+    True
+    >>> _is_complib_output("Depends")
+    False
+    >>> _is_complib_output(os.path.join("sub", "a.mod"))
+    False
+    """
+    return os.sep not in relpath and relpath.endswith(".mod")
 
-    gmake_j   = case.get_value("GMAKE_J")
-    gmake     = case.get_value("GMAKE")
+###############################################################################
+def _get_complib_cache_key(case, compclass, compname, libname, bldroot, user_cppdefs):
+###############################################################################
+    """
+    Hash the sources, Macros and settings a component library is built from,
+    or return None if it should not be cached. The sources are the files in
+    the Filepath directories, which do not include subdirectories.
+    """
+    caseroot = case.get_value("CASEROOT")
+    filepath = os.path.join(bldroot, "Filepath")
+    if not os.path.isfile(filepath):
+        return None
+
+    with open(filepath, "r") as fd:
+        srcdirs = [line.strip() for line in fd if line.strip()]
+
+    in_case = lambda path: os.path.abspath(path).startswith(os.path.abspath(caseroot) + os.sep)
+    paths = []
+    for srcdir in srcdirs:
+        if in_case(srcdir):
+            # Builds with SourceMods that only this case has are not shared
+            if has_files(srcdir):
+                return None
+        elif os.path.isdir(srcdir):
+            paths.extend(sorted(os.path.join(srcdir, item) for item in os.listdir(srcdir)
+                                if os.path.isfile(os.path.join(srcdir, item))))
+        else:
+            paths.append(srcdir)
+
+    cimeroot = case.get_value("CIMEROOT")
+    paths.extend([os.path.join(cimeroot, "src", "share"),
+                  os.path.join(cimeroot, "src", "externals")])
+
+    values = get_build_cache_values(case)
+    values.update({"compclass" : compclass, "compname" : compname, "libname" : libname,
+                   "user_cppdefs" : user_cppdefs, "srcdirs" : [srcdir for srcdir in srcdirs if not in_case(srcdir)]})
+
+    case_paths = [os.path.join(bldroot, "CCSM_cppdefs"),
+                  os.path.join(caseroot, "Macros.make"),
+                  os.path.join(caseroot, "env_mach_specific.xml"),
+                  os.path.join(case.get_value("CASETOOLS"), "Makefile")]
+
+    return hash_inputs(values, paths, case_paths)
 
+###############################################################################
+def run_gmake(case, compclass, compname, libroot, bldroot, libname="", user_cppdefs=""):
+###############################################################################
     complib = ""
     if libname:
         complib  = os.path.join(libroot, "lib{}.a".format(libname))
     else:
         complib  = os.path.join(libroot, "lib{}.a".format(compclass))
 
+    # A component library and its modules can come from the build cache when
+    # it has not been built yet. Only those are cached, not the objects and
+    # dependency files that hold paths, so the key of the restored library is
+    # left in the build directory to tell later builds it is up to date.
+    build_cache = get_build_cache()
+    cache_key = None
+    key_file = os.path.join(bldroot, _COMPLIB_CACHE_KEY_FILE)
+    if build_cache is not None and (not os.path.exists(complib) or os.path.isfile(key_file)):
+        cache_key = _get_complib_cache_key(case, compclass, compname, libname, bldroot, user_cppdefs)
+        restored_key = None
+        if os.path.isfile(key_file):
+            with open(key_file, "r") as fd:
+                restored_key = fd.read().strip()
+            os.remove(key_file)
+
+        if cache_key is not None:
+            if (restored_key == cache_key and os.path.exists(complib)) or \
+               (not os.path.exists(complib) and build_cache.restore("complib", cache_key, {"mods" : bldroot, "complib" : complib})):
+                with open(key_file, "w") as fd:
+                    fd.write(cache_key)
+                return
+
+    gmake_args = get_standard_makefile_args(case)
+
+    gmake_j   = case.get_value("GMAKE_J")
+    gmake     = case.get_value("GMAKE")
+
     makefile = os.path.join(case.get_value("CASETOOLS"), "Makefile")
 
     cmd = "{gmake} complib -j {gmake_j:d} MODEL={compclass} COMP_CLASS={compclass} COMP_NAME={compname} COMPLIB={complib} {gmake_args} -f {makefile} -C {bldroot} " \
@@ -97,5 +184,8 @@ def run_gmake(case, compclass, compname, libroot, bldroot, libname="", user_cppd
     if user_cppdefs:
         cmd = cmd + "USER_CPPDEFS='{}'".format(user_cppdefs )
 
-    _, out, _ = run_cmd(cmd, combine_output=True)
+    stat, out, _ = run_cmd(cmd, combine_output=True)
     print(out)
+
+    if cache_key is not None and stat == 0 and os.path.isfile(complib):
+        build_cache.store("complib", cache_key, {"mods" : bldroot, "complib" : complib}, include=_is_complib_output)
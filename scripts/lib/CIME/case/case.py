@@ -5,7 +5,8 @@ All interaction with and between the module files in XML/ takes place
 through the Case module.
 """
 from copy import deepcopy
-import glob, os, shutil, math, six
+from contextlib import contextmanager
+import glob, os, shutil, math, time, six
 from CIME.XML.standard_module_setup import *
 #pylint: disable=import-error,redefined-builtin
 from six.moves import input
@@ -34,7 +35,7 @@ from CIME.XML.env_run               import EnvRun
 from CIME.XML.env_archive           import EnvArchive
 from CIME.XML.env_batch             import EnvBatch
 from CIME.XML.env_workflow          import EnvWorkflow
-from CIME.XML.generic_xml           import GenericXML
+from CIME.XML.generic_xml           import GenericXML, ResolveRecord, deferred_reads, get_references
 from CIME.user_mod_support          import apply_user_mods
 from CIME.aprun import get_aprun_cmd_for_case
 
@@ -80,8 +81,18 @@ class Case(object):
     from CIME.case.preview_namelists import create_dirs, create_namelists
     from CIME.case.check_input_data import check_all_input_data, stage_refcase, check_input_data
 
-    def __init__(self, case_root=None, read_only=True):
+    # Policies for the resolved value cache. Values referencing $ENV{} are
+    # cached but checked against os.environ on every hit. $SHELL{} commands
+    # are run once per Case object when CACHE_SHELL_OUTPUT is True and every
+    # time they are resolved otherwise.
+    CACHE_SHELL_OUTPUT = True
+
+    # Set by initialize_derived_attributes, see __getattr__
+    _DERIVED_ATTRIBUTES = ("thread_count", "total_tasks", "tasks_per_node", "num_nodes",
+                           "spare_nodes", "tasks_per_numa", "cores_per_task", "srun_binding")
 
+    def __init__(self, case_root=None, read_only=True):
+        start_time = time.time()
         if case_root is None:
             case_root = os.getcwd()
         self._caseroot = case_root
@@ -94,6 +105,20 @@ class Case(object):
         self._env_generic_files = []
         self._files = []
 
+        # Cache of resolved values, see get_resolved_value
+        self._resolved_values = {}
+        self._resolved_dependents = {}
+        self._resolved_generations = None
+        self._shell_outputs = {} if self.CACHE_SHELL_OUTPUT else None
+
+        # Map of variable name to the env files that may hold it, see _get_env_files
+        self._env_routes = {}
+        self._env_value_names = {}
+        self._env_routes_stamp = None
+
+        # True while a transaction is collecting changes, see transaction
+        self._in_transaction = False
+
         self.read_xml()
 
         # Hold arbitary values. In create_newcase we may set values
@@ -129,7 +154,30 @@ class Case(object):
 
         # check if case has been configured and if so initialize derived
         if self.get_value("CASEROOT") is not None:
+            if self._force_read_only:
+                # Needs most env files, wait until one is asked for
+                for name in self._DERIVED_ATTRIBUTES:
+                    delattr(self, name)
+            else:
+                self.initialize_derived_attributes()
+
+        logger.debug("Case {} initialized in {:.3f} seconds, read {}"
+                     .format(self._caseroot, time.time() - start_time, ", ".join(self.get_read_env_files())))
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set, which are the derived
+        # attributes of a read-only case until first used
+        if name in Case._DERIVED_ATTRIBUTES:
             self.initialize_derived_attributes()
+            return self.__dict__[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def get_read_env_files(self):
+        """
+        Return the names of the env files parsed so far. A read-only case
+        only parses the files it needs.
+        """
+        return [os.path.basename(env_file.filename) for env_file in self._files if not env_file.deferred]
 
     def check_if_comp_var(self, vid):
         for env_file in self._env_entryid_files:
@@ -196,10 +244,63 @@ class Case(object):
         self._read_only_mode = True
         return False
 
+    @contextmanager
+    def transaction(self):
+        """
+        Apply a batch of changes to the case together.  Within the block
+        set_value only modifies the env files in memory and flush is
+        postponed.  On normal exit every modified env file is validated
+        against its schema and, if all pass, each is written exactly once.
+        If the block raises, or validation fails, all changes made in the
+        block are discarded.  A transaction inside a transaction is part
+        of the outer one.
+        """
+        expect(not self._read_only_mode, "Cannot modify case, read_only. "
+               "Case must be opened with read_only=False and can only be modified within a context manager")
+        if self._in_transaction:
+            yield self
+            return
+
+        self.flush()
+        self._in_transaction = True
+        try:
+            yield self
+            for env_file in self._files:
+                if env_file.needsrewrite:
+                    env_file.validate_changes()
+        except BaseException:
+            self._in_transaction = False
+            self._discard_changes()
+            raise
+
+        self._in_transaction = False
+        self.flush()
+
+    def _discard_changes(self):
+        """
+        Drop unwritten changes by reading the env files again
+        """
+        for env_file in self._files:
+            if env_file.needsrewrite:
+                logger.debug("Discarding changes to {}".format(env_file.filename))
+                env_file.needsrewrite = False
+                # The in-process cache shares the modified tree
+                GenericXML.invalidate(env_file.filename)
+        self.read_xml()
+
     def read_xml(self):
         for env_file in self._files:
             expect(not env_file.needsrewrite, "Potential loss of unflushed changes in {}".format(env_file.filename))
 
+        if self._force_read_only:
+            # A read-only case parses each env file when it is first used
+            with deferred_reads():
+                self._read_env_files()
+        else:
+            self._read_env_files()
+        self._clear_resolved_values()
+
+    def _read_env_files(self):
         self._env_entryid_files = []
         self._env_entryid_files.append(EnvCase(self._caseroot, components=None, read_only=self._force_read_only))
         components = self._env_entryid_files[0].get_values("COMP_CLASSES")
@@ -266,11 +367,45 @@ class Case(object):
         if not os.path.isdir(self._caseroot):
             # do not flush if caseroot wasnt created
             return
+        if self._in_transaction:
+            # Written when the transaction commits
+            return
         for env_file in self._files:
             env_file.write(force_write=flushall)
 
-    def get_values(self, item, attribute=None, resolved=True, subgroup=None):
+    def _env_routes_state(self):
+        # Only files that are not locked can gain or lose entries
+        return tuple((id(env_file), None if env_file.locked else env_file.generation) for env_file in self._files)
+
+    def _get_env_files(self, item):
+        """
+        Return the env files, in search order, whose get_value can find item
+        or, for a component variable like NTASKS_ATM, its base name. Any other
+        file would return None.
+        """
+        state = self._env_routes_state()
+        if state != self._env_routes_stamp:
+            self._env_routes = {}
+            self._env_routes_stamp = state
+        elif item in self._env_routes:
+            return self._env_routes[item]
+
+        route = []
         for env_file in self._files:
+            key = id(env_file)
+            generation = None if env_file.locked else env_file.generation
+            if key not in self._env_value_names or self._env_value_names[key][0] != generation:
+                self._env_value_names[key] = (generation, env_file.get_value_names())
+
+            names = self._env_value_names[key][1]
+            if item in names or env_file.split_comp_var(item)[0] in names:
+                route.append(env_file)
+
+        self._env_routes[item] = route
+        return route
+
+    def get_values(self, item, attribute=None, resolved=True, subgroup=None):
+        for env_file in self._get_env_files(item):
             # Wait and resolve in self rather than in env_file
             results = env_file.get_values(item, attribute, resolved=False, subgroup=subgroup)
             if len(results) > 0:
@@ -298,7 +433,7 @@ class Case(object):
 
     def get_value(self, item, attribute=None, resolved=True, subgroup=None):
         result = None
-        for env_file in self._files:
+        for env_file in self._get_env_files(item):
             # Wait and resolve in self rather than in env_file
             result = env_file.get_value(item, attribute, resolved=False, subgroup=subgroup)
 
@@ -320,7 +455,13 @@ class Case(object):
         # Empty result
         result = []
 
-        for env_file in self._env_entryid_files:
+        if field == "varid":
+            env_files = self._env_entryid_files
+        else:
+            env_files = [env_file for env_file in self._get_env_files(variable)
+                         if env_file in self._env_entryid_files]
+
+        for env_file in env_files:
             # Wait and resolve in self rather than in env_file
             logger.debug("(get_record_field) Searching in {}".format(env_file.__class__.__name__))
             if field == "varid":
@@ -362,25 +503,91 @@ class Case(object):
 
     def get_type_info(self, item):
         result = None
-        for env_file in self._env_entryid_files:
+        for env_file in self._get_env_files(item):
+            if env_file not in self._env_entryid_files:
+                continue
             result = env_file.get_type_info(item)
             if result is not None:
                 return result
 
         return result
 
-    def get_resolved_value(self, item, recurse=0, allow_unresolved_envvars=False):
+    def _env_generations(self):
+        return tuple((id(env_file), env_file.generation) for env_file in self._files)
+
+    def _clear_resolved_values(self):
+        self._resolved_values = {}
+        self._resolved_dependents = {}
+        self._resolved_generations = self._env_generations()
+
+    def _check_resolved_values(self):
+        """
+        Drop all cached resolved values if an env file changed other than
+        through set_value (for example a direct call on an env object)
+        """
+        if self._resolved_generations != self._env_generations():
+            self._clear_resolved_values()
+
+    def _get_dependency_name(self, vid):
+        """
+        Return the name resolved values depending on vid are recorded under:
+        the base name for anything that looks like a component variable, so
+        NTASKS_ATM and NTASKS are one dependency. Needs no env file contents.
+        """
+        for env_file in self._env_entryid_files:
+            new_vid, comp = env_file.split_comp_var(vid)
+            if comp is not None:
+                return new_vid
+        return vid
+
+    def _invalidate_resolved_values(self, item):
+        """
+        Drop the cached resolved values that depend on variable item.
+        """
+        vid = self._get_dependency_name(item)
+        for key in self._resolved_dependents.pop(vid, ()):
+            self._resolved_values.pop(key, None)
+
+    def get_resolved_value(self, item, recurse=0, allow_unresolved_envvars=False, record=None):
+        """
+        Resolve references to other variables, environment variables and shell
+        commands in item.
+
+        Results are cached along with the variables they depend on. set_value
+        drops exactly the entries depending on the variable it changed.
+        """
         num_unresolved = item.count("$") if item else 0
         recurse_limit = 10
         if (num_unresolved > 0 and recurse < recurse_limit ):
+            if recurse == 0:
+                key = (item, allow_unresolved_envvars)
+                self._check_resolved_values()
+                if key in self._resolved_values:
+                    value, env_vars = self._resolved_values[key]
+                    if all(os.environ.get(name) == env_value for name, env_value in env_vars.items()):
+                        return value
+
+                record = ResolveRecord(shell_outputs=self._shell_outputs)
+
             for env_file in self._env_entryid_files:
+                # A file not read yet could only add values of its own
+                # variables, anything else is resolved by the other files
+                if env_file.deferred and \
+                   not any(env_file in self._get_env_files(var) for var in get_references(item)):
+                    continue
                 item = env_file.get_resolved_value(item,
-                                                   allow_unresolved_envvars=allow_unresolved_envvars)
-            if ("$" not in item):
-                return item
-            else:
+                                                   allow_unresolved_envvars=allow_unresolved_envvars,
+                                                   record=record)
+            if ("$" in item):
                 item = self.get_resolved_value(item, recurse=recurse+1,
-                                               allow_unresolved_envvars=allow_unresolved_envvars)
+                                               allow_unresolved_envvars=allow_unresolved_envvars,
+                                               record=record)
+
+            if recurse == 0:
+                self._resolved_values[key] = (item, record.env_vars)
+                for var in record.variables:
+                    vid = self._get_dependency_name(var)
+                    self._resolved_dependents.setdefault(vid, set()).add(key)
 
         return item
 
@@ -398,10 +605,15 @@ class Case(object):
             self._caseroot = value
         result = None
 
-        for env_file in self._files:
+        self._check_resolved_values()
+        for env_file in self._get_env_files(item):
             result = env_file.set_value(item, value, subgroup, ignore_type)
             if (result is not None):
                 logger.debug("Will rewrite file {} {}".format(env_file.filename, item))
+                self._invalidate_resolved_values(item)
+                self._resolved_generations = self._env_generations()
+                # Setting a value does not add or remove entries
+                self._env_routes_stamp = self._env_routes_state()
                 return (result, env_file.filename) if return_file else result
 
         if len(self._files) == 1:
@@ -419,7 +631,9 @@ class Case(object):
                "Case must be opened with read_only=False and can only be modified within a context manager")
 
         result = None
-        for env_file in self._env_entryid_files:
+        for env_file in self._get_env_files(item):
+            if env_file not in self._env_entryid_files:
+                continue
             result = env_file.set_valid_values(item, valid_values)
             if (result is not None):
                 logger.debug("Will rewrite file {} {}".format(env_file.filename, item))
@@ -1544,6 +1758,7 @@ directory, NOT in this subdirectory."""
 
         expect(new_env_file is not None, "No match found for file type {}".format(ftype))
         self._files = [new_env_file]
+        self._clear_resolved_values()
 
     def update_env(self, new_object, env_file, blow_away=False):
         """
@@ -1562,6 +1777,7 @@ directory, NOT in this subdirectory."""
             self._env_generic_files.append(new_object)
         self._files.remove(old_object)
         self._files.append(new_object)
+        self._clear_resolved_values()
 
     def get_latest_cpl_log(self, coupler_log_path=None, cplname="cpl"):
         """
@@ -4,27 +4,59 @@ case_st_archive, restore_from_archive, archive_last_restarts
 are members of class Case from file case.py
 """
 
-import shutil, glob, re, os
+import shutil, glob, re, os, functools
 
 from CIME.XML.standard_module_setup import *
 from CIME.utils                     import run_and_log_case_status, ls_sorted_by_mtime, symlink_force, safe_copy, find_files
 from CIME.date                      import get_file_date
 from CIME.XML.archive       import Archive
 from CIME.XML.files            import Files
+from CIME.rundir_index              import RunDirIndex
+from CIME.file_transfer             import FileTransfer, DEFAULT_TRANSFER_THREADS, \
+    get_compressed_name, check_compression_method
+from CIME.netcdf_reader             import read_char_variable, NetCDFError
+from CIME.archive_manifest          import ArchiveManifest, run_manifests, get_claimed_files
 from os.path                        import isdir, join
 
 logger = logging.getLogger(__name__)
 
 ###############################################################################
-def _get_archive_file_fn(copy_only):
+def _get_archive_file_fn(copy_only, transfer=None):
 ###############################################################################
     """
-    Returns the function to use for archiving some files
+    Returns the function to use for archiving some files, queueing them on
+    transfer if given
     """
-    return safe_copy if copy_only else shutil.move
+    if transfer is None:
+        return safe_copy if copy_only else shutil.move
+    return transfer.copy if copy_only else transfer.move
 
 ###############################################################################
-def _get_datenames(casename, rundir):
+def _archive_file(rundir_index, archive_file_fn, srcfile, destfile):
+###############################################################################
+    """
+    Archive srcfile from the run directory with archive_file_fn. The file
+    is dropped from rundir_index, whether it is moved or copied, so later
+    queries do not archive it again.
+    """
+    archive_file_fn(srcfile, destfile)
+    rundir_index.discard(os.path.basename(srcfile))
+
+###############################################################################
+def _remove_rundir_file(rundir_index, srcfile):
+###############################################################################
+    logger.info("removing interim restart file {}".format(srcfile))
+    if (os.path.isfile(srcfile)):
+        try:
+            os.remove(srcfile)
+            rundir_index.discard(os.path.basename(srcfile))
+        except OSError:
+            logger.warning("unable to remove interim restart file {}".format(srcfile))
+    else:
+        logger.warning("interim restart file {} does not exist".format(srcfile))
+
+###############################################################################
+def _get_datenames(casename, rundir, rundir_index=None):
 ###############################################################################
     """
     Returns the date objects specifying the times of each file
@@ -32,10 +64,12 @@ def _get_datenames(casename, rundir):
     Not doc-testable due to filesystem dependence
     """
     expect(isdir(rundir), 'Cannot open directory {} '.format(rundir))
+    if rundir_index is None:
+        rundir_index = RunDirIndex(rundir)
 
-    files = sorted(glob.glob(os.path.join(rundir, casename +      '.cpl.r.*.nc')))
+    files = [os.path.join(rundir, f) for f in rundir_index.glob(casename + '.cpl.r.*.nc')]
     if not files:
-        files = sorted(glob.glob(os.path.join(rundir, casename + '.cpl_0001.r.*.nc')))
+        files = [os.path.join(rundir, f) for f in rundir_index.glob(casename + '.cpl_0001.r.*.nc')]
 
     logger.debug("  cpl files : {} ".format(files))
 
@@ -124,14 +158,15 @@ def _get_component_archive_entries(components, archive):
 
 ###############################################################################
 def _archive_rpointer_files(casename, ninst_strings, rundir, save_interim_restart_files, archive,
-                            archive_entry, archive_restdir, datename, datename_is_last):
+                            archive_entry, archive_restdir, datename, datename_is_last, rundir_index,
+                            copy_fn=safe_copy):
 ###############################################################################
 
     if datename_is_last:
         # Copy of all rpointer files for latest restart date
-        rpointers = glob.glob(os.path.join(rundir, 'rpointer.*'))
+        rpointers = rundir_index.glob('rpointer.*')
         for rpointer in rpointers:
-            safe_copy(rpointer, os.path.join(archive_restdir, os.path.basename(rpointer)))
+            copy_fn(os.path.join(rundir, rpointer), os.path.join(archive_restdir, rpointer))
     else:
         # Generate rpointer file(s) for interim restarts for the one datename and each
         # possible value of ninst_strings
@@ -175,11 +210,13 @@ def _archive_rpointer_files(casename, ninst_strings, rundir, save_interim_restar
                     logger.info("rpointer_content unset, not creating rpointer file {}".format(rpointer_file))
 
 ###############################################################################
-def _archive_log_files(dout_s_root, rundir, archive_incomplete, archive_file_fn):
+def _archive_log_files(dout_s_root, rundir, archive_incomplete, archive_file_fn, rundir_index,
+                       compression="none", compress_fn=None):
 ###############################################################################
     """
     Find all completed log files, or all log files if archive_incomplete is True, and archive them.
     Each log file is required to have ".log." in its name, and completed ones will end with ".gz"
+    Log files that are not compressed yet are compressed with compress_fn if compression is gzip
     Not doc-testable due to file system dependence
     """
     archive_logdir = os.path.join(dout_s_root, 'logs')
@@ -192,22 +229,35 @@ def _archive_log_files(dout_s_root, rundir, archive_incomplete, archive_file_fn)
     else:
         log_search = '*.log.*'
 
-    logfiles = glob.glob(os.path.join(rundir, log_search))
+    logfiles = rundir_index.glob(log_search)
     for logfile in logfiles:
-        srcfile = join(rundir, os.path.basename(logfile))
-        destfile = join(archive_logdir, os.path.basename(logfile))
-        archive_file_fn(srcfile, destfile)
-        logger.info("moving {} to {}".format(srcfile, destfile))
+        srcfile = join(rundir, logfile)
+        destfile = join(archive_logdir, logfile)
+        if compression != "none" and not logfile.endswith(".gz"):
+            destfile = get_compressed_name(destfile, compression)
+            _archive_file(rundir_index, functools.partial(compress_fn, method=compression), srcfile, destfile)
+            logger.info("compressing {} to {}".format(srcfile, destfile))
+        else:
+            _archive_file(rundir_index, archive_file_fn, srcfile, destfile)
+            logger.info("moving {} to {}".format(srcfile, destfile))
 
 ###############################################################################
 def _archive_history_files(archive, compclass, compname, histfiles_savein_rundir,
-                           last_date, archive_file_fn, dout_s_root, casename, rundir):
+                           last_date, archive_file_fn, dout_s_root, casename, rundir, rundir_index,
+                           copy_fn=safe_copy, compress_fn=None, copy_compress_fn=None):
 ###############################################################################
     """
     perform short term archiving on history files in rundir
 
+    If hist_file_compression is set for the component, history files are
+    compressed with compress_fn instead of archive_file_fn, and those
+    that stay in rundir with copy_compress_fn instead of copy_fn
+
     Not doc-testable due to case and file system dependence
     """
+    compression = "none"
+    if compress_fn is not None:
+        compression = check_compression_method(archive.get_file_compression(archive.get_entry(compname), "hist"))
 
     # determine history archive directory (create if it does not exist)
 
@@ -226,8 +276,7 @@ def _archive_history_files(archive, compclass, compname, histfiles_savein_rundir
             logger.debug("created directory {}".format(archive_rblddir))
 
         sfxrbld = r'mesh_mask_' + r'[0-9]*'
-        pfile = re.compile(sfxrbld)
-        rbldfiles = [f for f in os.listdir(rundir) if pfile.search(f)]
+        rbldfiles = rundir_index.search(sfxrbld)
         logger.debug("rbldfiles = {} ".format(rbldfiles))
 
         if rbldfiles:
@@ -235,11 +284,10 @@ def _archive_history_files(archive, compclass, compname, histfiles_savein_rundir
                 srcfile = join(rundir, rbldfile)
                 destfile = join(archive_rblddir, rbldfile)
                 logger.info("moving {} to {} ".format(srcfile, destfile))
-                archive_file_fn(srcfile, destfile)
+                _archive_file(rundir_index, archive_file_fn, srcfile, destfile)
 
         sfxhst = casename + r'_[0-9][mdy]_' + r'[0-9]*'
-        pfile = re.compile(sfxhst)
-        hstfiles = [f for f in os.listdir(rundir) if pfile.search(f)]
+        hstfiles = rundir_index.search(sfxhst)
         logger.debug("hstfiles = {} ".format(hstfiles))
 
         if hstfiles:
@@ -247,13 +295,13 @@ def _archive_history_files(archive, compclass, compname, histfiles_savein_rundir
                 srcfile = join(rundir, hstfile)
                 destfile = join(archive_histdir, hstfile)
                 logger.info("moving {} to {} ".format(srcfile, destfile))
-                archive_file_fn(srcfile, destfile)
+                _archive_file(rundir_index, archive_file_fn, srcfile, destfile)
 
     # determine ninst and ninst_string
 
     # archive history files - the only history files that kept in the
     # run directory are those that are needed for restarts
-    histfiles = archive.get_all_hist_files(casename, compname, rundir)
+    histfiles = archive.get_all_hist_files(casename, compname, rundir, dir_index=rundir_index)
 
     if histfiles:
         for histfile in histfiles:
@@ -263,18 +311,27 @@ def _archive_history_files(archive, compclass, compname, histfiles_savein_rundir
                 expect(os.path.isfile(srcfile),
                        "history file {} does not exist ".format(srcfile))
                 destfile = join(archive_histdir, histfile)
-                if histfile in histfiles_savein_rundir:
+                if compression != "none":
+                    destfile = get_compressed_name(destfile, compression)
+                    logger.info("compressing {} to {} ".format(srcfile, destfile))
+                    if histfile in histfiles_savein_rundir:
+                        copy_compress_fn(srcfile, destfile, compression)
+                    else:
+                        _archive_file(rundir_index, functools.partial(compress_fn, method=compression),
+                                      srcfile, destfile)
+                elif histfile in histfiles_savein_rundir:
                     logger.info("copying {} to {} ".format(srcfile, destfile))
-                    safe_copy(srcfile, destfile)
+                    copy_fn(srcfile, destfile)
                 else:
                     logger.info("moving {} to {} ".format(srcfile, destfile))
-                    archive_file_fn(srcfile, destfile)
+                    _archive_file(rundir_index, archive_file_fn, srcfile, destfile)
 
 ###############################################################################
-def get_histfiles_for_restarts(rundir, archive, archive_entry, restfile, testonly=False):
+def get_histfiles_for_restarts(rundir, archive, archive_entry, restfile, testonly=False, rundir_index=None):
 ###############################################################################
     """
     query restart files to determine history files that are needed for restarts
+    rundir_index, if given, is used instead of checking that the files exist
 
     Not doc-testable due to filesystem dependence
     """
@@ -282,41 +339,60 @@ def get_histfiles_for_restarts(rundir, archive, archive_entry, restfile, testonl
     # Make certain histfiles is a set so we don't repeat
     histfiles = set()
     rest_hist_varname = archive.get_entry_value('rest_history_varname', archive_entry)
-    if rest_hist_varname != 'unset':
-        cmd = "ncdump -v {} {} ".format(rest_hist_varname, os.path.join(rundir, restfile))
-        if testonly:
-            out = "{} =".format(rest_hist_varname)
-        else:
-            rc, out, error = run_cmd(cmd)
-            if rc != 0:
-                logger.info(" WARNING: {} failed rc={:d}\n    out={}\n    err={}".format(cmd, rc, out, error))
-        logger.debug(" get_histfiles_for_restarts: \n    out={}".format(out))
-
-        searchname = "{} =".format(rest_hist_varname)
-        if searchname in out:
-            offset = out.index(searchname)
-            items = out[offset:].split(",")
-            for item in items:
-                # the following match has an option of having any number of '.'s and '/'s
-                # at the beginning of the history filename
-                matchobj = re.search(r"\"\S+\s*\"", item)
-                if matchobj:
-                    histfile = matchobj.group(0).strip('" ')
-                    histfile = os.path.basename(histfile)
-                    # append histfile to the list ONLY if it exists in rundir before the archiving
-                    if histfile in histfiles:
-                        logger.warning("WARNING, tried to add a duplicate file to histfiles")
-                    if os.path.isfile(os.path.join(rundir,histfile)):
-                        histfiles.add(histfile)
-                    else:
-                        logger.debug(" get_histfiles_for_restarts: histfile {} does not exist ".format(histfile))
+    if rest_hist_varname != 'unset' and not testonly:
+        for histfile in _read_rest_history_varname(os.path.join(rundir, restfile), rest_hist_varname):
+            # the history filename may have any number of '.'s and '/'s at the beginning
+            histfile = os.path.basename(histfile)
+            if not histfile:
+                continue
+            # append histfile to the list ONLY if it exists in rundir before the archiving
+            if histfile in histfiles:
+                logger.warning("WARNING, tried to add a duplicate file to histfiles")
+            if histfile in rundir_index if rundir_index is not None else os.path.isfile(os.path.join(rundir,histfile)):
+                histfiles.add(histfile)
+            else:
+                logger.debug(" get_histfiles_for_restarts: histfile {} does not exist ".format(histfile))
+    return histfiles
+
+###############################################################################
+def _read_rest_history_varname(restfile, rest_hist_varname):
+###############################################################################
+    """
+    Returns the history file names held by the char variable rest_hist_varname
+    of restfile. The variable is read directly from the file, ncdump is only
+    used for files that the python reader cannot handle (netCDF-4 files
+    without the netCDF4 module).
+    """
+    try:
+        histfiles = read_char_variable(restfile, rest_hist_varname)
+        logger.debug(" get_histfiles_for_restarts: {} = {}".format(rest_hist_varname, histfiles))
+        return histfiles
+    except (NetCDFError, IOError, OSError, ValueError) as e:
+        logger.debug(" reading {} from {} failed ({}), trying ncdump".format(rest_hist_varname, restfile, e))
+
+    cmd = "ncdump -v {} {} ".format(rest_hist_varname, restfile)
+    rc, out, error = run_cmd(cmd)
+    if rc != 0:
+        logger.info(" WARNING: {} failed rc={:d}\n    out={}\n    err={}".format(cmd, rc, out, error))
+    logger.debug(" get_histfiles_for_restarts: \n    out={}".format(out))
+
+    histfiles = []
+    searchname = "{} =".format(rest_hist_varname)
+    if searchname in out:
+        offset = out.index(searchname)
+        items = out[offset:].split(",")
+        for item in items:
+            matchobj = re.search(r"\"\S+\s*\"", item)
+            if matchobj:
+                histfiles.append(matchobj.group(0).strip('" '))
     return histfiles
 
 ###############################################################################
 def _archive_restarts_date(case, casename, rundir, archive,
                            datename, datename_is_last, last_date,
                            archive_restdir, archive_file_fn, components=None,
-                           link_to_last_restart_files=False, testonly=False):
+                           link_to_last_restart_files=False, testonly=False, rundir_index=None,
+                           copy_fn=safe_copy):
 ###############################################################################
     """
     Archive restart files for a single date
@@ -338,6 +414,8 @@ def _archive_restarts_date(case, casename, rundir, archive,
         components.append('dart')
 
     histfiles_savein_rundir_by_compname = {}
+    if rundir_index is None:
+        rundir_index = RunDirIndex(rundir)
 
     for (archive_entry, compname, compclass) in _get_component_archive_entries(components, archive):
         if compclass:
@@ -352,7 +430,9 @@ def _archive_restarts_date(case, casename, rundir, archive,
                                                                   archive_file_fn,
                                                                   link_to_last_restart_files=
                                                                   link_to_last_restart_files,
-                                                                  testonly=testonly)
+                                                                  testonly=testonly,
+                                                                  rundir_index=rundir_index,
+                                                                  copy_fn=copy_fn)
             histfiles_savein_rundir_by_compname[compname] = histfiles_savein_rundir
 
     return histfiles_savein_rundir_by_compname
@@ -361,7 +441,8 @@ def _archive_restarts_date(case, casename, rundir, archive,
 def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                                 compclass, compname, datename, datename_is_last,
                                 last_date, archive_restdir, archive_file_fn,
-                                link_to_last_restart_files=False, testonly=False):
+                                link_to_last_restart_files=False, testonly=False, rundir_index=None,
+                                copy_fn=safe_copy):
 ###############################################################################
     """
     Archive restart files for a single date and single component
@@ -372,6 +453,8 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
     history files that are associated with these restart files.)
     """
     datename_str = _datetime_str(datename)
+    if rundir_index is None:
+        rundir_index = RunDirIndex(rundir)
 
     if datename_is_last or case.get_value('DOUT_S_SAVE_INTERIM_RESTART_FILES'):
         if not os.path.exists(archive_restdir):
@@ -380,7 +463,8 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
     # archive the rpointer file(s) for this datename and all possible ninst_strings
     _archive_rpointer_files(casename, _get_ninst_info(case, compclass)[1], rundir,
                             case.get_value('DOUT_S_SAVE_INTERIM_RESTART_FILES'),
-                            archive, archive_entry, archive_restdir, datename, datename_is_last)
+                            archive, archive_entry, archive_restdir, datename, datename_is_last, rundir_index,
+                            copy_fn=copy_fn)
 
     # move all but latest restart files into the archive restart directory
     # copy latest restart files to archive restart directory
@@ -391,7 +475,7 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
         last_restart_file_fn = symlink_force
         last_restart_file_fn_msg = "linking"
     else:
-        last_restart_file_fn = safe_copy
+        last_restart_file_fn = copy_fn
         last_restart_file_fn_msg = "copying"
 
     # the compname is drv but the files are named cpl
@@ -404,19 +488,14 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
         restfiles = ""
         if compname.find('mpas') == 0 or compname == 'mali':
             pattern = compname + r'\.' + suffix + r'\.' + '_'.join(datename_str.rsplit('-', 1))
-            pfile = re.compile(pattern)
-            restfiles = [f for f in os.listdir(rundir) if pfile.search(f)]
+            restfiles = rundir_index.search(pattern)
         elif compname == 'nemo':
             pattern = r'_*_' + suffix + r'[0-9]*'
-            pfile = re.compile(pattern)
-            restfiles = [f for f in os.listdir(rundir) if pfile.search(f)]
+            restfiles = rundir_index.search(pattern)
         else:
-            pattern = r"^{}\.{}[\d_]*\.".format(casename, compname)
-            pfile = re.compile(pattern)
-            files = [f for f in os.listdir(rundir) if pfile.search(f)]
+            files = rundir_index.component_files(casename, compname)
             pattern =  r'_?' + r'\d*' + r'\.' + suffix + r'\.' + r'[^\.]*' + r'\.?' + datename_str
-            pfile = re.compile(pattern)
-            restfiles = [f for f in files if pfile.search(f)]
+            restfiles = rundir_index.search(pattern, names=files)
             logger.debug("pattern is {} restfiles {}".format(pattern, restfiles))
         for rfile in restfiles:
             rfile = os.path.basename(rfile)
@@ -433,7 +512,8 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
             # need to do this before archiving restart files
             histfiles_for_restart = get_histfiles_for_restarts(rundir, archive,
                                                                archive_entry, rfile,
-                                                               testonly=testonly)
+                                                               testonly=testonly,
+                                                               rundir_index=rundir_index)
 
             if datename_is_last and histfiles_for_restart:
                 for histfile in histfiles_for_restart:
@@ -453,7 +533,7 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                     expect(os.path.isfile(srcfile),
                            "history restart file {} for last date does not exist ".format(srcfile))
                     logger.info("Copying {} to {}".format(srcfile, destfile))
-                    safe_copy(srcfile, destfile)
+                    copy_fn(srcfile, destfile)
                     logger.debug("datename_is_last + histfiles_for_restart copying \n  {} to \n  {}".format(srcfile, destfile))
             else:
                 # Only archive intermediate restarts if requested - otherwise remove them
@@ -462,7 +542,7 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                     destfile = os.path.join(archive_restdir, rfile)
                     expect(os.path.isfile(srcfile),
                            "restart file {} does not exist ".format(srcfile))
-                    archive_file_fn(srcfile, destfile)
+                    _archive_file(rundir_index, archive_file_fn, srcfile, destfile)
                     logger.info("moving file {} to {}".format(srcfile, destfile))
 
                     # need to copy the history files needed for interim restarts - since
@@ -473,13 +553,13 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                         expect(os.path.isfile(srcfile),
                                "hist file {} does not exist ".format(srcfile))
                         logger.info("copying {} to {}".format(srcfile, destfile))
-                        safe_copy(srcfile, destfile)
+                        copy_fn(srcfile, destfile)
                 else:
                     if compname == 'nemo':
-                        flist = glob.glob(rundir + "/" + casename + "_*_restart*.nc")
+                        flist = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_*_restart*.nc")]
                         logger.debug("nemo restart file {}".format(flist))
                         if len(flist) > 2:
-                            flist0 = glob.glob(rundir + "/" + casename + "_*_restart_0000.nc")
+                            flist0 = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_*_restart_0000.nc")]
                             if len(flist0) > 1:
                                 rstfl01 = flist0[0]
                                 rstfl01spl = rstfl01.split("/")
@@ -498,23 +578,16 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                                 rsttm02 = rstfl02nmspl[-3]
 
                                 if int(rsttm01) > int(rsttm02):
-                                    restlist = glob.glob(rundir + "/" + casename + "_" + rsttm02  + "_restart_*.nc")
+                                    restlist = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_" + rsttm02  + "_restart_*.nc")]
                                 else:
-                                    restlist = glob.glob(rundir + "/" + casename + "_" + rsttm01  + "_restart_*.nc")
+                                    restlist = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_" + rsttm01  + "_restart_*.nc")]
                                 logger.debug("nemo restart list {}".format(restlist))
                                 if restlist:
                                     for _restfile in restlist:
                                         srcfile = os.path.join(rundir, _restfile)
-                                        logger.info("removing interim restart file {}".format(srcfile))
-                                        if (os.path.isfile(srcfile)):
-                                            try:
-                                                os.remove(srcfile)
-                                            except OSError:
-                                                logger.warning("unable to remove interim restart file {}".format(srcfile))
-                                        else:
-                                            logger.warning("interim restart file {} does not exist".format(srcfile))
+                                        _remove_rundir_file(rundir_index, srcfile)
                         elif len(flist) == 2:
-                            flist0 = glob.glob(rundir + "/" + casename + "_*_restart.nc")
+                            flist0 = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_*_restart.nc")]
                             if len(flist0) > 1:
                                 rstfl01 = flist0[0]
                                 rstfl01spl = rstfl01.split("/")
@@ -533,44 +606,42 @@ def _archive_restarts_date_comp(case, casename, rundir, archive, archive_entry,
                                 rsttm02 = rstfl02nmspl[-2]
 
                                 if int(rsttm01) > int(rsttm02):
-                                    restlist = glob.glob(rundir + "/" + casename + "_" + rsttm02  + "_restart_*.nc")
+                                    restlist = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_" + rsttm02  + "_restart_*.nc")]
                                 else:
-                                    restlist = glob.glob(rundir + "/" + casename + "_" + rsttm01  + "_restart_*.nc")
+                                    restlist = [os.path.join(rundir, f) for f in rundir_index.glob(casename + "_" + rsttm01  + "_restart_*.nc")]
                                 logger.debug("nemo restart list {}".format(restlist))
                                 if restlist:
                                     for _rfile in restlist:
                                         srcfile = os.path.join(rundir, _rfile)
-                                        logger.info("removing interim restart file {}".format(srcfile))
-                                        if (os.path.isfile(srcfile)):
-                                            try:
-                                                os.remove(srcfile)
-                                            except OSError:
-                                                logger.warning("unable to remove interim restart file {}".format(srcfile))
-                                        else:
-                                            logger.warning("interim restart file {} does not exist".format(srcfile))
+                                        _remove_rundir_file(rundir_index, srcfile)
                         else:
                             logger.warning("unable to find NEMO restart file in {}".format(rundir))
 
 
                     else:
                         srcfile = os.path.join(rundir, rfile)
-                        logger.info("removing interim restart file {}".format(srcfile))
-                        if (os.path.isfile(srcfile)):
-                            try:
-                                os.remove(srcfile)
-                            except OSError:
-                                logger.warning("unable to remove interim restart file {}".format(srcfile))
-                        else:
-                            logger.warning("interim restart file {} does not exist".format(srcfile))
+                        _remove_rundir_file(rundir_index, srcfile)
 
     return histfiles_savein_rundir
 
 ###############################################################################
 def _archive_process(case, archive, last_date, archive_incomplete_logs, copy_only,
-                     components=None,dout_s_root=None, casename=None, rundir=None, testonly=False):
+                     components=None,dout_s_root=None, casename=None, rundir=None, testonly=False,
+                     transfer_threads=DEFAULT_TRANSFER_THREADS, manifest=None):
 ###############################################################################
     """
     Parse config_archive.xml and perform short term archiving
+
+    Files are moved and copied by transfer_threads threads. Restart and
+    rpointer files, and the history files they need, are all archived
+    before any history file is moved out of the run directory.
+
+    If manifest is given, the files that are archived with archive_file_fn
+    (logs, interim restarts and history files) are only recorded in it, and
+    it is committed once everything else is archived.
+
+    Log and history files are compressed on the way as set by
+    log_file_compression (of drv) and hist_file_compression in env_archive.xml
     """
 
     logger.debug('In archive_process...')
@@ -586,42 +657,68 @@ def _archive_process(case, archive, last_date, archive_incomplete_logs, copy_onl
         components.append('drv')
         components.append('dart')
 
-    archive_file_fn = _get_archive_file_fn(copy_only)
-
-    # archive log files
-    _archive_log_files(dout_s_root, rundir,
-                       archive_incomplete_logs, archive_file_fn)
-
-    # archive restarts and all necessary associated files (e.g. rpointer files)
-    datenames = _get_datenames(casename, rundir)
-    logger.debug("datenames {} ".format(datenames))
-    histfiles_savein_rundir_by_compname = {}
-    for datename in datenames:
-        datename_is_last = False
-        if datename == datenames[-1]:
-            datename_is_last = True
-
-        logger.debug("datename {} last_date {}".format(datename,last_date))
-        if last_date is None or datename <= last_date:
-            archive_restdir = join(dout_s_root, 'rest', _datetime_str(datename))
-
-            histfiles_savein_rundir_by_compname_this_date = _archive_restarts_date(
-                case, casename, rundir, archive, datename, datename_is_last,
-                last_date, archive_restdir, archive_file_fn, components, testonly=testonly)
-            if datename_is_last:
-                histfiles_savein_rundir_by_compname = histfiles_savein_rundir_by_compname_this_date
-
-    # archive history files
-
-    for (_, compname, compclass) in _get_component_archive_entries(components, archive):
-        if compclass:
-            logger.info('Archiving history files for {} ({})'.format(compname, compclass))
-            histfiles_savein_rundir = histfiles_savein_rundir_by_compname.get(compname, [])
-            logger.debug("_archive_process: histfiles_savein_rundir {} ".format(histfiles_savein_rundir))
-            _archive_history_files(archive,
-                                   compclass, compname, histfiles_savein_rundir,
-                                   last_date, archive_file_fn,
-                                   dout_s_root, casename, rundir)
+    # finish what an earlier, interrupted st_archive committed
+    run_manifests(dout_s_root, transfer_threads)
+
+    # list the run directory once for every query below
+    rundir_index = RunDirIndex(rundir)
+
+    # files of manifests still run by an earlier st_archive are left to it
+    for src_path in get_claimed_files(dout_s_root):
+        if os.path.dirname(os.path.abspath(src_path)) == os.path.abspath(rundir):
+            rundir_index.discard(os.path.basename(src_path))
+
+    with FileTransfer(num_threads=transfer_threads) as transfer:
+        archive_target = transfer if manifest is None else manifest
+        archive_file_fn = _get_archive_file_fn(copy_only, archive_target)
+        compress_fn = functools.partial(archive_target.compress, keep_source=copy_only)
+
+        # archive log files
+        _archive_log_files(dout_s_root, rundir,
+                           archive_incomplete_logs, archive_file_fn, rundir_index,
+                           compression=archive.get_file_compression(archive.get_entry("drv"), "log"),
+                           compress_fn=compress_fn)
+
+        # archive restarts and all necessary associated files (e.g. rpointer files)
+        datenames = _get_datenames(casename, rundir, rundir_index=rundir_index)
+        logger.debug("datenames {} ".format(datenames))
+        histfiles_savein_rundir_by_compname = {}
+        for datename in datenames:
+            datename_is_last = False
+            if datename == datenames[-1]:
+                datename_is_last = True
+
+            logger.debug("datename {} last_date {}".format(datename,last_date))
+            if last_date is None or datename <= last_date:
+                archive_restdir = join(dout_s_root, 'rest', _datetime_str(datename))
+
+                histfiles_savein_rundir_by_compname_this_date = _archive_restarts_date(
+                    case, casename, rundir, archive, datename, datename_is_last,
+                    last_date, archive_restdir, archive_file_fn, components, testonly=testonly,
+                    rundir_index=rundir_index, copy_fn=transfer.copy)
+                if datename_is_last:
+                    histfiles_savein_rundir_by_compname = histfiles_savein_rundir_by_compname_this_date
+
+        # the history files copied with the restarts must be in place before
+        # history files are moved
+        transfer.wait()
+
+        # archive history files
+
+        for (_, compname, compclass) in _get_component_archive_entries(components, archive):
+            if compclass:
+                logger.info('Archiving history files for {} ({})'.format(compname, compclass))
+                histfiles_savein_rundir = histfiles_savein_rundir_by_compname.get(compname, [])
+                logger.debug("_archive_process: histfiles_savein_rundir {} ".format(histfiles_savein_rundir))
+                _archive_history_files(archive,
+                                       compclass, compname, histfiles_savein_rundir,
+                                       last_date, archive_file_fn,
+                                       dout_s_root, casename, rundir, rundir_index,
+                                       copy_fn=transfer.copy, compress_fn=compress_fn,
+                                       copy_compress_fn=functools.partial(transfer.compress, keep_source=True))
+
+    if manifest is not None:
+        manifest.commit(dout_s_root)
 
 ###############################################################################
 def restore_from_archive(self, rest_dir=None, dout_s_root=None, rundir=None, test=False):
@@ -676,7 +773,8 @@ def archive_last_restarts(self, archive_restdir, rundir, last_date=None, link_to
     """
     archive = self.get_env('archive')
     casename = self.get_value("CASE")
-    datenames = _get_datenames(casename, rundir)
+    rundir_index = RunDirIndex(rundir)
+    datenames = _get_datenames(casename, rundir, rundir_index=rundir_index)
     expect(len(datenames) >= 1, "No restart dates found")
     last_datename = datenames[-1]
 
@@ -684,22 +782,30 @@ def archive_last_restarts(self, archive_restdir, rundir, last_date=None, link_to
     # set of restart files, but needed to satisfy the following interface
     archive_file_fn = _get_archive_file_fn(copy_only=False)
 
-    _ = _archive_restarts_date(case=self,
-                               casename=casename,
-                               rundir=rundir,
-                               archive=archive,
-                               datename=last_datename,
-                               datename_is_last=True,
-                               last_date=last_date,
-                               archive_restdir=archive_restdir,
-                               archive_file_fn=archive_file_fn,
-                               link_to_last_restart_files=link_to_restart_files)
+    with FileTransfer() as transfer:
+        _ = _archive_restarts_date(case=self,
+                                   casename=casename,
+                                   rundir=rundir,
+                                   archive=archive,
+                                   datename=last_datename,
+                                   datename_is_last=True,
+                                   last_date=last_date,
+                                   archive_restdir=archive_restdir,
+                                   archive_file_fn=archive_file_fn,
+                                   link_to_last_restart_files=link_to_restart_files,
+                                   rundir_index=rundir_index,
+                                   copy_fn=transfer.copy)
 
 ###############################################################################
-def case_st_archive(self, last_date_str=None, archive_incomplete_logs=True, copy_only=False, resubmit=True):
+def case_st_archive(self, last_date_str=None, archive_incomplete_logs=True, copy_only=False, resubmit=True,
+                    transfer_threads=DEFAULT_TRANSFER_THREADS):
 ###############################################################################
     """
-    Create archive object and perform short term archiving
+    Create archive object and perform short term archiving, moving files
+    with transfer_threads threads
+
+    With DOUT_S_ARCHIVE_BEHIND, files the next run segment does not need are
+    only archived after the case was resubmitted.
     """
     logger.debug("resubmit {}".format(resubmit))
     caseroot = self.get_value("CASEROOT")
@@ -729,26 +835,34 @@ def case_st_archive(self, last_date_str=None, archive_incomplete_logs=True, copy
 
     logger.info("st_archive starting")
 
+    # resubmit case if appropriate
+    resubmit_cnt = self.get_value("RESUBMIT")
+    logger.debug("resubmit_cnt {} resubmit {}".format(resubmit_cnt, resubmit))
+    resubmit = resubmit and not self.get_value("EXTERNAL_WORKFLOW") and resubmit_cnt > 0
+    manifest = ArchiveManifest() if resubmit and self.get_value("DOUT_S_ARCHIVE_BEHIND") else None
+
     archive = self.get_env('archive')
-    functor = lambda: _archive_process(self, archive, last_date, archive_incomplete_logs, copy_only)
+    functor = lambda: _archive_process(self, archive, last_date, archive_incomplete_logs, copy_only,
+                                       transfer_threads=transfer_threads, manifest=manifest)
     run_and_log_case_status(functor, "st_archive", caseroot=caseroot)
 
     logger.info("st_archive completed")
 
-    # resubmit case if appropriate
-    if not self.get_value("EXTERNAL_WORKFLOW"):
-        resubmit_cnt = self.get_value("RESUBMIT")
-        logger.debug("resubmit_cnt {} resubmit {}".format(resubmit_cnt, resubmit))
-        if resubmit_cnt > 0 and resubmit:
-            logger.info("resubmitting from st_archive, resubmit={:d}".format(resubmit_cnt))
-            if self.get_value("MACH") == "mira":
-                expect(os.path.isfile(".original_host"), "ERROR alcf host file not found")
-                with open(".original_host", "r") as fd:
-                    sshhost = fd.read()
-                run_cmd("ssh cooleylogin1 ssh {} '{case}/case.submit {case} --resubmit' "\
-                        .format(sshhost, case=caseroot), verbose=True)
-            else:
-                self.submit(resubmit=True)
+    if resubmit:
+        logger.info("resubmitting from st_archive, resubmit={:d}".format(resubmit_cnt))
+        if self.get_value("MACH") == "mira":
+            expect(os.path.isfile(".original_host"), "ERROR alcf host file not found")
+            with open(".original_host", "r") as fd:
+                sshhost = fd.read()
+            run_cmd("ssh cooleylogin1 ssh {} '{case}/case.submit {case} --resubmit' "\
+                    .format(sshhost, case=caseroot), verbose=True)
+        else:
+            self.submit(resubmit=True)
+
+    if manifest is not None:
+        # archive the remaining files while the next segment runs
+        functor = lambda: run_manifests(dout_s_root, transfer_threads)
+        run_and_log_case_status(functor, "st_archive_behind", caseroot=caseroot)
 
     return True
 
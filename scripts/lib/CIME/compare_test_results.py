@@ -67,9 +67,8 @@ def compare_test_results(baseline_name, baseline_root, test_root, compiler, test
 
     all_pass_or_skip = True
 
-    for test_status_file in test_status_files:
+    for test_status_file, ts in zip(test_status_files, load_test_statuses(test_status_files)):
         test_dir = os.path.dirname(test_status_file)
-        ts = TestStatus(test_dir=test_dir)
         test_name = ts.get_name()
         if (compare_tests in [[], None] or CIME.utils.match_any(test_name, compare_tests)):
 
@@ -6,7 +6,7 @@ of the tests in one or more test suites
 from __future__ import print_function
 from CIME.XML.standard_module_setup import *
 from CIME.XML.expected_fails_file import ExpectedFailsFile
-from CIME.test_status import TestStatus
+from CIME.test_status import load_test_statuses
 import os
 import sys
 from collections import defaultdict
@@ -45,9 +45,8 @@ def cs_status(test_paths, summary=False, fails_only=False,
     xfails = _get_xfails(expected_fails_filepath)
     test_id_output = defaultdict(str)
     test_id_counts = defaultdict(int)
-    for test_path in test_paths:
+    for test_path, ts in zip(test_paths, load_test_statuses(test_paths)):
         test_dir=os.path.dirname(test_path)
-        ts = TestStatus(test_dir=test_dir)
         test_id = os.path.basename(test_dir).split(".")[-1]
         if summary:
             output = _overall_output(ts, "  {status} {test_name}\n")
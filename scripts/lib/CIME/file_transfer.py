@@ -0,0 +1,361 @@
+"""
+Concurrent file moves and copies for the short term archiver.
+
+Moving a multi-GB history file from RUNDIR to a DOUT_S_ROOT on another
+file system is a full copy, so archiving one file at a time leaves most of
+the file system bandwidth unused. A FileTransfer runs moves and copies on
+a bounded pool of worker threads. Moves within a file system are renames,
+copies use the kernel (reflink, copy_file_range or sendfile) where it can
+so the data does not pass through python. Files can also be compressed
+on their way to the archive, see compress.
+
+Operations are queued in order but may finish in any order; call wait()
+before anything that depends on earlier operations having completed.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.utils import safe_copy
+
+import errno, gzip, shutil, threading, time, zlib
+from distutils.spawn import find_executable
+from six.moves import queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRANSFER_THREADS = 4
+
+# Values of hist_file_compression and log_file_compression in env_archive.xml
+COMPRESSION_METHODS = ("none", "gzip", "deflate")
+
+_GZIP_LEVEL = 6
+_DEFLATE_LEVEL = 1
+
+# ioctl to share the data blocks of a file on btrfs, xfs and similar
+_FICLONE = 0x40049409
+_COPY_CHUNK = 64 * 1024 * 1024
+
+def _reflink(fsrc, fdst):
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import fcntl
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except (ImportError, IOError, OSError):
+        return False
+
+def _kernel_copy(copy_fn, fsrc, fdst, size):
+    """
+    Copy size bytes with copy_fn(src_fd, dst_fd, offset, count). Returns False,
+    without having written anything, if the kernel cannot do this copy, and
+    raises an error if it stops before size bytes were copied.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            copied = copy_fn(fsrc.fileno(), fdst.fileno(), offset, min(_COPY_CHUNK, size - offset))
+        except OSError as e:
+            if offset == 0 and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                                           errno.ENOTSUP, errno.EBADF):
+                return False
+            raise
+        if copied == 0:
+            if offset == 0:
+                return False
+            raise IOError("Copied only {:d} of {:d} bytes of {}".format(offset, size, fsrc.name))
+        offset += copied
+
+    return True
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset_src=offset) # pylint: disable=no-member
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count) # pylint: disable=no-member
+
+def copy_file_data(src_path, tgt_path):
+    """
+    Copy the contents of src_path to a new or truncated tgt_path, letting the
+    kernel move the data where possible. Returns the method that was used.
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> src = os.path.join(tmpdir, "src")
+    >>> with open(src, "w") as fd:
+    ...     _ = fd.write("x" * 1000)
+    >>> copy_file_data(src, os.path.join(tmpdir, "tgt")) in ["reflink", "copy_file_range", "sendfile", "read"]
+    True
+    >>> open(os.path.join(tmpdir, "tgt")).read() == "x" * 1000
+    True
+    >>> shutil.rmtree(tmpdir)
+    """
+    with open(src_path, "rb") as fsrc, open(tgt_path, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if size > 0 and _reflink(fsrc, fdst):
+            return "reflink"
+        if hasattr(os, "copy_file_range") and _kernel_copy(_copy_file_range, fsrc, fdst, size):
+            return "copy_file_range"
+        if hasattr(os, "sendfile") and _kernel_copy(_sendfile, fsrc, fdst, size):
+            return "sendfile"
+        shutil.copyfileobj(fsrc, fdst, _COPY_CHUNK)
+        return "read"
+
+def get_compressed_name(path, method):
+    """
+    Returns the name of path once compressed with method
+
+    >>> get_compressed_name("case.cam.h0.0001-01.nc", "gzip")
+    'case.cam.h0.0001-01.nc.gz'
+    >>> get_compressed_name("case.cam.h0.0001-01.nc", "deflate")
+    'case.cam.h0.0001-01.nc'
+    """
+    return path + ".gz" if method == "gzip" else path
+
+def _crc_file(fd):
+    crc, size = 0, 0
+    for chunk in iter(lambda: fd.read(_COPY_CHUNK), b""):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+    return crc, size
+
+def gzip_file(src_path, tgt_path):
+    """
+    Gzip src_path to tgt_path and check that tgt_path decompresses to the
+    same data. zlib releases the GIL, so this runs in parallel on threads.
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> src = os.path.join(tmpdir, "cpl.log.1")
+    >>> with open(src, "w") as fd:
+    ...     _ = fd.write("model output " * 1000)
+    >>> gzip_file(src, src + ".gz")
+    >>> os.path.getsize(src + ".gz") < 1000
+    True
+    >>> shutil.rmtree(tmpdir)
+    """
+    crc, size = 0, 0
+    with open(src_path, "rb") as fsrc:
+        fdst = gzip.GzipFile(tgt_path, "wb", _GZIP_LEVEL, mtime=int(os.fstat(fsrc.fileno()).st_mtime))
+        try:
+            for chunk in iter(lambda: fsrc.read(_COPY_CHUNK), b""):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                fdst.write(chunk)
+        finally:
+            fdst.close()
+
+    with gzip.open(tgt_path, "rb") as fd:
+        if _crc_file(fd) != (crc, size):
+            raise IOError("{} does not decompress to {}".format(tgt_path, src_path))
+
+def _ncdump_header(path):
+    # the first line holds the file name
+    return run_cmd_no_fail("ncdump -h {}".format(path)).split("\n", 1)[-1]
+
+def deflate_netcdf(src_path, tgt_path):
+    """
+    Write src_path to tgt_path as a deflated netCDF-4 file with nccopy and
+    check that both files have the same header
+    """
+    run_cmd_no_fail("nccopy -d {:d} -s {} {}".format(_DEFLATE_LEVEL, src_path, tgt_path))
+    if _ncdump_header(src_path) != _ncdump_header(tgt_path):
+        raise IOError("Header of {} differs from {}".format(tgt_path, src_path))
+
+def check_compression_method(method):
+    """
+    Returns method, or none if the tools it needs are not available
+
+    >>> check_compression_method("gzip")
+    'gzip'
+    """
+    expect(method in COMPRESSION_METHODS, "Unknown compression method {}, expected one of {}".format(
+        method, ", ".join(COMPRESSION_METHODS)))
+    if method == "deflate" and not (find_executable("nccopy") and find_executable("ncdump")):
+        logger.warning("nccopy or ncdump not found, archiving files without deflating them")
+        return "none"
+    return method
+
+def _same_file_system(src_path, tgt_path):
+    tgt_dir = os.path.dirname(os.path.abspath(tgt_path))
+    return os.stat(src_path).st_dev == os.stat(tgt_dir).st_dev
+
+class FileTransfer(object):
+    """
+    Bounded pool of threads moving, copying and compressing files. Use as
+    a context manager, leaving the context waits for all queued operations.
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> for name in ["a", "b"]:
+    ...     with open(os.path.join(tmpdir, name), "w") as fd:
+    ...         _ = fd.write(name)
+    >>> os.mkdir(os.path.join(tmpdir, "archive"))
+    >>> with FileTransfer(num_threads=2) as transfer:
+    ...     transfer.move(os.path.join(tmpdir, "a"), os.path.join(tmpdir, "archive", "a"))
+    ...     transfer.copy(os.path.join(tmpdir, "b"), os.path.join(tmpdir, "archive", "b"))
+    >>> sorted(os.listdir(tmpdir)), sorted(os.listdir(os.path.join(tmpdir, "archive")))
+    (['archive', 'b'], ['a', 'b'])
+    >>> sorted(transfer.get_stats())
+    ['copy', 'rename']
+    >>> transfer = FileTransfer(num_threads=2)
+    >>> transfer.move(os.path.join(tmpdir, "missing"), os.path.join(tmpdir, "archive", "missing"))
+    >>> transfer.wait() # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+        ...
+    CIMEError: ERROR: 1 file operations failed, first: move missing
+    >>> transfer.close()
+    >>> shutil.rmtree(tmpdir)
+    """
+
+    def __init__(self, num_threads=DEFAULT_TRANSFER_THREADS):
+        expect(num_threads >= 1, "Need at least one transfer thread, got {}".format(num_threads))
+        self._num_threads = num_threads
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._errors = []
+        # operation type -> [files, bytes, seconds]
+        self._stats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if exc[0] is None:
+                self.wait()
+        finally:
+            self.close()
+
+    def move(self, src_path, tgt_path):
+        """
+        Queue moving src_path to tgt_path, like shutil.move
+        """
+        self._submit(self._move, src_path, tgt_path)
+
+    def copy(self, src_path, tgt_path):
+        """
+        Queue copying src_path to tgt_path, like CIME.utils.safe_copy
+        """
+        self._submit(self._copy, src_path, tgt_path)
+
+    def compress(self, src_path, tgt_path, method, keep_source=False):
+        """
+        Queue compressing src_path to tgt_path with method, gzip or deflate,
+        src_path is removed once tgt_path is checked unless keep_source
+        """
+        self._submit(self._compress, src_path, tgt_path, method, keep_source)
+
+    def _submit(self, fn, src_path, tgt_path, *args):
+        if len(self._threads) < self._num_threads:
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        self._queue.put((fn, src_path, tgt_path, args))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                fn, src_path, tgt_path, args = item
+                try:
+                    fn(src_path, tgt_path, *args)
+                except Exception as e: # pylint: disable=broad-except
+                    with self._lock:
+                        self._errors.append("{} {} to {}: {}".format(fn.__name__.lstrip("_"), src_path, tgt_path, e))
+            finally:
+                self._queue.task_done()
+
+    def _record(self, op_type, num_bytes, start_time):
+        elapsed = time.time() - start_time
+        with self._lock:
+            stats = self._stats.setdefault(op_type, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += num_bytes
+            stats[2] += elapsed
+
+    def _move(self, src_path, tgt_path):
+        start_time = time.time()
+        size = os.path.getsize(src_path)
+        if _same_file_system(src_path, tgt_path):
+            os.rename(src_path, tgt_path)
+            self._record("rename", size, start_time)
+        else:
+            copy_file_data(src_path, tgt_path)
+            shutil.copystat(src_path, tgt_path)
+            tgt_size = os.path.getsize(tgt_path)
+            if tgt_size != size:
+                raise IOError("{} has {:d} bytes, {} has {:d}".format(tgt_path, tgt_size, src_path, size))
+            os.remove(src_path)
+            self._record("move", size, start_time)
+
+    def _copy(self, src_path, tgt_path):
+        start_time = time.time()
+        size = os.path.getsize(src_path)
+        tgt_path = os.path.join(tgt_path, os.path.basename(src_path)) if os.path.isdir(tgt_path) else tgt_path
+        if os.path.exists(tgt_path):
+            # safe_copy knows how to deal with read-only and foreign targets
+            safe_copy(src_path, tgt_path)
+        else:
+            copy_file_data(src_path, tgt_path)
+            shutil.copystat(src_path, tgt_path)
+        self._record("copy", size, start_time)
+
+    def _compress(self, src_path, tgt_path, method, keep_source):
+        start_time = time.time()
+        size = os.path.getsize(src_path)
+        # Only complete, checked files get the final name
+        tmp_path = tgt_path + ".tmp"
+        try:
+            if method == "gzip":
+                gzip_file(src_path, tmp_path)
+            else:
+                expect(method == "deflate", "Unknown compression method {}".format(method))
+                deflate_netcdf(src_path, tmp_path)
+            shutil.copystat(src_path, tmp_path)
+            os.rename(tmp_path, tgt_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        logger.debug("{} compressed to {:.0f}% in {}".format(src_path, 100. * os.path.getsize(tgt_path) / max(size, 1), tgt_path))
+        if not keep_source:
+            os.remove(src_path)
+        self._record(method, size, start_time)
+
+    def wait(self):
+        """
+        Wait until all queued operations are done, raise an error if any failed
+        """
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        expect(not errors, "{:d} file operations failed, first: {}".format(len(errors), errors[0] if errors else ""))
+
+    def close(self):
+        """
+        Stop the worker threads once queued operations are done and log the
+        transfer rates
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        for op_type, (num_files, num_bytes, seconds) in sorted(self._stats.items()):
+            logger.info("{}: {:d} files, {:.1f} MB in {:.1f} s, {:.1f} MB/s".format(
+                op_type, num_files, num_bytes / 1.e6, seconds, num_bytes / 1.e6 / max(seconds, 1.e-6)))
+
+    def get_stats(self):
+        """
+        Returns {operation type : (files, bytes, seconds)}, where operation type
+        is rename, move (across file systems), copy, gzip or deflate, and bytes
+        are counted before compression
+        """
+        with self._lock:
+            return dict((op_type, tuple(stats)) for op_type, stats in self._stats.items())
@@ -4,6 +4,7 @@ Functions for actions pertaining to history files.
 from CIME.XML.standard_module_setup import *
 from CIME.test_status import TEST_NO_BASELINES_COMMENT, TEST_STATUS_FILENAME
 from CIME.utils import get_current_commit, get_timestamp, get_model, safe_copy, SharedArea, parse_test_name
+from CIME.rundir_index import RunDirIndex
 
 import logging, os, re, filecmp
 logger = logging.getLogger(__name__)
@@ -56,9 +57,10 @@ def copy_histfiles(case, suffix):
     archive = case.get_env("archive")
     comments = "Copying hist files to suffix '{}'\n".format(suffix)
     num_copied = 0
+    rundir_index = RunDirIndex(rundir)
     for model in _iter_model_file_substrs(case):
         comments += "  Copying hist files for model '{}'\n".format(model)
-        test_hists = archive.get_latest_hist_files(casename, model, rundir, ref_case=ref_case)
+        test_hists = archive.get_latest_hist_files(casename, model, rundir, ref_case=ref_case, dir_index=rundir_index)
         num_copied += len(test_hists)
         for test_hist in test_hists:
             test_hist = os.path.join(rundir,test_hist)
@@ -222,12 +224,14 @@ def _compare_hists(case, from_dir1, from_dir2, suffix1="", suffix2="", outfile_s
     multiinst_driver_compare = False
     archive = case.get_env('archive')
     ref_case = case.get_value("RUN_REFCASE")
+    dir_index1 = RunDirIndex(from_dir1)
+    dir_index2 = dir_index1 if from_dir2 == from_dir1 else RunDirIndex(from_dir2)
     for model in _iter_model_file_substrs(case):
         if model == 'cpl' and suffix2 == 'multiinst':
             multiinst_driver_compare = True
         comments += "  comparing model '{}'\n".format(model)
-        hists1 = archive.get_latest_hist_files(casename, model, from_dir1, suffix=suffix1, ref_case=ref_case)
-        hists2 = archive.get_latest_hist_files(casename, model, from_dir2, suffix=suffix2, ref_case=ref_case)
+        hists1 = archive.get_latest_hist_files(casename, model, from_dir1, suffix=suffix1, ref_case=ref_case, dir_index=dir_index1)
+        hists2 = archive.get_latest_hist_files(casename, model, from_dir2, suffix=suffix2, ref_case=ref_case, dir_index=dir_index2)
 
         if len(hists1) == 0 and len(hists2) == 0:
             comments += "    no hist files found for model {}\n".format(model)
@@ -457,10 +461,11 @@ def _generate_baseline_impl(case, baseline_dir=None, allow_baseline_overwrite=Fa
 
     comments = "Generating baselines into '{}'\n".format(basegen_dir)
     num_gen = 0
+    rundir_index = RunDirIndex(rundir)
     for model in _iter_model_file_substrs(case):
         comments += "  generating for model '{}'\n".format(model)
 
-        hists =  archive.get_latest_hist_files(testcase, model, rundir, ref_case=ref_case)
+        hists =  archive.get_latest_hist_files(testcase, model, rundir, ref_case=ref_case, dir_index=rundir_index)
         logger.debug("latest_files: {}".format(hists))
         num_gen += len(hists)
         for hist in hists:
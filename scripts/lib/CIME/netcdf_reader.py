@@ -0,0 +1,261 @@
+"""
+Minimal netCDF reader for small variables of model output files.
+
+Some tools only need the header or one small variable of a netCDF file,
+for instance the names of the history files recorded in a restart file.
+Running ncdump for that formats every value of the requested variable as
+text and needs a netCDF installation in the environment of the tool.
+NetCDFFile parses the header of classic, 64-bit offset and CDF-5 files
+itself and reads a variable by seeking straight to its data.
+
+netCDF-4 (HDF5) files are read with the netCDF4 python module when it is
+installed, read_char_variable raises NetCDFError for them otherwise.
+"""
+from CIME.XML.standard_module_setup import *
+
+import six, struct
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+_HDF5_MAGIC = b"\x89HDF\r\n\x1a\n"
+
+_NC_DIMENSION = 10
+_NC_VARIABLE = 11
+_NC_ATTRIBUTE = 12
+
+# numrecs of a file still being written
+_STREAMING = (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF)
+
+# nc_type -> (name, struct format, size)
+_NC_TYPES = {
+    1  : ("byte", "b", 1),
+    2  : ("char", "c", 1),
+    3  : ("short", "h", 2),
+    4  : ("int", "i", 4),
+    5  : ("float", "f", 4),
+    6  : ("double", "d", 8),
+    7  : ("ubyte", "B", 1),
+    8  : ("ushort", "H", 2),
+    9  : ("uint", "I", 4),
+    10 : ("int64", "q", 8),
+    11 : ("uint64", "Q", 8),
+}
+
+Variable = namedtuple("Variable", ["name", "dimensions", "shape", "attributes", "nc_type", "begin", "is_record"])
+
+class NetCDFError(Exception):
+    pass
+
+class NetCDFFile(object):
+    """
+    Header of a classic (CDF-1), 64-bit offset (CDF-2) or CDF-5 netCDF file,
+    the file is only kept open while reading.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fd:
+            self._fd = fd
+            try:
+                self._read_header()
+            finally:
+                self._fd = None
+
+    def _read(self, size):
+        data = self._fd.read(size)
+        if len(data) != size:
+            raise NetCDFError("{}: truncated header".format(self.path))
+        return data
+
+    def _unpack(self, fmt, size):
+        return struct.unpack(">" + fmt, self._read(size))[0]
+
+    def _read_int(self):
+        return self._unpack("i", 4)
+
+    def _read_count(self):
+        """Read a NON_NEG, which is 64 bits wide in CDF-5"""
+        return self._unpack("Q", 8) if self.version == 5 else self._unpack("I", 4)
+
+    def _read_name(self):
+        length = self._read_count()
+        name = self._read(length)
+        self._read(-length % 4)
+        return name.decode("utf-8")
+
+    def _read_values(self, nc_type, count):
+        if nc_type not in _NC_TYPES:
+            raise NetCDFError("{}: unknown type {}".format(self.path, nc_type))
+        _, fmt, size = _NC_TYPES[nc_type]
+        data = self._read(count * size)
+        self._read(-(count * size) % 4)
+        if nc_type == 2:
+            return data.decode("utf-8", "replace").rstrip("\0")
+        return list(struct.unpack(">{:d}{}".format(count, fmt), data))
+
+    def _read_list(self, tag, read_item):
+        list_tag = self._read_int()
+        count = self._read_count()
+        if list_tag == 0 and count == 0:
+            return []
+        if list_tag != tag:
+            raise NetCDFError("{}: unexpected tag {} in header".format(self.path, list_tag))
+        return [read_item() for _ in range(count)]
+
+    def _read_dimension(self):
+        return self._read_name(), self._read_count()
+
+    def _read_attribute(self):
+        name = self._read_name()
+        nc_type = self._read_int()
+        return name, self._read_values(nc_type, self._read_count())
+
+    def _read_variable(self):
+        name = self._read_name()
+        dimids = [self._read_count() for _ in range(self._read_count())]
+        attributes = OrderedDict(self._read_list(_NC_ATTRIBUTE, self._read_attribute))
+        nc_type = self._read_int()
+        self._read_count() # vsize, too small for large variables, recomputed from the shape
+        begin = self._unpack("i", 4) if self.version == 1 else self._unpack("q", 8)
+
+        if any(dimid >= len(self._dim_names) for dimid in dimids):
+            raise NetCDFError("{}: bad dimension id for {}".format(self.path, name))
+        dims = [self._dim_names[dimid] for dimid in dimids]
+        shape = tuple(self.dimensions[dim] for dim in dims)
+        is_record = bool(dims) and dims[0] == self._record_dim
+        return name, Variable(name, tuple(dims), shape, attributes, nc_type, begin, is_record)
+
+    def _read_header(self):
+        magic = self._fd.read(4)
+        if magic[:3] != b"CDF" or magic[3:] not in (b"\x01", b"\x02", b"\x05"):
+            if magic + self._fd.read(4) == _HDF5_MAGIC:
+                raise NetCDFError("{} is a netCDF-4 file".format(self.path))
+            raise NetCDFError("{} is not a netCDF file".format(self.path))
+
+        self.version = ord(magic[3:])
+        self.numrecs = self._read_count()
+        if self.numrecs in _STREAMING:
+            self.numrecs = None
+        dimensions = self._read_list(_NC_DIMENSION, self._read_dimension)
+        self._dim_names = [name for name, _ in dimensions]
+        self._record_dim = None
+        self.dimensions = OrderedDict()
+        for name, length in dimensions:
+            if length == 0:
+                self._record_dim = name
+                length = self.numrecs
+            self.dimensions[name] = length
+
+        self.attributes = OrderedDict(self._read_list(_NC_ATTRIBUTE, self._read_attribute))
+        self.variables = OrderedDict(self._read_list(_NC_VARIABLE, self._read_variable))
+
+    def _record_size(self):
+        record_vars = [var for var in self.variables.values() if var.is_record]
+        sizes = [_product(var.shape[1:]) * _NC_TYPES[var.nc_type][2] for var in record_vars]
+        if len(sizes) == 1:
+            # a lone record variable is not padded
+            return sizes[0]
+        return sum(size + (-size % 4) for size in sizes)
+
+    def read_variable(self, name):
+        """
+        Returns the values of variable name as a flat list in C order, or as
+        a byte string for char variables
+        """
+        if name not in self.variables:
+            raise NetCDFError("{}: no variable {}".format(self.path, name))
+
+        var = self.variables[name]
+        _, fmt, size = _NC_TYPES[var.nc_type]
+        with open(self.path, "rb") as fd:
+            if var.is_record:
+                if self.numrecs is None:
+                    raise NetCDFError("{}: number of records is unknown".format(self.path))
+                record_bytes = _product(var.shape[1:]) * size
+                record_size = self._record_size()
+                chunks = []
+                for record in range(self.numrecs):
+                    fd.seek(var.begin + record * record_size)
+                    chunks.append(fd.read(record_bytes))
+                data = b"".join(chunks)
+                num_bytes = record_bytes * self.numrecs
+            else:
+                num_bytes = _product(var.shape) * size
+                fd.seek(var.begin)
+                data = fd.read(num_bytes)
+
+        if len(data) != num_bytes:
+            raise NetCDFError("{}: data of {} is truncated".format(self.path, name))
+
+        if var.nc_type == 2:
+            return data
+        return list(struct.unpack(">{:d}{}".format(num_bytes // size, fmt), data))
+
+    def read_strings(self, name):
+        """
+        Returns the strings held by a char variable, one for each index of
+        its leading dimensions, without trailing NULs and blanks
+        """
+        var = self.variables.get(name)
+        if var is None or var.nc_type != 2:
+            raise NetCDFError("{}: no char variable {}".format(self.path, name))
+
+        data = self.read_variable(name)
+        length = var.shape[-1] if var.shape else 1
+        if length == 0:
+            return []
+        return [data[i:i+length].decode("utf-8", "replace").rstrip("\0 ")
+                for i in range(0, len(data), length)]
+
+def _product(shape):
+    result = 1
+    for length in shape:
+        result *= length
+    return result
+
+def _read_netcdf4_strings(path, varname):
+    try:
+        import netCDF4 # pylint: disable=import-error
+    except ImportError as e:
+        six.raise_from(NetCDFError("{} is a netCDF-4 file and the netCDF4 python module is not available".format(path)), e)
+
+    with netCDF4.Dataset(path) as dataset:
+        if varname not in dataset.variables:
+            raise NetCDFError("{}: no variable {}".format(path, varname))
+        var = dataset.variables[varname]
+        var.set_auto_mask(False)
+        var.set_auto_chartostring(False)
+        values = var[:]
+        length = values.shape[-1] if values.ndim else 1
+        data = values.tobytes()
+        return [data[i:i+length].decode("utf-8", "replace").rstrip("\0 ")
+                for i in range(0, len(data), length)]
+
+def read_char_variable(path, varname):
+    """
+    Returns the strings held by the char variable varname of the netCDF file
+    at path, raises NetCDFError if they cannot be read.
+
+    >>> import tempfile, shutil
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> path = os.path.join(tmpdir, "case.cam.r.0001-01-02-00000.nc")
+    >>> with open(path, "wb") as fd:
+    ...     _ = fd.write(b"CDF\\x01" + struct.pack(">4i", 0, _NC_DIMENSION, 2, 6))
+    ...     _ = fd.write(b"ntapes\\0\\0" + struct.pack(">2i", 2, 4) + b"nlen" + struct.pack(">i", 8))
+    ...     _ = fd.write(struct.pack(">5i", 0, 0, _NC_VARIABLE, 1, 5) + b"nhfil\\0\\0\\0")
+    ...     _ = fd.write(struct.pack(">8i", 2, 0, 1, 0, 0, 2, 16, 128))
+    ...     _ = fd.seek(128)
+    ...     _ = fd.write(b"h0.nc\\0\\0\\0" + b"h1.nc   ")
+    >>> read_char_variable(path, "nhfil")
+    ['h0.nc', 'h1.nc']
+    >>> NetCDFFile(path).dimensions
+    OrderedDict([('ntapes', 2), ('nlen', 8)])
+    >>> shutil.rmtree(tmpdir)
+    """
+    with open(path, "rb") as fd:
+        is_hdf5 = fd.read(len(_HDF5_MAGIC)) == _HDF5_MAGIC
+    if is_hdf5:
+        return _read_netcdf4_strings(path, varname)
+
+    return NetCDFFile(path).read_strings(varname)
@@ -457,6 +457,90 @@ def save_test_time(baseline_root, test, time_seconds):
             # We NEVER want a failure here to kill the run
             logger.warning("Failed to store test time: {}".format(sys.exc_info()[1]))
 
+_PHASE_TIMES_FILE_NAME  = "phasetimes"
+_PHASE_MEMORY_FILE_NAME = "phasememory"
+_PHASE_HISTORY_LENGTH   = 20
+
+def _read_phase_history(baseline_root, test, file_name, what):
+    """
+    Return {phase -> value} with the most recent value saved for each phase
+    of test. Each line of the history holds space-separated PHASE=value items.
+    """
+    if baseline_root is not None:
+        try:
+            the_path = os.path.join(baseline_root, _WALLTIME_BASELINE_NAME, test, file_name)
+            if os.path.exists(the_path):
+                phase_values = {}
+                with open(the_path, "r") as fd:
+                    for line in fd:
+                        for item in line.split():
+                            phase, value = item.split("=")
+                            phase_values[phase] = int(value)
+
+                return phase_values
+
+        except Exception:
+            # We NEVER want a failure here to kill the run
+            logger.warning("Failed to read test phase {}: {}".format(what, sys.exc_info()[1]))
+
+    return {}
+
+def _save_phase_history(baseline_root, test, file_name, what, phase_values):
+    """
+    Append the {phase -> value} measured for test to its history, which
+    keeps the last _PHASE_HISTORY_LENGTH entries
+    """
+    if baseline_root is not None and phase_values:
+        try:
+            with SharedArea():
+                the_dir = os.path.join(baseline_root, _WALLTIME_BASELINE_NAME, test)
+                if not os.path.exists(the_dir):
+                    os.makedirs(the_dir)
+
+                the_path = os.path.join(the_dir, file_name)
+                lines = []
+                if os.path.exists(the_path):
+                    with open(the_path, "r") as fd:
+                        lines = fd.readlines()[-(_PHASE_HISTORY_LENGTH - 1):]
+
+                lines.append("{}\n".format(" ".join("{}={:d}".format(phase, int(value))
+                                                    for phase, value in sorted(phase_values.items()))))
+                # Readers never see a partly written history
+                tmp_path = "{}.{:d}".format(the_path, os.getpid())
+                with open(tmp_path, "w") as fd:
+                    fd.writelines(lines)
+                os.rename(tmp_path, the_path)
+
+        except Exception:
+            # We NEVER want a failure here to kill the run
+            logger.warning("Failed to store test phase {}: {}".format(what, sys.exc_info()[1]))
+
+def get_test_phase_times_based_on_past(baseline_root, test):
+    """
+    Return {phase -> seconds} with the most recent time saved for each phase of test
+    """
+    return _read_phase_history(baseline_root, test, _PHASE_TIMES_FILE_NAME, "times")
+
+def save_test_phase_times(baseline_root, test, phase_times):
+    """
+    Append the {phase -> seconds} measured for test to its phase time history
+    """
+    _save_phase_history(baseline_root, test, _PHASE_TIMES_FILE_NAME, "times", phase_times)
+
+def get_test_phase_memory_based_on_past(baseline_root, test):
+    """
+    Return {phase -> peak resident bytes} with the most recent peak saved for
+    each phase of test
+    """
+    return _read_phase_history(baseline_root, test, _PHASE_MEMORY_FILE_NAME, "memory")
+
+def save_test_phase_memory(baseline_root, test, phase_memory):
+    """
+    Append the {phase -> peak resident bytes} measured for test to its phase
+    memory history
+    """
+    _save_phase_history(baseline_root, test, _PHASE_MEMORY_FILE_NAME, "memory", phase_memory)
+
 _SUCCESS_BASELINE_NAME = "success-history"
 _SUCCESS_FILE_NAME     = "last-transitions"
 
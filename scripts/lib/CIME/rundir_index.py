@@ -0,0 +1,94 @@
+"""
+In-memory listing of a run directory.
+
+Long runs leave tens of thousands of files in RUNDIR and the short term
+archiver and history comparisons look for files there with many different
+patterns. A RunDirIndex lists the directory once and answers every query
+from memory; callers that move or remove files tell the index so later
+queries do not see them.
+"""
+from CIME.XML.standard_module_setup import *
+
+import fnmatch
+
+logger = logging.getLogger(__name__)
+
+class RunDirIndex(object):
+    """
+    >>> import tempfile, shutil
+    >>> rundir = tempfile.mkdtemp()
+    >>> for name in ["case.cpl.r.0001-01-02-00000.nc", "case.clm2_0001.r.0001-01-02-00000.nc",
+    ...              "case.clm2.h0.0001-01.nc", "cpl.log.1234.gz", "rpointer.drv", ".hidden"]:
+    ...     open(os.path.join(rundir, name), "w").close()
+    >>> index = RunDirIndex(rundir)
+    >>> index.glob("case.cpl.r.*.nc")
+    ['case.cpl.r.0001-01-02-00000.nc']
+    >>> index.glob("*")
+    ['case.clm2.h0.0001-01.nc', 'case.clm2_0001.r.0001-01-02-00000.nc', 'case.cpl.r.0001-01-02-00000.nc', 'cpl.log.1234.gz', 'rpointer.drv']
+    >>> index.component_files("case", "clm")
+    ['case.clm2.h0.0001-01.nc', 'case.clm2_0001.r.0001-01-02-00000.nc']
+    >>> index.search(r"\\.r\\.", names=index.component_files("case", "clm"))
+    ['case.clm2_0001.r.0001-01-02-00000.nc']
+    >>> index.discard("case.clm2.h0.0001-01.nc")
+    >>> index.component_files("case", "clm")
+    ['case.clm2_0001.r.0001-01-02-00000.nc']
+    >>> "rpointer.drv" in index, "case.clm2.h0.0001-01.nc" in index
+    (True, False)
+    >>> shutil.rmtree(rundir)
+    """
+
+    def __init__(self, rundir):
+        expect(os.path.isdir(rundir), 'Cannot open directory {} '.format(rundir))
+        self.rundir = rundir
+        self._names = set(os.listdir(rundir))
+        self._regexes = {}
+        self._search_cache = {}
+        self._glob_cache = {}
+        logger.debug("Indexed {:d} files in {}".format(len(self._names), rundir))
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def _current(self, names):
+        return sorted(name for name in names if name in self._names)
+
+    def search(self, pattern, names=None):
+        """
+        Return the sorted names, of all files or of names, that the regex
+        pattern matches anywhere
+        """
+        regex = self._regexes.get(pattern)
+        if regex is None:
+            regex = self._regexes[pattern] = re.compile(pattern)
+
+        if names is not None:
+            return [name for name in names if regex.search(name)]
+
+        if pattern not in self._search_cache:
+            self._search_cache[pattern] = [name for name in self._names if regex.search(name)]
+        return self._current(self._search_cache[pattern])
+
+    def glob(self, pattern):
+        """
+        Return the sorted names matching the shell pattern. As with glob.glob,
+        hidden files only match patterns starting with '.'
+        """
+        if pattern not in self._glob_cache:
+            names = fnmatch.filter(self._names, pattern)
+            if not pattern.startswith("."):
+                names = [name for name in names if not name.startswith(".")]
+            self._glob_cache[pattern] = names
+        return self._current(self._glob_cache[pattern])
+
+    def component_files(self, casename, compname):
+        """
+        Return the sorted names of all files of component compname, with any
+        instance number, written by case casename
+        """
+        return self.search(r"^{}\.{}[\d_]*\.".format(casename, compname))
+
+    def discard(self, name):
+        """
+        Forget name, after it was moved or removed from the run directory
+        """
+        self._names.discard(name)
@@ -0,0 +1,180 @@
+"""
+Run the RUN phase of many tests inside a single batch allocation.
+
+On batch machines every test is normally submitted as its own job, for
+suites of many small tests the queue wait dominates. In bundle mode
+create_test writes a bundle file listing each test's case.submit command
+and node count, then submits one job that runs run_test_bundle. Inside the
+allocation the launcher runs the case.submit --no-batch commands
+concurrently, packing tests onto the allocation's nodes, and each test
+writes its TestStatus file exactly as a separately submitted test would.
+Placing concurrent tests on distinct nodes is left to the machine's MPI
+launcher.
+"""
+from CIME.XML.standard_module_setup import *
+from CIME.utils import expect, run_cmd_no_fail, get_cime_root, compute_total_time, \
+    convert_to_seconds, convert_to_babylonian_time
+from CIME.test_status import *
+
+import json, subprocess, time
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 1
+
+###############################################################################
+def get_bundle_file(test_root, test_id):
+###############################################################################
+    return os.path.join(test_root, "bundle.{}.json".format(test_id))
+
+###############################################################################
+def write_bundle(bundle_file, entries, num_nodes):
+###############################################################################
+    """
+    Write the bundle file. entries is a list of dicts with the keys test,
+    test_dir, cmd, nodes and walltime (seconds).
+    """
+    with open(bundle_file, "w") as fd:
+        json.dump({"num_nodes" : num_nodes, "tests" : entries}, fd, indent=2)
+
+###############################################################################
+def read_bundle(bundle_file):
+###############################################################################
+    """
+    Return (entries, num_nodes) from a bundle file
+    """
+    with open(bundle_file, "r") as fd:
+        bundle = json.load(fd)
+    return bundle["tests"], bundle["num_nodes"]
+
+###############################################################################
+def estimate_bundle_time(entries, num_nodes):
+###############################################################################
+    """
+    Seconds needed to run all entries when packed onto num_nodes nodes
+
+    >>> entries = [{"test" : "A", "nodes" : 2, "walltime" : 3000},
+    ...            {"test" : "B", "nodes" : 1, "walltime" : 1000},
+    ...            {"test" : "C", "nodes" : 1, "walltime" : 1000}]
+    >>> estimate_bundle_time(entries, 4)
+    3060
+    >>> estimate_bundle_time(entries, 2)
+    4140
+    """
+    return compute_total_time(dict((entry["test"], (entry["nodes"], entry["walltime"])) for entry in entries),
+                              num_nodes)
+
+###############################################################################
+def _launch_test(entry):
+###############################################################################
+    log = open(os.path.join(entry["test_dir"], TEST_STATUS_FILENAME + ".log"), "a")
+    try:
+        return subprocess.Popen(entry["cmd"], shell=True, cwd=entry["test_dir"],
+                                stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+###############################################################################
+def _fail_run(entry, comment):
+###############################################################################
+    """
+    Mark RUN as failed if the test did not get far enough to do it itself
+    """
+    ts = TestStatus(test_dir=entry["test_dir"], test_name=entry["test"])
+    if ts.get_status(RUN_PHASE) in [None, TEST_PEND_STATUS]:
+        with ts:
+            ts.set_status(RUN_PHASE, TEST_FAIL_STATUS, comments=comment)
+
+###############################################################################
+def run_bundle(entries, num_nodes, launch=_launch_test, poll_interval=POLL_INTERVAL_SEC):
+###############################################################################
+    """
+    Run the cmd of every entry in its test_dir, never using more than
+    num_nodes nodes at once. The biggest tests are started first and smaller
+    ones fill the nodes left over. launch(entry) must return an object with
+    the poll() and returncode of subprocess.Popen.
+
+    Return True if every command succeeded.
+    """
+    success = True
+    waiting = []
+    for entry in entries:
+        if entry["nodes"] > num_nodes:
+            logger.warning("Test {} needs {:d} nodes, bundle only has {:d}".format(entry["test"], entry["nodes"], num_nodes))
+            _fail_run(entry, "needs {:d} nodes, bundle has {:d}".format(entry["nodes"], num_nodes))
+            success = False
+        else:
+            waiting.append(entry)
+
+    waiting.sort(key=lambda entry: (-entry["nodes"] * entry["walltime"], entry["test"]))
+    running = [] # [(process, entry)]
+    free_nodes = num_nodes
+    while waiting or running:
+        for entry in list(waiting):
+            if entry["nodes"] <= free_nodes:
+                logger.info("Starting {} on {:d} of {:d} free nodes".format(entry["test"], entry["nodes"], free_nodes))
+                running.append((launch(entry), entry))
+                waiting.remove(entry)
+                free_nodes -= entry["nodes"]
+
+        finished = [(process, entry) for process, entry in running if process.poll() is not None]
+        for process, entry in finished:
+            running.remove((process, entry))
+            free_nodes += entry["nodes"]
+            if process.returncode != 0:
+                logger.warning("Test {} failed with return code {:d}".format(entry["test"], process.returncode))
+                _fail_run(entry, "bundle launch failed")
+                success = False
+            else:
+                logger.info("Finished {}".format(entry["test"]))
+
+        if not finished and running:
+            time.sleep(poll_interval)
+
+    return success
+
+###############################################################################
+def submit_bundle(case, bundle_file, num_nodes, wall_time=None, queue=None, job_id=None):
+###############################################################################
+    """
+    Submit a job running the bundle in bundle_file on num_nodes nodes, using
+    the batch settings of case.test from case. wall_time (seconds) defaults
+    to an estimate from the walltimes of the bundled tests.
+    """
+    entries = read_bundle(bundle_file)[0]
+    env_batch = case.get_env("batch")
+    tasks_per_node = case.get_value("MAX_MPITASKS_PER_NODE")
+
+    if wall_time is None:
+        wall_time = estimate_bundle_time(entries, num_nodes)
+    wall_time_bab = convert_to_babylonian_time(int(wall_time))
+
+    qnode = env_batch.select_best_queue(num_nodes, num_nodes * tasks_per_node, name=queue, walltime=wall_time_bab)
+    expect(qnode is not None, "No queue for a bundle of {:d} nodes and walltime {}".format(num_nodes, wall_time_bab))
+    wall_time_max_bab = env_batch.get_queue_specs(qnode)[3]
+    if wall_time_max_bab is not None and convert_to_seconds(wall_time_max_bab) < wall_time:
+        logger.warning("Bundle walltime {} exceeds queue limit {}".format(wall_time_bab, wall_time_max_bab))
+        wall_time_bab = wall_time_max_bab
+
+    overrides = {
+        "job_id" : "test_bundle" if job_id is None else job_id,
+        "num_nodes" : num_nodes,
+        "tasks_per_node": tasks_per_node,
+        "totaltasks" : tasks_per_node * num_nodes,
+        "job_wallclock_time": wall_time_bab,
+        "job_queue": env_batch.text(qnode)
+        }
+    directives = env_batch.get_batch_directives(case, "case.test", overrides=overrides)
+
+    script = "#! /bin/bash\n"
+    script += "\n{}\n".format(directives)
+    script += "cd {}\n".format(os.path.dirname(os.path.abspath(bundle_file)))
+    script += "{} {} --num-nodes {:d}\n".format(os.path.join(get_cime_root(), "scripts", "Tools", "run_test_bundle"),
+                                                 os.path.abspath(bundle_file), num_nodes)
+
+    submit_cmd = "{} {}".format(env_batch.get_value("batch_submit", subgroup=None),
+                                env_batch.get_submit_args(case, "case.test"))
+    logger.info("Submitting bundle of {:d} tests on {:d} nodes".format(len(entries), num_nodes))
+    logger.debug("Script:\n{}".format(script))
+
+    return run_cmd_no_fail(submit_cmd, input_str=script)
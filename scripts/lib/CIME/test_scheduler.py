@@ -8,17 +8,21 @@ phases. All other phases need to handle their own status because
 they can be run outside the context of TestScheduler.
 """
 
-import traceback, stat, threading, time, glob
+import traceback, stat, threading, time, glob, bisect, json, select, signal, shutil
 from collections import OrderedDict
+from contextlib import contextmanager
 
 from CIME.XML.standard_module_setup import *
 import six
+from six.moves import queue as six_queue
 from get_tests import get_recommended_test_time, get_build_groups
 from CIME.utils import append_status, append_testlog, TESTS_FAILED_ERR_CODE, parse_test_name, get_full_test_name, get_model, \
-    convert_to_seconds, get_cime_root, get_project, get_timestamp, get_python_libs_root
+    convert_to_seconds, get_cime_root, get_project, get_timestamp, get_python_libs_root, get_cime_config, \
+    get_cime_default_driver, CIMEError
 from CIME.test_status import *
 from CIME.XML.machines import Machines
 from CIME.XML.generic_xml import GenericXML
+from CIME.XML.config_snapshot import config_snapshot, get_config_snapshot
 from CIME.XML.env_test import EnvTest
 from CIME.XML.env_mach_pes import EnvMachPes
 from CIME.XML.files import Files
@@ -26,11 +30,14 @@ from CIME.XML.component import Component
 from CIME.XML.tests import Tests
 from CIME.case import Case
 from CIME.wait_for_tests import wait_for_tests
-from CIME.provenance import get_recommended_test_time_based_on_past
+from CIME.provenance import get_recommended_test_time_based_on_past, get_test_phase_times_based_on_past, \
+    save_test_phase_times, get_test_phase_memory_based_on_past, save_test_phase_memory
 from CIME.locked_files import lock_file
 from CIME.cs_status_creator import create_cs_status
 from CIME.hist_utils import generate_teststatus
+from CIME.test_status_index import create_test_status_index
 from CIME.build import post_build
+from CIME.test_bundle import get_bundle_file, write_bundle, submit_bundle
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +46,153 @@ TEST_START = "INIT" # Special pseudo-phase just for test_scheduler bookkeeping
 PHASES = [TEST_START, CREATE_NEWCASE_PHASE, XML_PHASE, SETUP_PHASE,
           SHAREDLIB_BUILD_PHASE, MODEL_BUILD_PHASE, RUN_PHASE] # Order matters
 
+# The create_newcase option for each Case.create argument set by TestScheduler
+_CREATE_NEWCASE_FLAGS = {"grid_name"     : "--res",
+                         "compset_name"  : "--compset",
+                         "machine_name"  : "--machine",
+                         "compiler"      : "--compiler",
+                         "project"       : "--project",
+                         "output_root"   : "--output-root",
+                         "input_dir"     : "--input-dir",
+                         "non_local"     : "--non-local",
+                         "workflowid"    : "--workflow",
+                         "pesfile"       : "--pesfile",
+                         "user_mods_dir" : "--user-mods-dir",
+                         "mpilib"        : "--mpilib",
+                         "ninst"         : "--ninst",
+                         "multi_driver"  : "--multi-driver",
+                         "pecount"       : "--pecount",
+                         "driver"        : "--driver",
+                         "queue"         : "--queue",
+                         "walltime"      : "--walltime"}
+
+# Seconds a case may take to be created in a child process before it is
+# considered deadlocked
+_CREATE_CASE_TIMEOUT = 600
+
+
+###############################################################################
+class _OtherThreadsFilter(logging.Filter):
+###############################################################################
+    """
+    Drops the messages logged by one thread
+    """
+
+    def __init__(self, ident):
+        logging.Filter.__init__(self)
+        self.ident = ident
+
+    def filter(self, record):
+        return record.thread != self.ident
+
+###############################################################################
+class _ThreadLogCapture(logging.Handler):
+###############################################################################
+    """
+    Collects the messages logged by one thread
+    """
+
+    def __init__(self, ident):
+        logging.Handler.__init__(self)
+        self.ident = ident
+        self.lines = []
+
+    def filter(self, record):
+        return record.thread == self.ident
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+###############################################################################
+@contextmanager
+def _capture_thread_logging():
+###############################################################################
+    """
+    Collect the messages logged by the calling thread rather than
+    printing them, other threads log as usual
+    """
+    capture = _ThreadLogCapture(threading.current_thread().ident)
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+    others = _OtherThreadsFilter(capture.ident)
+    for handler in handlers:
+        handler.addFilter(others)
+    root_logger.addHandler(capture)
+    try:
+        yield capture
+    finally:
+        root_logger.removeHandler(capture)
+        for handler in handlers:
+            handler.removeFilter(others)
+
+###############################################################################
+def _call_in_child(func, timeout=None):
+###############################################################################
+    """
+    Return func() called in a forked child process, so the changes it makes
+    to the working directory and environment never reach the other threads
+    of this one. The return value must be json serializable. Raises an
+    error, with the child's traceback if it has one, if func failed, the
+    child died or it did not finish within timeout seconds; the child is
+    killed then. A child forked from a multithreaded process deadlocks if
+    it needs a lock another thread held at the fork.
+
+    >>> _call_in_child(lambda: os.environ.setdefault("CIME_CHILD_VAR", "child"))
+    'child'
+    >>> "CIME_CHILD_VAR" in os.environ
+    False
+    >>> _call_in_child(lambda: os._exit(1)) # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+        ...
+    CIMEError: ERROR: Child process 1234 died without a result
+    >>> try:
+    ...     _call_in_child(lambda: 1 // 0)
+    ... except CIMEError as e:
+    ...     print(str(e).splitlines()[-1])
+    ZeroDivisionError: integer division or modulo by zero
+    >>> _call_in_child(lambda: time.sleep(10), timeout=0.1) # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+        ...
+    CIMEError: ERROR: Child process 1234 did not finish within 0.1 seconds
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            try:
+                output = json.dumps({"result" : func()})
+                status = 0
+            except BaseException: # pylint: disable=broad-except
+                output = json.dumps({"error" : traceback.format_exc()})
+            with os.fdopen(write_fd, "w") as fd:
+                fd.write(output)
+        finally:
+            os._exit(status) # pylint: disable=protected-access
+
+    os.close(write_fd)
+    deadline = None if timeout is None else time.time() + timeout
+    chunks = []
+    try:
+        while True:
+            wait = None if deadline is None else max(deadline - time.time(), 0)
+            if not select.select([read_fd], [], [], wait)[0]:
+                os.kill(pid, signal.SIGKILL)
+                expect(False, "Child process {:d} did not finish within {} seconds".format(pid, timeout))
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+    expect(chunks, "Child process {:d} died without a result".format(pid))
+    output = json.loads(b"".join(chunks).decode("utf-8"))
+    expect("error" not in output, "Child process {:d} failed:\n{}".format(pid, output.get("error", "").rstrip()))
+    return output["result"]
+
 ###############################################################################
 def _translate_test_names_for_new_pecount(test_names, force_procs, force_threads):
 ###############################################################################
@@ -101,10 +255,156 @@ def _get_time_est(test, baseline_root, as_int=False, use_cache=False, raw=False)
 
     return recommended_time
 
+_PHASE_TIME_CACHE = {}
+###############################################################################
+def _get_phase_time_ests(test, baseline_root):
+###############################################################################
+    """
+    Return {phase -> estimated seconds} for test from its phase time history.
+    Without history, the run phase falls back to the recommended walltime and
+    the other phases are left out.
+    """
+    if test not in _PHASE_TIME_CACHE:
+        phase_times = get_test_phase_times_based_on_past(baseline_root, test)
+        if RUN_PHASE not in phase_times:
+            phase_times[RUN_PHASE] = _get_time_est(test, baseline_root, as_int=True, use_cache=True, raw=True)
+
+        _PHASE_TIME_CACHE[test] = phase_times
+
+    return _PHASE_TIME_CACHE[test]
+
+_PHASE_MEMORY_CACHE = {}
+###############################################################################
+def _get_phase_memory_ests(test, baseline_root):
+###############################################################################
+    """
+    Return {phase -> estimated peak resident bytes} for test from its phase
+    memory history
+    """
+    if test not in _PHASE_MEMORY_CACHE:
+        _PHASE_MEMORY_CACHE[test] = get_test_phase_memory_based_on_past(baseline_root, test)
+
+    return _PHASE_MEMORY_CACHE[test]
+
+###############################################################################
+def _read_meminfo(field):
+###############################################################################
+    """
+    Return the bytes for field in /proc/meminfo, or None where it cannot be read
+    """
+    try:
+        with open("/proc/meminfo", "r") as fd:
+            for line in fd:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+###############################################################################
+class _MemorySampler(threading.Thread):
+###############################################################################
+    """
+    Samples the resident memory of the commands run for each test phase and
+    keeps the peak. A phase's command is found as the child of this process
+    running in the test directory, its memory is that of its process tree.
+    """
+
+    def __init__(self, interval=1.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._peaks = {} # test dir -> peak bytes
+
+    def start_phase(self, test_dir):
+        with self._lock:
+            self._peaks[os.path.realpath(test_dir)] = 0
+
+    def end_phase(self, test_dir):
+        """
+        Return the peak resident bytes seen for test_dir since start_phase
+        """
+        with self._lock:
+            return self._peaks.pop(os.path.realpath(test_dir), 0)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        while not self._stop_event.wait(self._interval):
+            with self._lock:
+                test_dirs = list(self._peaks)
+            if test_dirs:
+                usage = self._sample(test_dirs)
+                with self._lock:
+                    for test_dir, rss in six.iteritems(usage):
+                        if test_dir in self._peaks:
+                            self._peaks[test_dir] = max(self._peaks[test_dir], rss)
+
+    def _sample(self, test_dirs):
+        """
+        Return {test dir -> resident bytes} for the process trees running in test_dirs
+        """
+        children, rss = {}, {}
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join("/proc", pid, "stat"), "r") as fd:
+                    # The command name may contain spaces, fields after it don't
+                    ppid = int(fd.read().rsplit(")", 1)[1].split()[1])
+                with open(os.path.join("/proc", pid, "statm"), "r") as fd:
+                    rss[int(pid)] = int(fd.read().split()[1]) * page_size
+            except (IOError, OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(pid))
+
+        usage = {}
+        for pid in children.get(os.getpid(), []):
+            try:
+                cwd = os.readlink(os.path.join("/proc", str(pid), "cwd"))
+            except OSError:
+                continue
+            if cwd in test_dirs:
+                total, stack = 0, [pid]
+                while stack:
+                    next_pid = stack.pop()
+                    total += rss.get(next_pid, 0)
+                    stack.extend(children.get(next_pid, []))
+                usage[cwd] = usage.get(cwd, 0) + total
+
+        return usage
+
+###############################################################################
+def _get_time_from_comment(comment):
+###############################################################################
+    """
+    Return the seconds in the time= item of a TestStatus comment, or None
+
+    >>> _get_time_from_comment("time=454")
+    454
+    >>> _get_time_from_comment("Time=42 extra")
+    42
+    >>> _get_time_from_comment("")
+    """
+    for token in ("" if comment is None else comment).split():
+        if token.lower().startswith("time="):
+            try:
+                return int(token.split("=")[1])
+            except ValueError:
+                return None
+
+    return None
+
 ###############################################################################
 def _order_tests_by_runtime(tests, baseline_root):
 ###############################################################################
-    tests.sort(key=lambda x: _get_time_est(x, baseline_root, as_int=True, use_cache=True, raw=True), reverse=True)
+    tests.sort(key=lambda x: sum(_get_phase_time_ests(x, baseline_root).values()), reverse=True)
 
 ###############################################################################
 class TestScheduler(object):
@@ -123,9 +423,11 @@ class TestScheduler(object):
                  allow_baseline_overwrite=False, output_root=None,
                  force_procs=None, force_threads=None, mpilib=None,
                  input_dir=None, pesfile=None, mail_user=None, mail_type=None, allow_pnl=False,
-                 non_local=False, single_exe=False, workflow=None):
+                 non_local=False, single_exe=False, workflow=None, in_process_create=True,
+                 mem_reserve=None, bundle_nodes=None):
     ###########################################################################
         self._cime_root       = get_cime_root()
+        self._cime_config     = get_cime_config()
         self._cime_model      = get_model()
         self._cime_driver     = "mct"
         self._save_timing     = save_timing
@@ -140,6 +442,14 @@ class TestScheduler(object):
         self._non_local       = non_local
         self._build_groups    = []
         self._workflow        = workflow
+        # Forking from the worker threads needs the at-fork lock handling
+        self._in_process_create = in_process_create and hasattr(os, "register_at_fork")
+        self._phase_times     = {} # Format:  {test_name -> {phase -> seconds}}
+        self._phase_memory    = {} # Format:  {test_name -> {phase -> peak bytes}}
+        self._sharedlib_configs = {} # Format:  {test_name -> sharedlib config}
+        self._sharedlib_configs_built = set()
+        self._bundle_nodes    = bundle_nodes
+        self._bundled_tests   = [] # Format:  [(test_name, run command)]
 
         self._mail_user = mail_user
         self._mail_type = mail_type
@@ -172,6 +482,8 @@ class TestScheduler(object):
         self._no_batch = no_batch or not self._machobj.has_batch_system()
         expect(not (self._no_batch and self._queue is not None),
                "Does not make sense to request a queue without batch system")
+        expect(not (self._no_batch and self._bundle_nodes),
+               "Does not make sense to bundle tests without batch system")
 
         # Determine and resolve test_root
         if test_root is not None:
@@ -241,6 +553,8 @@ class TestScheduler(object):
         self._tests = OrderedDict()
         for test_name in test_names:
             self._tests[test_name] = (TEST_START, TEST_PASS_STATUS)
+            self._phase_times[test_name] = {}
+            self._phase_memory[test_name] = {}
 
         # Oversubscribe by 1/4
         if proc_pool is None:
@@ -251,6 +565,20 @@ class TestScheduler(object):
 
         self._procs_avail = self._proc_pool
 
+        # Memory budget, phases are held back when the memory available on
+        # this node would drop below the reserve. Not enforced where the
+        # available memory cannot be read.
+        mem_total = _read_meminfo("MemTotal")
+        mem_available = _read_meminfo("MemAvailable")
+        if mem_total is None or mem_available is None:
+            self._mem_reserve = None
+            self._mem_avail = None
+        else:
+            self._mem_reserve = mem_total // 10 if mem_reserve is None else int(mem_reserve) * 1024 * 1024
+            self._mem_avail = mem_available - self._mem_reserve
+        self._mem_in_flight = {} # test_name -> estimated bytes
+        self._mem_sampler = None
+
         # Setup phases
         self._phases = list(PHASES)
         if self._no_setup:
@@ -412,8 +740,15 @@ class TestScheduler(object):
     ###########################################################################
     def _shell_cmd_for_phase(self, test, cmd, phase, from_dir=None):
     ###########################################################################
+        sampler = self._mem_sampler if from_dir is not None else None
         while True:
-            rc, output, errput = run_cmd(cmd, from_dir=from_dir)
+            if sampler is not None:
+                sampler.start_phase(from_dir)
+            try:
+                rc, output, errput = run_cmd(cmd, from_dir=from_dir)
+            finally:
+                peak_memory = sampler.end_phase(from_dir) if sampler is not None else 0
+
             if rc != 0:
                 self._log_output(test,
                                  "{} FAILED for test '{}'.\nCommand: {}\nOutput: {}\n".
@@ -427,6 +762,9 @@ class TestScheduler(object):
                 else:
                     return False, errput
             else:
+                if peak_memory > 0:
+                    self._phase_memory[test][phase] = peak_memory
+
                 # We don't want "RUN PASSED" in the TestStatus.log if the only thing that
                 # succeeded was the submission.
                 phase = "SUBMIT" if phase == RUN_PHASE else phase
@@ -437,33 +775,33 @@ class TestScheduler(object):
                 return True, errput
 
     ###########################################################################
-    def _create_newcase_phase(self, test):
+    def _get_create_newcase_args(self, test):
     ###########################################################################
-        test_dir = self._get_test_dir(test)
-
+        """
+        Return the create_newcase options for test as Case.create keyword
+        arguments, or None and an error message if the test is bad
+        """
         _, case_opts, grid, compset,\
             machine, compiler, test_mods = parse_test_name(test)
 
-        create_newcase_cmd = "{} --case {} --res {} --compset {}"\
-                             " --test".format(os.path.join(self._cime_root, "scripts", "create_newcase"),
-                                              test_dir, grid, compset)
+        create_args = OrderedDict([("grid_name", grid), ("compset_name", compset)])
         if machine is not None:
-            create_newcase_cmd += " --machine {}".format(machine)
+            create_args["machine_name"] = machine
         if compiler is not None:
-            create_newcase_cmd += " --compiler {}".format(compiler)
+            create_args["compiler"] = compiler
         if self._project is not None:
-            create_newcase_cmd += " --project {} ".format(self._project)
+            create_args["project"] = self._project
         if self._output_root is not None:
-            create_newcase_cmd += " --output-root {} ".format(self._output_root)
+            create_args["output_root"] = self._output_root
         if self._input_dir is not None:
-            create_newcase_cmd += " --input-dir {} ".format(self._input_dir)
+            create_args["input_dir"] = self._input_dir
         if self._non_local:
-            create_newcase_cmd += " --non-local"
+            create_args["non_local"] = True
         if self._workflow:
-            create_newcase_cmd += " --workflow {}".format(self._workflow)
+            create_args["workflowid"] = self._workflow
 
         if self._pesfile is not None:
-            create_newcase_cmd += " --pesfile {} ".format(self._pesfile)
+            create_args["pesfile"] = self._pesfile
 
         if test_mods is not None:
             files = Files(comp_interface=self._cime_driver)
@@ -471,18 +809,14 @@ class TestScheduler(object):
             if test_mods.find('/') != -1:
                 (component, modspath) = test_mods.split('/', 1)
             else:
-                error = "Missing testmod component. Testmods are specified as '${component}-${testmod}'"
-                self._log_output(test, error)
-                return False, error
+                return None, "Missing testmod component. Testmods are specified as '${component}-${testmod}'"
 
             testmods_dir = files.get_value("TESTS_MODS_DIR", {"component": component})
             test_mod_file = os.path.join(testmods_dir, component, modspath)
             if not os.path.exists(test_mod_file):
-                error = "Missing testmod file '{}'".format(test_mod_file)
-                self._log_output(test, error)
-                return False, error
+                return None, "Missing testmod file '{}'".format(test_mod_file)
 
-            create_newcase_cmd += " --user-mods-dir {}".format(test_mod_file)
+            create_args["user_mods_dir"] = test_mod_file
 
         mpilib = None
         ninst = 1
@@ -491,32 +825,32 @@ class TestScheduler(object):
             for case_opt in case_opts: # pylint: disable=not-an-iterable
                 if case_opt.startswith('M'):
                     mpilib = case_opt[1:]
-                    create_newcase_cmd += " --mpilib {}".format(mpilib)
+                    create_args["mpilib"] = mpilib
                     logger.debug (" MPILIB set to {}".format(mpilib))
                 elif case_opt.startswith('N'):
                     expect(ncpl == 1,"Cannot combine _C and _N options")
                     ninst = case_opt[1:]
-                    create_newcase_cmd += " --ninst {}".format(ninst)
+                    create_args["ninst"] = int(ninst)
                     logger.debug (" NINST set to {}".format(ninst))
                 elif case_opt.startswith('C'):
                     expect(ninst == 1,"Cannot combine _C and _N options")
                     ncpl = case_opt[1:]
-                    create_newcase_cmd += " --ninst {} --multi-driver" .format(ncpl)
+                    create_args["ninst"] = int(ncpl)
+                    create_args["multi_driver"] = True
                     logger.debug (" NCPL set to {}" .format(ncpl))
                 elif case_opt.startswith('P'):
-                    pesize = case_opt[1:]
-                    create_newcase_cmd += " --pecount {}".format(pesize)
+                    create_args["pecount"] = case_opt[1:]
                 elif case_opt.startswith('V'):
                     self._cime_driver = case_opt[1:]
-                    create_newcase_cmd += " --driver {}".format(self._cime_driver)
+                    create_args["driver"] = self._cime_driver
 
         # create_test mpilib option overrides default but not explicitly set case_opt mpilib
         if mpilib is None and self._mpilib is not None:
-            create_newcase_cmd += " --mpilib {}".format(self._mpilib)
+            create_args["mpilib"] = self._mpilib
             logger.debug (" MPILIB set to {}".format(self._mpilib))
 
         if self._queue is not None:
-            create_newcase_cmd += " --queue={}".format(self._queue)
+            create_args["queue"] = self._queue
         else:
             # We need to hard code the queue for this test on cheyenne
             # otherwise it runs in share and fails intermittently
@@ -524,28 +858,108 @@ class TestScheduler(object):
             if test_case == "NODEFAIL":
                 machine = machine if machine is not None else self._machobj.get_machine_name()
                 if machine == "cheyenne":
-                    create_newcase_cmd += " --queue=regular"
+                    create_args["queue"] = "regular"
 
         if self._walltime is not None:
-            create_newcase_cmd += " --walltime {}".format(self._walltime)
+            create_args["walltime"] = self._walltime
         else:
             # model specific ways of setting time
             if self._cime_model == "e3sm":
                 recommended_time = _get_time_est(test, self._baseline_root)
 
                 if recommended_time is not None:
-                    create_newcase_cmd += " --walltime {}".format(recommended_time)
+                    create_args["walltime"] = recommended_time
 
             else:
                 if test in self._test_data and "options" in self._test_data[test] and \
                         "wallclock" in self._test_data[test]['options']:
-                    create_newcase_cmd += " --walltime {}".format(self._test_data[test]['options']['wallclock'])
+                    create_args["walltime"] = self._test_data[test]['options']['wallclock']
         if test in self._test_data and "options" in self._test_data[test] and \
                         "workflow" in self._test_data[test]['options']:
-            create_newcase_cmd += " --workflow {}".format(self._test_data[test]['options']['workflow'])
+            create_args["workflowid"] = self._test_data[test]['options']['workflow']
+
+        return create_args, None
+
+    ###########################################################################
+    def _get_create_newcase_cmd(self, test, create_args):
+    ###########################################################################
+        create_newcase_cmd = "{} --case {} --test".format(os.path.join(self._cime_root, "scripts", "create_newcase"),
+                                                          self._get_test_dir(test))
+        for arg, value in create_args.items():
+            if value is True:
+                create_newcase_cmd += " {}".format(_CREATE_NEWCASE_FLAGS[arg])
+            else:
+                create_newcase_cmd += " {} {}".format(_CREATE_NEWCASE_FLAGS[arg], value)
 
-        logger.debug("Calling create_newcase: " + create_newcase_cmd)
-        return self._shell_cmd_for_phase(test, create_newcase_cmd, CREATE_NEWCASE_PHASE)
+        return create_newcase_cmd
+
+    ###########################################################################
+    def _create_newcase_phase(self, test):
+    ###########################################################################
+        create_args, error = self._get_create_newcase_args(test)
+        if create_args is None:
+            self._log_output(test, error)
+            return False, error
+
+        create_newcase_cmd = self._get_create_newcase_cmd(test, create_args)
+        if not self._in_process_create:
+            logger.debug("Calling create_newcase: " + create_newcase_cmd)
+            return self._shell_cmd_for_phase(test, create_newcase_cmd, CREATE_NEWCASE_PHASE)
+
+        logger.debug("Creating case in a child process, equivalent to: " + create_newcase_cmd)
+        test_dir = self._get_test_dir(test)
+        create_args = dict(create_args)
+        if "input_dir" in create_args:
+            create_args["input_dir"] = os.path.abspath(create_args["input_dir"])
+        elif self._cime_config.has_option("main", "input_dir"):
+            create_args["input_dir"] = os.path.abspath(self._cime_config.get("main", "input_dir"))
+        create_args.setdefault("workflowid", self._cime_config.get("main", "workflow")
+                               if self._cime_config.has_option("main", "workflow") else "default")
+        create_args.setdefault("driver", get_cime_default_driver())
+        create_args.setdefault("walltime", os.getenv("CIME_GLOBAL_WALLTIME"))
+        create_args.setdefault("pecount", "M")
+        if "user_mods_dir" in create_args:
+            create_args["user_mods_dir"] = os.path.abspath(create_args["user_mods_dir"])
+        srcroot = self._cime_config.get("main", "srcroot") if self._cime_config.has_option("main", "srcroot") \
+                  else os.path.dirname(self._cime_root)
+
+        # Case creation changes the working directory and environment of the
+        # whole process, which other threads are launching phases from, so it
+        # is done in a forked child sharing the config files read so far
+        def create_case():
+            snapshot = get_config_snapshot()
+            known = set(snapshot.keys()) if snapshot is not None else set()
+            with _capture_thread_logging() as capture:
+                try:
+                    with Case(test_dir, read_only=False) as case:
+                        case.create(test_dir, os.path.abspath(srcroot), test=True, **create_args)
+                    success, errput = True, ""
+                except BaseException: # pylint: disable=broad-except
+                    success, errput = False, traceback.format_exc()
+            loaded = [key for key in snapshot.keys() if key not in known] if snapshot is not None else []
+            return success, errput, capture.lines, loaded
+
+        try:
+            success, errput, lines, loaded = _call_in_child(create_case, timeout=_CREATE_CASE_TIMEOUT)
+        except CIMEError as e:
+            # Such as a deadlock on a lock another thread held at the fork,
+            # which could happen again, so later cases are not forked either
+            logger.warning("Creating case for test '{}' in a child process failed, "
+                           "calling create_newcase instead: {}".format(test, e))
+            self._in_process_create = False
+            if os.path.isdir(test_dir):
+                shutil.rmtree(test_dir)
+            return self._shell_cmd_for_phase(test, create_newcase_cmd, CREATE_NEWCASE_PHASE)
+
+        # Read the config files the child had to parse, later children share them
+        for infile, schema in loaded:
+            GenericXML(infile, schema=schema)
+
+        self._log_output(test,
+                         "{} {} for test '{}'.\nCommand: {}\nOutput: {}\n".
+                         format(CREATE_NEWCASE_PHASE, "PASSED" if success else "FAILED", test,
+                                create_newcase_cmd, "\n".join(lines) + "\n" + errput))
+        return success, errput
 
     ###########################################################################
     def _xml_phase(self, test):
@@ -770,6 +1184,12 @@ class TestScheduler(object):
             if self._mail_type:
                 cmd += " -M={}".format(",".join(self._mail_type))
 
+            if self._bundle_nodes:
+                # Run later by the bundle job, see _submit_bundle
+                self._bundled_tests.append((test, cmd + " --no-batch"))
+                self._log_output(test, "{} for test '{}' added to test bundle".format(RUN_PHASE, test))
+                return True, ""
+
             return self._shell_cmd_for_phase(test, cmd, RUN_PHASE, from_dir=test_dir)
 
     ###########################################################################
@@ -785,7 +1205,7 @@ class TestScheduler(object):
             return False, errput
 
     ###########################################################################
-    def _get_procs_needed(self, test, phase, threads_in_flight=None, no_batch=False):
+    def _get_procs_needed(self, test, phase, jobs_in_flight=None, no_batch=False):
     ###########################################################################
         # For build pools, we must wait for the first case to complete XML, SHAREDLIB,
         # and MODEL_BUILD phases before the other cases can do those phases
@@ -806,13 +1226,18 @@ class TestScheduler(object):
 
         elif (phase == SHAREDLIB_BUILD_PHASE):
             if self._cime_model != "e3sm":
-                # Will force serialization of sharedlib builds
-                # TODO - instead of serializing, compute all library configs needed and build
-                # them all in parallel
-                for _, _, running_phase in threads_in_flight.values():
-                    if (running_phase == SHAREDLIB_BUILD_PHASE):
+                # Tests building the same shared libraries must take turns, the
+                # first one builds them and the rest find them up to date.
+                # Tests with different configs build in parallel.
+                config = self._get_sharedlib_config(test)
+                for running_test, (_, running_phase) in jobs_in_flight.items():
+                    if running_phase == SHAREDLIB_BUILD_PHASE and \
+                       self._get_sharedlib_config(running_test) == config:
                         return self._proc_pool + 1
 
+                if config not in self._sharedlib_configs_built:
+                    return self._model_build_cost
+
             return 1
         elif (phase == MODEL_BUILD_PHASE):
             # Model builds now happen in parallel
@@ -821,21 +1246,25 @@ class TestScheduler(object):
             return 1
 
     ###########################################################################
-    def _wait_for_something_to_finish(self, threads_in_flight):
+    def _get_sharedlib_config(self, test):
     ###########################################################################
-        expect(len(threads_in_flight) <= self._parallel_jobs, "Oversubscribed?")
-        finished_tests = []
-        while not finished_tests:
-            for test, thread_info in threads_in_flight.items():
-                if not thread_info[0].is_alive():
-                    finished_tests.append((test, thread_info[1]))
+        """
+        The settings that select the shared library directory test builds
+        into, see build._build_checks and build._build_libraries
+        """
+        if test not in self._sharedlib_configs:
+            case = Case(self._get_test_dir(test), read_only=True)
+            self._sharedlib_configs[test] = (os.path.abspath(case.get_value("SHAREDLIBROOT")),
+                                             case.get_value("COMPILER"),
+                                             case.get_value("MPILIB"),
+                                             case.get_value("DEBUG"),
+                                             case.get_build_threaded(),
+                                             case.get_value("COMP_INTERFACE"),
+                                             case.get_value("USE_ESMF_LIB"))
 
-            if not finished_tests:
-                time.sleep(0.2)
+            logger.debug("Shared library config for test {} is {}".format(test, self._sharedlib_configs[test]))
 
-        for finished_test, procs_needed in finished_tests:
-            self._procs_avail += procs_needed
-            del threads_in_flight[finished_test]
+        return self._sharedlib_configs[test]
 
     ###########################################################################
     def _update_test_status_file(self, test, test_phase, status):
@@ -857,6 +1286,10 @@ class TestScheduler(object):
         status  = (TEST_PEND_STATUS if test_phase == RUN_PHASE and not \
                    self._no_batch else TEST_PASS_STATUS) if success else TEST_FAIL_STATUS
 
+        if status == TEST_PASS_STATUS:
+            # Only a local run is timed here, a batch run is only submitted
+            self._phase_times[test][test_phase] = elapsed_time
+
         if status != TEST_PEND_STATUS:
             self._update_test_status(test, test_phase, status)
 
@@ -881,6 +1314,9 @@ class TestScheduler(object):
             # updating the TestStatus file
             self._update_test_status_file(test, test_phase, status)
 
+        if test_phase == SHAREDLIB_BUILD_PHASE and success and test in self._sharedlib_configs:
+            self._sharedlib_configs_built.add(self._sharedlib_configs[test])
+
         if test_phase == XML_PHASE:
             append_status("Case Created using: "+" ".join(sys.argv), "README.case", caseroot=self._get_test_dir(test))
 
@@ -892,71 +1328,241 @@ class TestScheduler(object):
             self._consumer(test, RUN_PHASE, self._run_phase)
 
     ###########################################################################
-    def _producer(self):
+    def _get_phase_times(self, test):
+    ###########################################################################
+        return _get_phase_time_ests(test, self._baseline_root)
+
+    ###########################################################################
+    def _get_mem_needed(self, test, phase):
+    ###########################################################################
+        """
+        Estimated peak resident bytes of phase for test, 0 without history
+        """
+        return _get_phase_memory_ests(test, self._baseline_root).get(phase, 0)
+
+    ###########################################################################
+    def _get_remaining_time(self, test):
+    ###########################################################################
+        """
+        Estimated seconds on the longest path through the phases test has
+        left. The builds of the first test in a build group also gate the
+        later phases of the rest of the group.
+        """
+        remaining_phases = self._phases[self._phases.index(self._get_test_phase(test)) + 1:]
+        phase_times = self._get_phase_times(test)
+        remaining_time = sum(phase_times.get(phase, 0) for phase in remaining_phases)
+
+        is_first_test, _, build_group = self._get_build_group(test)
+        if is_first_test and len(build_group) > 1 and MODEL_BUILD_PHASE in remaining_phases:
+            post_build_phases = remaining_phases[remaining_phases.index(MODEL_BUILD_PHASE) + 1:]
+            own_post_build_time = sum(phase_times.get(phase, 0) for phase in post_build_phases)
+            group_post_build_time = max(sum(self._get_phase_times(member).get(phase, 0) for phase in post_build_phases)
+                                        for member in build_group)
+            remaining_time += group_post_build_time - own_post_build_time
+
+        return remaining_time
+
+    ###########################################################################
+    def _save_phase_times(self):
+    ###########################################################################
+        """
+        Add the phase times and peak memory of this run to the phase
+        histories, like the walltime history only for e3sm and with
+        save_timing. Build times written to TestStatus take precedence over
+        the times measured here. The RUN phase, which may run in a batch
+        job, saves its own time.
+        """
+        if self._cime_model != "e3sm" or not self._save_timing:
+            return
+
+        for test in self._tests:
+            phase_times = dict(self._phase_times[test])
+            phase_times.pop(RUN_PHASE, None)
+            test_dir = self._get_test_dir(test)
+            if os.path.isdir(test_dir):
+                ts = TestStatus(test_dir=test_dir, test_name=test)
+                for phase in [SHAREDLIB_BUILD_PHASE, MODEL_BUILD_PHASE]:
+                    if ts.get_status(phase) == TEST_PASS_STATUS:
+                        seconds = _get_time_from_comment(ts.get_comment(phase))
+                        if seconds is not None:
+                            phase_times[phase] = seconds
+
+            save_test_phase_times(self._baseline_root, test, phase_times)
+            save_test_phase_memory(self._baseline_root, test, self._phase_memory[test])
+
     ###########################################################################
-        threads_in_flight = {} # test-name -> (thread, procs, phase)
+    def _worker(self, jobs, completions):
+    ###########################################################################
+        """
+        Run phases from the jobs queue until given None, reporting each
+        finished test on the completions queue
+        """
         while True:
-            work_to_do = False
-            num_threads_launched_this_iteration = 0
-            for test in self._tests:
-                logger.debug("test_name: " + test)
+            job = jobs.get()
+            if job is None:
+                return
+
+            test, test_phase = job
+            try:
+                self._consumer(test, test_phase, getattr(self, "_{}_phase".format(test_phase.lower())))
+            except Exception: # pylint: disable=broad-except
+                logger.warning("Phase {} for test {} raised:\n{}".format(test_phase, test, traceback.format_exc()))
+            finally:
+                completions.put(test)
+
+    ###########################################################################
+    def _start_ready_tests(self, ready, jobs_in_flight, jobs):
+    ###########################################################################
+        """
+        Start the next phase of the tests in ready, in priority order, while
+        workers and procs are available. ready is a sorted list of
+        (priority, test) for the tests with work remaining that are not in
+        flight. A phase is also held back if its estimated memory does not
+        fit in the memory budget or would take the memory available on this
+        node below the reserve, unless nothing else is running.
+        """
+        mem_free = None if self._mem_avail is None else _read_meminfo("MemAvailable")
+        idx = 0
+        while idx < len(ready) and len(jobs_in_flight) < self._parallel_jobs and \
+              (self._procs_avail > 0 or not jobs_in_flight):
+            test = ready[idx][1]
+            logger.debug("test_name: " + test)
+
+            test_phase, test_status = self._get_test_data(test)
+            expect(test_status != TEST_PEND_STATUS, test)
+            next_phase = self._phases[self._phases.index(test_phase) + 1]
+            procs_needed = self._get_procs_needed(test, next_phase, jobs_in_flight)
+            mem_needed = self._get_mem_needed(test, next_phase)
+            mem_fits = self._mem_avail is None or not jobs_in_flight or \
+                       (mem_needed <= self._mem_avail and
+                        (mem_free is None or mem_free - mem_needed >= self._mem_reserve))
+
+            if procs_needed <= self._procs_avail and mem_fits:
+                self._procs_avail -= procs_needed
+                if self._mem_avail is not None:
+                    self._mem_avail -= mem_needed
+                    self._mem_in_flight[test] = mem_needed
+                    if mem_free is not None:
+                        mem_free -= mem_needed
+
+                # Necessary to print this way when multiple threads printing
+                logger.info("Starting {} for test {} with {:d} procs".format(next_phase, test, procs_needed))
+
+                self._update_test_status(test, next_phase, TEST_PEND_STATUS)
+                jobs_in_flight[test] = (procs_needed, next_phase)
+                jobs.put((test, next_phase))
+                del ready[idx]
+
+                logger.debug("  Current workload:")
+                total_procs = 0
+                for the_test, the_data in six.iteritems(jobs_in_flight):
+                    logger.debug("    {}: {} -> {}".format(the_test, the_data[1], the_data[0]))
+                    total_procs += the_data[0]
+
+                logger.debug("    Total procs in use: {}".format(total_procs))
+            elif not jobs_in_flight:
+                msg = "Phase '{}' for test '{}' required more processors, {:d}, than this machine can provide, {:d}".format(next_phase, test, procs_needed, self._procs_avail)
+                logger.warning(msg)
+                self._update_test_status(test, next_phase, TEST_PEND_STATUS)
+                self._update_test_status(test, next_phase, TEST_FAIL_STATUS)
+                self._log_output(test, msg)
+                if next_phase == RUN_PHASE:
+                    self._update_test_status_file(test, SUBMIT_PHASE, TEST_PASS_STATUS)
+                    self._update_test_status_file(test, next_phase, TEST_FAIL_STATUS)
+                else:
+                    self._update_test_status_file(test, next_phase, TEST_FAIL_STATUS)
+                del ready[idx]
+            else:
+                idx += 1
 
-                if self._work_remains(test):
-                    work_to_do = True
+    ###########################################################################
+    def _producer(self):
+    ###########################################################################
+        """
+        Run every remaining phase of every test on a pool of worker threads.
+        Tests are only reconsidered when a phase finishes, freeing procs and
+        memory.
+        """
+        jobs = six_queue.Queue()        # (test, phase) to run
+        completions = six_queue.Queue() # tests whose phase has finished
+        workers = [threading.Thread(target=self._worker, args=(jobs, completions))
+                   for _ in range(self._parallel_jobs)]
+        for worker in workers:
+            worker.start()
+
+        # Tests with the longest estimated path left go first, ties in test order
+        test_order = dict((test, idx) for idx, test in enumerate(self._tests))
+        def priority(test):
+            return (-self._get_remaining_time(test), test_order[test])
+
+        ready = sorted((priority(test), test) for test in self._tests if self._work_remains(test))
+        jobs_in_flight = {} # test-name -> (procs, phase)
+        if self._mem_avail is not None:
+            self._mem_sampler = _MemorySampler()
+            self._mem_sampler.start()
+        try:
+            while ready or jobs_in_flight:
+                self._start_ready_tests(ready, jobs_in_flight, jobs)
+                if not jobs_in_flight:
+                    continue
 
-                    # If we have no workers available, immediately break out of loop so we can wait
-                    if len(threads_in_flight) == self._parallel_jobs:
+                # Wait for a phase to finish, then take every other finished
+                # phase before looking for work to start
+                finished = [completions.get()]
+                while True:
+                    try:
+                        finished.append(completions.get_nowait())
+                    except six_queue.Empty:
                         break
 
-                    if test not in threads_in_flight:
-                        test_phase, test_status = self._get_test_data(test)
-                        expect(test_status != TEST_PEND_STATUS, test)
-                        next_phase = self._phases[self._phases.index(test_phase) + 1]
-                        procs_needed = self._get_procs_needed(test, next_phase, threads_in_flight)
-
-                        if procs_needed <= self._procs_avail:
-                            self._procs_avail -= procs_needed
-
-                            # Necessary to print this way when multiple threads printing
-                            logger.info("Starting {} for test {} with {:d} procs".format(next_phase, test, procs_needed))
-
-                            self._update_test_status(test, next_phase, TEST_PEND_STATUS)
-                            new_thread = threading.Thread(target=self._consumer,
-                                args=(test, next_phase, getattr(self, "_{}_phase".format(next_phase.lower())) ))
-                            threads_in_flight[test] = (new_thread, procs_needed, next_phase)
-                            new_thread.start()
-                            num_threads_launched_this_iteration += 1
-
-                            logger.debug("  Current workload:")
-                            total_procs = 0
-                            for the_test, the_data in six.iteritems(threads_in_flight):
-                                logger.debug("    {}: {} -> {}".format(the_test, the_data[2], the_data[1]))
-                                total_procs += the_data[1]
-
-                            logger.debug("    Total procs in use: {}".format(total_procs))
-                        else:
-                            if not threads_in_flight:
-                                msg = "Phase '{}' for test '{}' required more processors, {:d}, than this machine can provide, {:d}".format(next_phase, test, procs_needed, self._procs_avail)
-                                logger.warning(msg)
-                                self._update_test_status(test, next_phase, TEST_PEND_STATUS)
-                                self._update_test_status(test, next_phase, TEST_FAIL_STATUS)
-                                self._log_output(test, msg)
-                                if next_phase == RUN_PHASE:
-                                    self._update_test_status_file(test, SUBMIT_PHASE, TEST_PASS_STATUS)
-                                    self._update_test_status_file(test, next_phase, TEST_FAIL_STATUS)
-                                else:
-                                    self._update_test_status_file(test, next_phase, TEST_FAIL_STATUS)
-                                num_threads_launched_this_iteration += 1
-
-            if not work_to_do:
-                break
+                for test in finished:
+                    self._procs_avail += jobs_in_flight.pop(test)[0]
+                    if test in self._mem_in_flight:
+                        self._mem_avail += self._mem_in_flight.pop(test)
+                    if self._work_remains(test):
+                        bisect.insort(ready, (priority(test), test))
+        finally:
+            for _ in workers:
+                jobs.put(None)
+            for worker in workers:
+                worker.join()
+            if self._mem_sampler is not None:
+                self._mem_sampler.stop()
+                self._mem_sampler = None
+
+    ###########################################################################
+    def _submit_bundle(self):
+    ###########################################################################
+        """
+        Submit one batch job running the RUN phase of every bundled test
+        """
+        entries = []
+        for test, cmd in sorted(self._bundled_tests):
+            test_dir = self._get_test_dir(test)
+            with Case(test_dir, read_only=True) as case:
+                walltime = case.get_value("JOB_WALLCLOCK_TIME", subgroup="case.test")
+                entries.append({"test" : test, "test_dir" : test_dir, "cmd" : cmd,
+                                "nodes" : case.num_nodes,
+                                "walltime" : 0 if walltime is None else convert_to_seconds(walltime)})
+
+        num_nodes = max([self._bundle_nodes] + [entry["nodes"] for entry in entries])
+        bundle_file = get_bundle_file(self._test_root, self._test_id)
+        write_bundle(bundle_file, entries, num_nodes)
 
-            if num_threads_launched_this_iteration == 0:
-                # No free resources, wait for something in flight to finish
-                self._wait_for_something_to_finish(threads_in_flight)
+        try:
+            with Case(entries[0]["test_dir"], read_only=False) as case:
+                submit_bundle(case, bundle_file, num_nodes,
+                              wall_time=None if self._walltime is None else convert_to_seconds(self._walltime),
+                              queue=self._queue, job_id="test_bundle_{}".format(self._test_id))
+            status = TEST_PASS_STATUS
+        except Exception as e:
+            logger.warning("FAILED to submit test bundle: {}".format(str(e)))
+            status = TEST_FAIL_STATUS
 
-        for unfinished_thread, _, _ in threads_in_flight.values():
-            unfinished_thread.join()
+        for entry in entries:
+            self._update_test_status_file(entry["test"], SUBMIT_PHASE, status)
+            if status == TEST_FAIL_STATUS:
+                self._update_test_status(entry["test"], RUN_PHASE, TEST_FAIL_STATUS)
 
     ###########################################################################
     def _setup_cs_files(self):
@@ -1019,13 +1625,22 @@ class TestScheduler(object):
 
         # Setup cs files
         self._setup_cs_files()
+        create_test_status_index(self._test_root)
 
+        # Config files are shared by every test and read only once, case
+        # files are always read from disk
         GenericXML.DISABLE_CACHING = True
-        self._producer()
+        with config_snapshot():
+            self._producer()
         GenericXML.DISABLE_CACHING = False
 
         expect(threading.active_count() == 1, "Leftover threads?")
 
+        self._save_phase_times()
+
+        if self._bundled_tests:
+            self._submit_bundle()
+
         # Copy TestStatus files to baselines for tests that have already failed.
         if get_model() == "cesm":
             for test in self._tests:
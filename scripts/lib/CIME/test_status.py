@@ -27,8 +27,9 @@ from CIME.XML.standard_module_setup import *
 
 from collections import OrderedDict
 
-import os, itertools
+import os, itertools, threading
 from CIME import expected_fails
+from CIME.test_status_index import record_test_status, get_test_status_contents
 
 TEST_STATUS_FILENAME = "TestStatus"
 
@@ -116,9 +117,17 @@ def _test_helper2(file_contents, wait_for_run=False, check_throughput=False, che
 
     return rv
 
+def load_test_statuses(test_status_paths):
+    """
+    Return a TestStatus for each TestStatus file in test_status_paths, using
+    the index of each test root to avoid reading files that have not changed
+    """
+    return [TestStatus(test_dir=os.path.dirname(test_status_path), contents=contents)
+            for test_status_path, contents in zip(test_status_paths, get_test_status_contents(test_status_paths))]
+
 class TestStatus(object):
 
-    def __init__(self, test_dir=None, test_name=None, no_io=False):
+    def __init__(self, test_dir=None, test_name=None, no_io=False, contents=None):
         """
         Create a TestStatus object
 
@@ -126,6 +135,9 @@ class TestStatus(object):
 
         no_io is intended only for testing, and should be kept False in
         production code
+
+        contents, if given, is used instead of reading the TestStatus file,
+        see load_test_statuses
         """
         test_dir = os.getcwd() if test_dir is None else test_dir
         self._filename = os.path.join(test_dir, TEST_STATUS_FILENAME)
@@ -134,7 +146,9 @@ class TestStatus(object):
         self._ok_to_modify = False
         self._no_io = no_io
 
-        if os.path.exists(self._filename):
+        if contents is not None:
+            self._parse_test_status(contents)
+        elif os.path.exists(self._filename):
             self._parse_test_status_file()
             if not os.access(self._filename, os.W_OK):
                 self._no_io = True
@@ -285,8 +299,16 @@ class TestStatus(object):
 
     def flush(self):
         if self._phase_statuses and not self._no_io:
-            with open(self._filename, "w") as fd:
-                fd.write(self.phase_statuses_dump())
+            contents = self.phase_statuses_dump()
+            # Written to a new file each time, so the index can tell flushes
+            # within the resolution of mtime apart by inode
+            tmp_filename = "{}.{:d}.{:d}.tmp".format(self._filename, os.getpid(), threading.current_thread().ident)
+            with open(tmp_filename, "w") as fd:
+                fd.write(contents)
+                fd.flush()
+                st = os.fstat(fd.fileno())
+            os.rename(tmp_filename, self._filename)
+            record_test_status(self._filename, contents, st=st)
 
     def _parse_test_status(self, file_contents):
         """
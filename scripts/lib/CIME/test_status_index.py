@@ -0,0 +1,167 @@
+"""
+Append-only index of the TestStatus files under a test root.
+
+Reporting tools such as cs.status open and parse every TestStatus file of a
+test root, which is slow on a loaded parallel file system. create_test
+creates an index file in its test root, and only there TestStatus.flush
+also appends the new contents of the file, with its inode, mtime and size,
+as one line to the index. TestStatus.flush replaces the file, so each flush
+has a new inode. Readers load the index once and use an entry if the
+TestStatus file still has the recorded inode, mtime and size, otherwise they read
+the file itself and add it to the index, so the index never has to be
+complete or exact. A file modified within the last _SETTLE_SEC seconds is
+always read: it may be rewritten within the resolution of its mtime
+without changing size.
+
+Each entry is written with a single append so concurrent writers do not
+interleave, a truncated last line is ignored. Readers compact the index
+once most of its entries are stale, dropping the tests that were removed.
+"""
+from CIME.XML.standard_module_setup import *
+
+import json, tempfile, time
+
+logger = logging.getLogger(__name__)
+
+TEST_STATUS_INDEX_FILENAME = ".test_status_index"
+
+_SETTLE_SEC = 2
+
+def _get_index_path(test_status_path):
+    test_dir = os.path.dirname(os.path.abspath(test_status_path))
+    return os.path.join(os.path.dirname(test_dir), TEST_STATUS_INDEX_FILENAME), os.path.basename(test_dir)
+
+def _make_entry(name, st, contents):
+    return json.dumps({"name" : name, "ino" : st.st_ino, "mtime" : st.st_mtime, "size" : st.st_size,
+                       "contents" : contents}) + "\n"
+
+def create_test_status_index(test_root):
+    """
+    Create the index of test_root, if it does not exist yet, so the
+    TestStatus files of the tests in it are indexed
+    """
+    index_path = os.path.join(test_root, TEST_STATUS_INDEX_FILENAME)
+    try:
+        os.close(os.open(index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664))
+    except (IOError, OSError) as e:
+        logger.debug("Could not create {}: {}".format(index_path, e))
+
+def record_test_status(test_status_path, contents, st):
+    """
+    Add contents, just written to test_status_path, to the index of its test
+    root, if it has one. st is the stat of the file descriptor contents was
+    written to or read from. Failures are ignored, readers fall back to the
+    file.
+    """
+    index_path, name = _get_index_path(test_status_path)
+    try:
+        entry = _make_entry(name, st, contents).encode("utf-8")
+        fd = os.open(index_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, entry)
+        finally:
+            os.close(fd)
+    except (IOError, OSError) as e:
+        # Including the test roots without an index
+        logger.debug("Could not update {}: {}".format(index_path, e))
+
+def _load_index(index_path):
+    """
+    Return {test dir name -> latest entry} from the index at index_path
+    """
+    entries = {}
+    num_lines = 0
+    try:
+        with open(index_path, "r") as fd:
+            for line in fd:
+                num_lines += 1
+                try:
+                    entry = json.loads(line)
+                    entries[entry["name"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except (IOError, OSError):
+        return entries
+
+    if num_lines > 2 * len(entries):
+        _compact_index(index_path, entries)
+
+    return entries
+
+def _compact_index(index_path, entries):
+    """
+    Rewrite the index with only the latest entry of each test that still
+    exists, and remove the others from entries. Entries appended while this
+    runs are lost, which only makes them stale.
+    """
+    test_root = os.path.dirname(index_path)
+    for name in list(entries):
+        if not os.path.isdir(os.path.join(test_root, name)):
+            del entries[name]
+
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=TEST_STATUS_INDEX_FILENAME)
+        with os.fdopen(fd, "w") as tmp_fd:
+            for entry in entries.values():
+                tmp_fd.write(json.dumps(entry) + "\n")
+        os.chmod(tmp_path, 0o664)
+        os.rename(tmp_path, index_path)
+        tmp_path = None
+    except (IOError, OSError) as e:
+        logger.debug("Could not compact {}: {}".format(index_path, e))
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_test_status_contents(test_status_paths):
+    """
+    Return a list with the contents of each TestStatus file in
+    test_status_paths, or None for files that do not exist. Only files
+    missing from the index or changed since they were indexed are read.
+
+    >>> import tempfile, shutil
+    >>> test_root = tempfile.mkdtemp()
+    >>> os.mkdir(os.path.join(test_root, "ERS.foo.A"))
+    >>> test_status_path = os.path.join(test_root, "ERS.foo.A", "TestStatus")
+    >>> with open(test_status_path, "w") as fd:
+    ...     _ = fd.write("PASS ERS.foo.A CREATE_NEWCASE\\n")
+    >>> os.utime(test_status_path, (time.time() - 60, time.time() - 60))
+    >>> get_test_status_contents([test_status_path, os.path.join(test_root, "missing", "TestStatus")])
+    ['PASS ERS.foo.A CREATE_NEWCASE\\n', None]
+    >>> os.listdir(test_root)
+    ['ERS.foo.A']
+    >>> create_test_status_index(test_root)
+    >>> _ = get_test_status_contents([test_status_path])
+    >>> sorted(_load_index(os.path.join(test_root, TEST_STATUS_INDEX_FILENAME)))
+    ['ERS.foo.A']
+    >>> shutil.rmtree(test_root)
+    """
+    indices = {}
+    results = []
+    for test_status_path in test_status_paths:
+        index_path, name = _get_index_path(test_status_path)
+        if index_path not in indices:
+            indices[index_path] = _load_index(index_path)
+
+        try:
+            st = os.stat(test_status_path)
+        except OSError:
+            results.append(None)
+            continue
+
+        entry = indices[index_path].get(name)
+        settled = abs(time.time() - st.st_mtime) >= _SETTLE_SEC
+        if settled and entry is not None and entry.get("ino") == st.st_ino and \
+           entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            results.append(entry["contents"])
+        else:
+            with open(test_status_path, "r") as fd:
+                st = os.fstat(fd.fileno())
+                contents = fd.read()
+            settled = abs(time.time() - st.st_mtime) >= _SETTLE_SEC
+            if settled:
+                record_test_status(test_status_path, contents, st=st)
+            results.append(contents)
+
+    return results
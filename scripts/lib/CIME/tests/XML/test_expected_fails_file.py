@@ -8,8 +8,9 @@ import six
 from CIME.XML.expected_fails_file import ExpectedFailsFile
 from CIME.utils import CIMEError
 from CIME.expected_fails import ExpectedFails
+from CIME.tests.XML.xml_backend_test_case import XMLBackendTestCase, skip_without_lxml
 
-class TestExpectedFailsFile(unittest.TestCase):
+class TestExpectedFailsFile(XMLBackendTestCase):
 
     def setUp(self):
         self._workdir = tempfile.mkdtemp()
@@ -117,5 +118,9 @@ class TestExpectedFailsFile(unittest.TestCase):
         with six.assertRaisesRegex(self, CIMEError, "Schemas validity error"):
             _ = ExpectedFailsFile(self._xml_filepath)
 
+@skip_without_lxml
+class TestExpectedFailsFileLxml(TestExpectedFailsFile):
+    BACKEND = "lxml"
+
 if __name__ == '__main__':
     unittest.main()
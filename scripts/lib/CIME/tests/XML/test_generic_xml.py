@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from CIME.XML.generic_xml import GenericXML
+from CIME.XML import parse_cache, schema_validator
+from CIME.XML.config_snapshot import config_snapshot
+from CIME.utils import CIMEError
+from CIME.tests.XML.xml_backend_test_case import XMLBackendTestCase, skip_without_lxml
+
+class TestGenericXMLParseCache(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._cachedir = os.path.join(self._workdir, "cache")
+        self._xml_filepath = os.path.join(self._workdir, "config.xml")
+        self._inc_filepath = os.path.join(self._workdir, "included.xml")
+        with open(self._xml_filepath, "w") as fd:
+            fd.write("""<?xml version="1.0"?>
+<config xmlns:xi="http://www.w3.org/2001/XInclude">
+  <entry id="A">1</entry>
+  <xi:include href="included.xml"/>
+</config>
+""")
+        self._write_include("2")
+        os.environ["CIME_XML_CACHE_DIR"] = self._cachedir
+        parse_cache.reset_parse_cache()
+        GenericXML.invalidate(self._xml_filepath)
+
+    def tearDown(self):
+        del os.environ["CIME_XML_CACHE_DIR"]
+        parse_cache.reset_parse_cache()
+        GenericXML.invalidate(self._xml_filepath)
+        GenericXML.invalidate(self._inc_filepath)
+        shutil.rmtree(self._workdir)
+
+    def _write_include(self, value):
+        with open(self._inc_filepath, "w") as fd:
+            fd.write("""<?xml version="1.0"?>
+<config>
+  <entry id="B">{}</entry>
+</config>
+""".format(value))
+
+    def _read_entries(self):
+        # Drop the in-process cache to emulate a fresh process
+        GenericXML.invalidate(self._xml_filepath)
+        GenericXML.invalidate(self._inc_filepath)
+        xml = GenericXML(self._xml_filepath)
+        return dict((xml.get(node, "id"), xml.text(node)) for node in xml.get_children("entry"))
+
+    def test_hit_after_miss(self):
+        """A second read of an unchanged file comes from the persistent cache"""
+        self.assertEqual(self._read_entries(), {"A" : "1", "B" : "2"})
+        self.assertEqual(self._read_entries(), {"A" : "1", "B" : "2"})
+        cache = parse_cache.get_parse_cache()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_included_file_change_invalidates(self):
+        """Changing an xi:include'd file is a cache miss"""
+        self._read_entries()
+        self._write_include("three")
+        self.assertEqual(self._read_entries(), {"A" : "1", "B" : "three"})
+        cache = parse_cache.get_parse_cache()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_eviction(self):
+        """Entries beyond the size limit are evicted"""
+        self._read_entries()
+        cache = parse_cache.get_parse_cache()
+        self.assertEqual(len(os.listdir(self._cachedir)), 1)
+        # pylint: disable=protected-access
+        cache._max_bytes = 0
+        cache.evict()
+        self.assertEqual(os.listdir(self._cachedir), [])
+
+class TestGenericXMLWrite(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._xml_filepath = os.path.join(self._workdir, "env_test.xml")
+
+    def tearDown(self):
+        GenericXML.invalidate(self._xml_filepath)
+        shutil.rmtree(self._workdir)
+
+    def _make_file(self):
+        xml = GenericXML(self._xml_filepath, read_only=False)
+        node = xml.make_child("entry", attributes={"id" : "A", "value" : "x<y"})
+        xml.make_child("desc", root=node, text="a & b")
+        xml.make_child("empty", root=node)
+        return xml
+
+    def test_format(self):
+        """The in-process writer formats like xmllint --format"""
+        self._make_file().write()
+        with open(self._xml_filepath) as fd:
+            self.assertEqual(fd.read(), """<?xml version="1.0"?>
+<file id="env_test.xml" version="2.0">
+  <entry id="A" value="x&lt;y">
+    <desc>a &amp; b</desc>
+    <empty/>
+  </entry>
+</file>
+""")
+
+    def test_unchanged_write_is_skipped(self):
+        """Writing identical content leaves the file's mtime alone"""
+        xml = self._make_file()
+        xml.write()
+        os.utime(self._xml_filepath, (0, 0))
+        xml.write(force_write=True)
+        self.assertEqual(os.path.getmtime(self._xml_filepath), 0)
+
+        xml.set(xml.get_child("entry"), "value", "z")
+        xml.write()
+        self.assertNotEqual(os.path.getmtime(self._xml_filepath), 0)
+
+class TestGenericXMLValidate(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._xml_filepath = os.path.join(self._workdir, "config.xml")
+        self._xsd_filepath = os.path.join(self._workdir, "config.xsd")
+        with open(self._xsd_filepath, "w") as fd:
+            fd.write("""<?xml version="1.0"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="config">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="entry" type="xs:string" maxOccurs="unbounded"/>
+      </xs:sequence>
+      <xs:attribute name="version" type="xs:decimal"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+""")
+        os.environ["CIME_XML_STAMP_DIR"] = os.path.join(self._workdir, "stamps")
+        schema_validator.reset_schema_validator()
+
+    def tearDown(self):
+        del os.environ["CIME_XML_STAMP_DIR"]
+        schema_validator.reset_schema_validator()
+        GenericXML.invalidate(self._xml_filepath)
+        shutil.rmtree(self._workdir)
+
+    def _write_config(self, tag):
+        with open(self._xml_filepath, "w") as fd:
+            fd.write('<?xml version="1.0"?>\n<config version="2.0"><{0}>x</{0}></config>\n'.format(tag))
+        GenericXML.invalidate(self._xml_filepath)
+
+    def test_stamp_skips_revalidation(self):
+        """An unchanged file is only validated once"""
+        self._write_config("entry")
+        GenericXML(self._xml_filepath, schema=self._xsd_filepath)
+        GenericXML.invalidate(self._xml_filepath)
+        GenericXML(self._xml_filepath, schema=self._xsd_filepath)
+        validator = schema_validator.get_schema_validator()
+        self.assertEqual((validator.validated, validator.skipped), (1, 1))
+
+    def test_stamps_pruned(self):
+        """Only the most recently used stamps are kept"""
+        self._write_config("entry")
+        GenericXML(self._xml_filepath, schema=self._xsd_filepath)
+        stamp_dir = os.path.join(self._workdir, "stamps")
+        old_time = time.time() - 3600
+        for idx in range(3):
+            path = os.path.join(stamp_dir, "old{:d}".format(idx))
+            with open(path, "w") as fd:
+                fd.write("stale")
+            os.utime(path, (old_time + idx, old_time + idx))
+
+        validator = schema_validator.get_schema_validator()
+        validator._max_stamps = 2 # pylint: disable=protected-access
+        validator.prune()
+        self.assertEqual(len(os.listdir(stamp_dir)), 2)
+        self.assertIn("old2", os.listdir(stamp_dir))
+
+        GenericXML.invalidate(self._xml_filepath)
+        GenericXML(self._xml_filepath, schema=self._xsd_filepath)
+        self.assertEqual((validator.validated, validator.skipped), (1, 1))
+
+    def test_invalid_file(self):
+        """A file that does not match its schema is an error"""
+        self._write_config("bogus")
+        with self.assertRaises(CIMEError):
+            GenericXML(self._xml_filepath, schema=self._xsd_filepath)
+
+    def test_invalid_changes(self):
+        """Changes are checked in memory before they are written"""
+        self._write_config("entry")
+        xml = GenericXML(self._xml_filepath, schema=self._xsd_filepath, read_only=False)
+        xml.validate_changes()
+        xml.make_child("bogus", text="x")
+        with self.assertRaises(CIMEError):
+            xml.validate_changes()
+
+class TestGenericXMLChildIndex(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._xml_filepath = os.path.join(self._workdir, "env_test.xml")
+        self._xml = GenericXML(self._xml_filepath, read_only=False)
+        for vid in ("A", "B", "C"):
+            self._xml.make_child("entry", attributes={"id" : vid})
+
+    def tearDown(self):
+        GenericXML.invalidate(self._xml_filepath)
+        shutil.rmtree(self._workdir)
+
+    def _ids(self, name="entry", attributes=None):
+        return [self._xml.get(node, "id") for node in self._xml.get_children(name, attributes=attributes)]
+
+    def test_mutations_update_index(self):
+        """Lookups stay correct across add, remove, set, pop and rename"""
+        xml = self._xml
+        self.assertEqual(self._ids(), ["A", "B", "C"])
+        node_b = xml.get_child("entry", {"id" : "B"})
+
+        xml.set(node_b, "id", "B2")
+        self.assertIsNone(xml.get_optional_child("entry", {"id" : "B"}))
+        self.assertEqual(xml.get_child("entry", {"id" : "B2"}), node_b)
+
+        xml.set(node_b, "flag", "on")
+        self.assertEqual(self._ids(attributes={"flag" : None}), ["B2"])
+        xml.pop(node_b, "flag")
+        self.assertEqual(self._ids(attributes={"flag" : None}), [])
+
+        xml.remove_child(node_b)
+        self.assertEqual(self._ids(), ["A", "C"])
+
+        xml.add_child(node_b)
+        xml.make_child("entry", attributes={"id" : "D"})
+        self.assertEqual(self._ids(), ["A", "C", "B2", "D"])
+
+        xml.add_child(xml.copy(node_b), position=0)
+        self.assertEqual(self._ids(), ["B2", "A", "C", "B2", "D"])
+
+        xml.set_name(node_b, "other")
+        self.assertEqual(self._ids(), ["B2", "A", "C", "D"])
+        self.assertEqual(self._ids("other"), ["B2"])
+
+    def test_returned_list_is_a_copy(self):
+        """Callers may modify the list returned by get_children"""
+        self._xml.get_children("entry").pop()
+        self.assertEqual(self._ids(), ["A", "B", "C"])
+
+    def test_wrappers_are_reused(self):
+        """Repeated lookups return the same wrapper objects"""
+        first = self._xml.get_child("entry", {"id" : "A"})
+        self.assertIs(self._xml.get_child("entry", {"id" : "A"}), first)
+
+class TestGenericXMLScanChildren(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._xml_filepath = os.path.join(self._workdir, "config.xml")
+        with open(self._xml_filepath, "w") as fd:
+            fd.write("""<?xml version="1.0"?>
+<config a="1" b="2">
+  <group>
+    <node id="1" a="1" b="2"/>
+    <node id="2" a="1"/>
+    <node id="3" a="1" b="3"><node id="4" a="1" b="2"/></node>
+  </group>
+  <node id="5" b="2" a="1"/>
+</config>
+""")
+        self._xml = GenericXML(self._xml_filepath)
+
+    def tearDown(self):
+        GenericXML.invalidate(self._xml_filepath)
+        shutil.rmtree(self._workdir)
+
+    def _ids(self, nodename, attributes, root=None):
+        return [self._xml.get(node, "id") for node in self._xml.scan_children(nodename, attributes=attributes, root=root)]
+
+    def test_multiple_attributes(self):
+        """All predicates must match, results are in document order"""
+        self.assertEqual(self._ids("node", {"a" : "1", "b" : "2"}), ["1", "4", "5"])
+        self.assertEqual(self._ids("node", {"a" : "1", "b" : None}), ["1", "3", "4", "5"])
+        self.assertEqual(self._ids("node", {"a" : "1", "c" : None}), [])
+
+    def test_root_excluded(self):
+        """Only descendants of root are searched"""
+        root = self._xml.scan_child("node", {"id" : "3"})
+        self.assertEqual(self._ids("node", {"a" : "1"}, root=root), ["4"])
+        self.assertEqual(self._ids(None, {"a" : "1", "b" : "2"}), ["1", "4", "5"])
+
+    def test_namespaced_tag(self):
+        """Namespace prefixes are resolved in attribute queries"""
+        xml = GenericXML(os.path.join(self._workdir, "env_test.xml"), read_only=False)
+        xml.make_child("{http://www.w3.org/2001/XInclude}include", {"id" : "1", "href" : "a.xml"})
+        xml.make_child("include", {"id" : "2", "href" : "b.xml"})
+        self.assertEqual([xml.get(node, "id") for node in xml.scan_children("xi:include", {"href" : None})], ["1"])
+
+class TestGenericXMLAddChild(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._src_filepath = os.path.join(self._workdir, "src.xml")
+        self._dst_filepath = os.path.join(self._workdir, "env_dst.xml")
+        with open(self._src_filepath, "w") as fd:
+            fd.write('<?xml version="1.0"?>\n<config><entry id="A"><value>1</value></entry></config>\n')
+
+    def tearDown(self):
+        GenericXML.invalidate(self._src_filepath)
+        GenericXML.invalidate(self._dst_filepath)
+        shutil.rmtree(self._workdir)
+
+    def test_add_node_from_other_file(self):
+        """Adding another file's node leaves that file's tree intact"""
+        src = GenericXML(self._src_filepath)
+        dst = GenericXML(self._dst_filepath, read_only=False)
+        dst.add_child(src.get_child("entry"))
+        self.assertEqual([src.get(node, "id") for node in src.get_children("entry")], ["A"])
+        entry = dst.get_child("entry", {"id" : "A"})
+        self.assertEqual(dst.text(dst.get_child("value", root=entry)), "1")
+        dst.write()
+        with open(self._dst_filepath) as fd:
+            self.assertIn('<entry id="A">', fd.read())
+
+class TestGenericXMLConfigSnapshot(XMLBackendTestCase):
+
+    def setUp(self):
+        self._workdir = tempfile.mkdtemp()
+        self._filepaths = [os.path.join(self._workdir, name) for name in ("config.xml", "env_case.xml")]
+        for filepath in self._filepaths:
+            self._write(filepath, "1")
+
+    def tearDown(self):
+        for filepath in self._filepaths:
+            GenericXML.invalidate(filepath)
+        shutil.rmtree(self._workdir)
+
+    def _write(self, filepath, value):
+        with open(filepath, "w") as fd:
+            fd.write('<?xml version="1.0"?>\n<config><entry id="A">{}</entry></config>\n'.format(value))
+
+    def _value(self, xml):
+        return xml.text(xml.get_child("entry"))
+
+    def test_config_file_shared(self):
+        """Config files are parsed once while a snapshot is active"""
+        config = self._filepaths[0]
+        with config_snapshot() as snapshot:
+            first = GenericXML(config)
+            self._write(config, "2")
+            GenericXML.invalidate(config)
+            second = GenericXML(config)
+            self.assertIs(first.root.xml_element, second.root.xml_element)
+            self.assertEqual(self._value(second), "1")
+            self.assertEqual((snapshot.hits, snapshot.misses), (1, 1))
+        self.assertEqual(self._value(GenericXML(config)), "2")
+
+    def test_writable_copy(self):
+        """Changes to a writable object do not reach the shared tree"""
+        config = self._filepaths[0]
+        with config_snapshot():
+            shared = GenericXML(config)
+            writable = GenericXML(config, read_only=False)
+            writable.set_text(writable.get_child("entry"), "2")
+            self.assertEqual(self._value(shared), "1")
+            self.assertEqual(self._value(GenericXML(config)), "1")
+
+    def test_case_file_not_shared(self):
+        """Case env files are always read from disk"""
+        env_case = self._filepaths[1]
+        with config_snapshot() as snapshot:
+            GenericXML(env_case)
+            self._write(env_case, "2")
+            GenericXML.invalidate(env_case)
+            self.assertEqual(self._value(GenericXML(env_case)), "2")
+            self.assertEqual((snapshot.hits, snapshot.misses), (0, 0))
+
+@skip_without_lxml
+class TestGenericXMLParseCacheLxml(TestGenericXMLParseCache):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLWriteLxml(TestGenericXMLWrite):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLValidateLxml(TestGenericXMLValidate):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLChildIndexLxml(TestGenericXMLChildIndex):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLScanChildrenLxml(TestGenericXMLScanChildren):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLAddChildLxml(TestGenericXMLAddChild):
+    BACKEND = "lxml"
+
+@skip_without_lxml
+class TestGenericXMLConfigSnapshotLxml(TestGenericXMLConfigSnapshot):
+    BACKEND = "lxml"
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+This module contains a class that extends unittest.TestCase to run each test
+with a given xml backend, so the same tests can cover every backend.
+"""
+
+from CIME.XML.standard_module_setup import *
+
+import unittest
+from CIME.XML.xml_backend import reset_xml_backend, lxml_etree
+
+class XMLBackendTestCase(unittest.TestCase):
+    """
+    Tests in subclasses run with the xml backend named by BACKEND. To run
+    them with lxml as well derive a class setting BACKEND = "lxml" and
+    decorate it with skip_without_lxml.
+    """
+
+    BACKEND = "etree"
+
+    def run(self, result=None):
+        saved = os.environ.get("CIME_XML_BACKEND")
+        os.environ["CIME_XML_BACKEND"] = self.BACKEND
+        reset_xml_backend()
+        try:
+            return unittest.TestCase.run(self, result)
+        finally:
+            if saved is None:
+                del os.environ["CIME_XML_BACKEND"]
+            else:
+                os.environ["CIME_XML_BACKEND"] = saved
+            reset_xml_backend()
+
+skip_without_lxml = unittest.skipIf(lxml_etree is None, "lxml is not installed")
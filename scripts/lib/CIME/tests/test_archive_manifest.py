@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import CIME.archive_manifest
+from CIME.archive_manifest import ArchiveManifest, run_manifests, get_claimed_files, MANIFEST_DIR
+from CIME.utils import CIMEError
+
+class TestArchiveManifest(unittest.TestCase):
+
+    def setUp(self):
+        self._dout_s_root = tempfile.mkdtemp()
+        self._rundir = os.path.join(self._dout_s_root, "run")
+        os.makedirs(self._rundir)
+
+    def tearDown(self):
+        shutil.rmtree(self._dout_s_root)
+
+    def _commit(self, names, op="move"):
+        manifest = ArchiveManifest()
+        for name in names:
+            with open(os.path.join(self._rundir, name), "w") as fd:
+                fd.write(name)
+            getattr(manifest, op)(os.path.join(self._rundir, name),
+                                  os.path.join(self._dout_s_root, "atm", "hist", name))
+        return manifest.commit(self._dout_s_root)
+
+    def _manifests(self):
+        return sorted(os.listdir(os.path.join(self._dout_s_root, MANIFEST_DIR)))
+
+    def test_run(self):
+        self._commit(["case.cam.h0.0001-01.nc", "case.cam.h0.0001-02.nc"])
+        self._commit(["case.cam.r.0001-02-01-00000.nc"], op="copy")
+        self.assertEqual(len(get_claimed_files(self._dout_s_root)), 3)
+
+        self.assertEqual(run_manifests(self._dout_s_root, transfer_threads=2), 2)
+        self.assertEqual(os.listdir(self._rundir), ["case.cam.r.0001-02-01-00000.nc"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self._dout_s_root, "atm", "hist"))),
+                         ["case.cam.h0.0001-01.nc", "case.cam.h0.0001-02.nc", "case.cam.r.0001-02-01-00000.nc"])
+        self.assertEqual(self._manifests(), [])
+        self.assertEqual(get_claimed_files(self._dout_s_root), set())
+
+    def test_live_and_stale(self):
+        path = self._commit(["case.cam.h0.0001-01.nc"])
+        running_path = path.replace(".pending", ".running.otherhost.1234")
+        os.rename(path, running_path)
+
+        # Another process is running it
+        self.assertEqual(run_manifests(self._dout_s_root), 0)
+        self.assertEqual(self._manifests(), [os.path.basename(running_path)])
+        self.assertEqual(len(get_claimed_files(self._dout_s_root)), 1)
+
+        # Its heartbeat stopped
+        old_time = time.time() - 3600
+        os.utime(running_path, (old_time, old_time))
+        self.assertEqual(run_manifests(self._dout_s_root), 1)
+        self.assertEqual(os.listdir(self._rundir), [])
+        self.assertEqual(self._manifests(), [])
+
+    def test_failure_leaves_pending(self):
+        path = self._commit(["case.cam.h0.0001-01.nc"])
+        real_transfer = CIME.archive_manifest.FileTransfer
+        class FailingTransfer(real_transfer):
+            def _move(self, src_path, tgt_path):
+                raise OSError("disk full")
+
+        CIME.archive_manifest.FileTransfer = FailingTransfer
+        try:
+            with self.assertRaises(CIMEError):
+                run_manifests(self._dout_s_root)
+        finally:
+            CIME.archive_manifest.FileTransfer = real_transfer
+
+        self.assertEqual(self._manifests(), [os.path.basename(path)])
+        self.assertEqual(run_manifests(self._dout_s_root), 1)
+        self.assertEqual(os.listdir(self._rundir), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import CIME.build
+from CIME.build import _is_sharedlib_install_output # pylint: disable=protected-access
+from CIME.build_cache import BuildCache
+from CIME.tests.case_fake import CaseFake
+
+class _BuildCase(CaseFake):
+
+    def get_build_threaded(self):
+        return False
+
+    def get_values(self, item):
+        return ["CPL", "ATM"] if item == "COMP_CLASSES" else []
+
+class TestBuildCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._cache = BuildCache(os.path.join(self._tmpdir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _write(self, path, contents):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fd:
+            fd.write(contents)
+
+    def _list(self, path):
+        return sorted(os.path.relpath(os.path.join(dirpath, filename), path)
+                      for dirpath, _, filenames in os.walk(path) for filename in filenames)
+
+    def test_sharedlib_install_outputs(self):
+        # SHAREDLIBROOT is EXEROOT: build and install trees share sharedpath
+        sharedpath = os.path.join(self._tmpdir, "case1", "bld", "gnu", "mpi-serial", "nodebug", "nothreads", "mct")
+        self._write(os.path.join(sharedpath, "lib", "libgptl.a"), "gptl")
+        self._write(os.path.join(sharedpath, "include", "perf_mod.mod"), "perf_mod")
+        self._write(os.path.join(sharedpath, "mct", "noesmf", "1", "lib", "libcsm_share.a"), "csm_share")
+        self._write(os.path.join(sharedpath, "mct", "noesmf", "1", "csm_share", "Depends"),
+                    "shr_sys_mod.o: {}/shr_sys_mod.F90".format(sharedpath))
+        self._write(os.path.join(sharedpath, "pio", "CMakeCache.txt"),
+                    "CMAKE_CACHEFILE_DIR:INTERNAL={}/pio".format(sharedpath))
+        self._write(os.path.join(sharedpath, "Makefile.kokkos"), "KOKKOS_PATH={}".format(sharedpath))
+
+        self._cache.store("sharedlibs", "key", {"install" : sharedpath}, include=_is_sharedlib_install_output)
+
+        other_sharedpath = os.path.join(self._tmpdir, "case2", "bld", "gnu", "mpi-serial", "nodebug", "nothreads", "mct")
+        self.assertTrue(self._cache.restore("sharedlibs", "key", {"install" : other_sharedpath}))
+        self.assertEqual(self._list(other_sharedpath),
+                         [os.path.join("include", "perf_mod.mod"), os.path.join("lib", "libgptl.a"),
+                          os.path.join("mct", "noesmf", "1", "lib", "libcsm_share.a")])
+
+        # Nothing restored refers to the tree it was built in
+        for relpath in self._list(other_sharedpath):
+            with open(os.path.join(other_sharedpath, relpath), "r") as fd:
+                self.assertNotIn(self._tmpdir, fd.read())
+
+    def test_store_without_include(self):
+        blddir = os.path.join(self._tmpdir, "bld")
+        self._write(os.path.join(blddir, "obj", "a.o"), "a")
+        os.makedirs(os.path.join(blddir, "empty"))
+        self._cache.store("complibs", "key", {"bld" : blddir})
+        restored = os.path.join(self._tmpdir, "restored")
+        self.assertTrue(self._cache.restore("complibs", "key", {"bld" : restored}))
+        self.assertEqual(self._list(restored), [os.path.join("obj", "a.o")])
+        self.assertTrue(os.path.isdir(os.path.join(restored, "empty")))
+
+class TestSharedlibCache(unittest.TestCase):
+
+    _SHAREDPATH = os.path.join("gnu", "mpich", "nodebug", "nothreads", "mct")
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._cimeroot = os.path.join(self._tmpdir, "cime")
+        os.makedirs(os.path.join(self._cimeroot, "src", "share"))
+        self._cache = BuildCache(os.path.join(self._tmpdir, "cache"))
+        self._builds = []
+        self._saved = (CIME.build.get_build_cache, CIME.build.run_sub_or_cmd,
+                       CIME.build.analyze_build_log, CIME.build.get_model)
+        CIME.build.get_build_cache = lambda: self._cache
+        CIME.build.run_sub_or_cmd = self._fake_buildlib
+        CIME.build.analyze_build_log = lambda lib, file_build, compiler: None
+        CIME.build.get_model = lambda: "cesm"
+
+    def tearDown(self):
+        (CIME.build.get_build_cache, CIME.build.run_sub_or_cmd,
+         CIME.build.analyze_build_log, CIME.build.get_model) = self._saved
+        shutil.rmtree(self._tmpdir)
+
+    def _fake_buildlib(self, cmd, cmdargs, subname, subargs, logfile=None): # pylint: disable=unused-argument
+        """
+        Build in the shared library directory, install into EXEROOT/SHAREDPATH
+        """
+        full_lib_path, install_dir, _ = subargs
+        lib = os.path.basename(cmd).split(".", 1)[1]
+        self._builds.append((lib, full_lib_path))
+        if not os.path.isdir(full_lib_path):
+            os.makedirs(full_lib_path)
+        for path, contents in [(os.path.join(full_lib_path, "Makefile"), full_lib_path),
+                               (os.path.join(install_dir, "lib", "lib{}.a".format(lib)), lib),
+                               (logfile, "")]:
+            with open(path, "w") as fd:
+                fd.write(contents)
+
+    def _build(self, name, sharedlibroot, exists=False):
+        case = _BuildCase(os.path.join(self._tmpdir, name), create_case_root=not exists)
+        caseroot = case.get_value("CASEROOT")
+        exeroot = case.get_value("EXEROOT")
+        if not exists:
+            os.makedirs(exeroot)
+        for var, value in [("CIMEROOT", self._cimeroot), ("SRCROOT", self._cimeroot), ("MPILIB", "mpich"),
+                           ("COMPILER", "gnu"), ("COMP_LND", "slnd"), ("SHAREDLIBROOT", sharedlibroot)]:
+            case.set_value(var, value)
+        with open(os.path.join(caseroot, "Macros.make"), "w") as fd:
+            fd.write("FFLAGS := -O2")
+
+        CIME.build._build_libraries(case, exeroot, self._SHAREDPATH, caseroot, self._cimeroot, # pylint: disable=protected-access
+                                    os.path.join(exeroot, "lib"), "1", "gnu", None, "mct")
+        return sorted(os.listdir(os.path.join(exeroot, self._SHAREDPATH, "lib")))
+
+    def test_cases_sharing_sharedlibroot(self):
+        libs = ["libcsm_share.a", "libgptl.a", "libmct.a", "libpio.a"]
+        self.assertEqual(self._build("case1", os.path.join(self._tmpdir, "sharedlibroot1")), libs)
+        self.assertEqual(len(self._builds), 4)
+
+        # Restored into a new shared library directory, then every case
+        # using it gets the libraries in its own EXEROOT
+        sharedlibroot = os.path.join(self._tmpdir, "sharedlibroot2")
+        for name in ["case2", "case3"]:
+            self.assertEqual(self._build(name, sharedlibroot), libs)
+        self.assertEqual(len(self._builds), 4)
+
+        # A case that has them is up to date even once the entry is evicted,
+        # a new one then builds them
+        self._cache = BuildCache(os.path.join(self._tmpdir, "cache2"))
+        self.assertEqual(self._build("case2", sharedlibroot, exists=True), libs)
+        self.assertEqual(len(self._builds), 4)
+        self.assertEqual(self._build("case5", sharedlibroot), libs)
+        self.assertEqual(len(self._builds), 8)
+        self.assertEqual(self._builds[-1], ("csm_share", os.path.join(sharedlibroot, self._SHAREDPATH)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import CIME.buildlib
+from CIME.build_cache import BuildCache
+from CIME.tests.case_fake import CaseFake
+
+class _BuildCase(CaseFake):
+
+    def get_build_threaded(self):
+        return False
+
+class TestComplibCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._srcdir = os.path.join(self._tmpdir, "cime", "src", "components", "datm")
+        os.makedirs(self._srcdir)
+        with open(os.path.join(self._srcdir, "datm_comp_mod.F90"), "w") as fd:
+            fd.write("module datm_comp_mod")
+
+        self._cache = BuildCache(os.path.join(self._tmpdir, "cache"))
+        self._builds = []
+        self._saved = (CIME.buildlib.get_build_cache, CIME.buildlib.run_cmd,
+                       CIME.buildlib.get_standard_makefile_args)
+        CIME.buildlib.get_build_cache = lambda: self._cache
+        CIME.buildlib.run_cmd = self._fake_gmake
+        CIME.buildlib.get_standard_makefile_args = lambda case: ""
+
+    def tearDown(self):
+        (CIME.buildlib.get_build_cache, CIME.buildlib.run_cmd,
+         CIME.buildlib.get_standard_makefile_args) = self._saved
+        shutil.rmtree(self._tmpdir)
+
+    def _fake_gmake(self, cmd, combine_output=False):
+        """
+        Build like the complib target: objects, Depends and modules in the
+        build directory, the library in libroot
+        """
+        items = dict(item.split("=", 1) for item in cmd.split() if "=" in item)
+        bldroot = cmd.split(" -C ")[1].split()[0]
+        self._builds.append(bldroot)
+        with open(os.path.join(bldroot, "Depends"), "w") as fd:
+            fd.write("datm_comp_mod.o: {}\n".format(os.path.join(self._srcdir, "datm_comp_mod.F90")))
+        for name in ["datm_comp_mod.o", "datm_comp_mod.mod"]:
+            with open(os.path.join(bldroot, name), "w") as fd:
+                fd.write(name)
+        with open(items["COMPLIB"], "w") as fd:
+            fd.write("library")
+        return 0, "", None if combine_output else ""
+
+    def _make_case(self, name, macros="FFLAGS := -O2"):
+        case = _BuildCase(os.path.join(self._tmpdir, name))
+        caseroot = case.get_value("CASEROOT")
+        case.set_value("CIMEROOT", os.path.join(self._tmpdir, "cime"))
+        case.set_value("CASETOOLS", os.path.join(caseroot, "Tools"))
+        case.set_value("COMPILER", "gnu")
+        case.set_value("GMAKE", "gmake")
+        case.set_value("GMAKE_J", 4)
+        os.makedirs(os.path.join(caseroot, "SourceMods", "src.datm"))
+        with open(os.path.join(caseroot, "Macros.make"), "w") as fd:
+            fd.write(macros)
+
+        bldroot = os.path.join(case.get_value("EXEROOT"), "atm", "obj")
+        libroot = os.path.join(case.get_value("EXEROOT"), "lib")
+        for path in [bldroot, libroot]:
+            os.makedirs(path)
+        with open(os.path.join(bldroot, "Filepath"), "w") as fd:
+            fd.write("{}\n{}\n".format(os.path.join(caseroot, "SourceMods", "src.datm"), self._srcdir))
+        return case, libroot, bldroot
+
+    def _key(self, case, bldroot):
+        return CIME.buildlib._get_complib_cache_key(case, "atm", "datm", "", bldroot, "") # pylint: disable=protected-access
+
+    def test_key(self):
+        case, _, bldroot = self._make_case("case1")
+        key = self._key(case, bldroot)
+        self.assertEqual(key, self._key(*self._make_case("case2")[::2]))
+
+        # Settings, Macros and sources are in the key
+        case.set_value("DEBUG", True)
+        self.assertNotEqual(self._key(case, bldroot), key)
+        case.set_value("DEBUG", None)
+        self.assertEqual(self._key(case, bldroot), key)
+
+        self.assertNotEqual(self._key(*self._make_case("case3", macros="FFLAGS := -O0")[::2]), key)
+
+        with open(os.path.join(self._srcdir, "datm_comp_mod.F90"), "a") as fd:
+            fd.write("\nend module")
+        self.assertNotEqual(self._key(case, bldroot), key)
+
+        # A case with SourceMods is not cached
+        with open(os.path.join(case.get_value("CASEROOT"), "SourceMods", "src.datm", "datm_comp_mod.F90"), "w") as fd:
+            fd.write("module datm_comp_mod")
+        self.assertIsNone(self._key(case, bldroot))
+
+    def test_restore(self):
+        case1, libroot1, bldroot1 = self._make_case("case1")
+        CIME.buildlib.run_gmake(case1, "atm", "datm", libroot1, bldroot1)
+        self.assertEqual(self._builds, [bldroot1])
+
+        # A new case gets the library and modules, nothing that refers to case1
+        case2, libroot2, bldroot2 = self._make_case("case2")
+        CIME.buildlib.run_gmake(case2, "atm", "datm", libroot2, bldroot2)
+        self.assertEqual(self._builds, [bldroot1])
+        self.assertEqual(os.listdir(libroot2), ["libatm.a"])
+        self.assertEqual(sorted(os.listdir(bldroot2)), [".build_cache_key", "Filepath", "datm_comp_mod.mod"])
+        with open(os.path.join(bldroot2, "Filepath"), "r") as fd:
+            self.assertNotIn(case1.get_value("CASEROOT"), fd.read())
+
+        # It is up to date until its inputs change, then it is built in place
+        CIME.buildlib.run_gmake(case2, "atm", "datm", libroot2, bldroot2)
+        self.assertEqual(self._builds, [bldroot1])
+        with open(os.path.join(case2.get_value("CASEROOT"), "Macros.make"), "w") as fd:
+            fd.write("FFLAGS := -O0")
+        CIME.buildlib.run_gmake(case2, "atm", "datm", libroot2, bldroot2)
+        self.assertEqual(self._builds, [bldroot1, bldroot2])
+        self.assertEqual(sorted(os.listdir(bldroot2)), ["Depends", "Filepath", "datm_comp_mod.mod", "datm_comp_mod.o"])
+
+if __name__ == '__main__':
+    unittest.main()
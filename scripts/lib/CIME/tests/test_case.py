@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+from CIME.case import Case
+from CIME.XML.generic_xml import GenericXML
+from CIME.utils import CIMEError
+
+_ENV_RUN = """<?xml version="1.0"?>
+<file id="env_run.xml" version="2.0">
+  <header>test</header>
+  <group id="run_desc">
+    <entry id="OUTROOT" value="/a">
+      <type>char</type>
+      <desc>output root</desc>
+    </entry>
+    <entry id="RUNDIR" value="$OUTROOT/run">
+      <type>char</type>
+      <desc>run directory</desc>
+    </entry>
+    <entry id="LOGDIR" value="$ENV{CIME_TEST_LOGROOT}/logs">
+      <type>char</type>
+      <desc>log directory</desc>
+    </entry>
+    <entry id="NCPL">
+      <type>integer</type>
+      <values>
+        <value compclass="ATM">48</value>
+        <value compclass="LND">24</value>
+      </values>
+      <desc>coupling frequency</desc>
+    </entry>
+  </group>
+</file>
+"""
+
+_ENV_CASE = """<?xml version="1.0"?>
+<file id="env_case.xml" version="2.0">
+  <header>test</header>
+  <group id="case_comp">
+    <entry id="COMP_CLASSES" value="ATM,LND">
+      <type>char</type>
+      <desc>component classes</desc>
+    </entry>
+  </group>
+</file>
+"""
+
+class TestCaseValues(unittest.TestCase):
+
+    def setUp(self):
+        self._caseroot = tempfile.mkdtemp()
+        with open(os.path.join(self._caseroot, "env_run.xml"), "w") as fd:
+            fd.write(_ENV_RUN)
+        with open(os.path.join(self._caseroot, "env_case.xml"), "w") as fd:
+            fd.write(_ENV_CASE)
+        os.environ["CIME_TEST_LOGROOT"] = "/x"
+
+    def tearDown(self):
+        del os.environ["CIME_TEST_LOGROOT"]
+        for filename in os.listdir(self._caseroot):
+            GenericXML.invalidate(os.path.join(self._caseroot, filename))
+        shutil.rmtree(self._caseroot)
+
+    def test_set_value_invalidates_dependents(self):
+        """Changing a variable re-resolves exactly the values using it"""
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertEqual(case.get_resolved_value("$RUNDIR/a"), "/a/run/a")
+            case.set_value("OUTROOT", "/b")
+            self.assertEqual(case.get_resolved_value("$RUNDIR/a"), "/b/run/a")
+            self.assertEqual(case.get_value("RUNDIR"), "/b/run")
+
+    def test_env_var_rechecked(self):
+        """Cached values are re-resolved when an environment variable changes"""
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertEqual(case.get_resolved_value("$LOGDIR"), "/x/logs")
+            os.environ["CIME_TEST_LOGROOT"] = "/y"
+            self.assertEqual(case.get_resolved_value("$LOGDIR"), "/y/logs")
+
+    def test_shell_output_cached(self):
+        """Shell commands are run once per case"""
+        counter = os.path.join(self._caseroot, "counter")
+        cmd = "$SHELL{{echo x >> {0}; wc -l < {0}}}".format(counter)
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertEqual(case.get_resolved_value(cmd).strip(), "1")
+            self.assertEqual(case.get_resolved_value("{} ".format(cmd)).strip(), "1")
+
+    def test_direct_env_change_clears_cache(self):
+        """Changes made on an env object rather than the case are noticed"""
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertEqual(case.get_resolved_value("$RUNDIR"), "/a/run")
+            case.get_env("run").set_value("OUTROOT", "/c")
+            self.assertEqual(case.get_resolved_value("$RUNDIR"), "/c/run")
+
+    def test_env_file_routing(self):
+        """Lookups only visit the files holding a variable"""
+        # pylint: disable=protected-access
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertEqual(case._get_env_files("RUNDIR"), [case.get_env("run")])
+            self.assertEqual(case._get_env_files("NCPL_LND"), [case.get_env("run")])
+            self.assertEqual(case._get_env_files("NINST_MAX"), [case.get_env("mach_pes")])
+            self.assertEqual(case._get_env_files("NOT_A_VARIABLE"), [])
+
+            self.assertEqual(case.get_value("NCPL_LND"), 24)
+            self.assertEqual(case.get_resolved_value("$NCPL_LND"), "24")
+            case.set_value("NCPL_LND", 12)
+            self.assertEqual(case.get_value("NCPL_LND"), 12)
+            self.assertEqual(case.get_resolved_value("$NCPL_LND"), "12")
+            self.assertEqual(case.get_value("NCPL_ATM"), 48)
+            self.assertIsNone(case.get_value("NOT_A_VARIABLE"))
+
+    def test_new_entry_is_routed(self):
+        """Entries added to an env file after a lookup are found"""
+        with Case(self._caseroot, read_only=False) as case:
+            self.assertIsNone(case.get_value("NEWVAR"))
+            env_build = case.get_env("build")
+            group = env_build.make_child("group", {"id" : "build_def"})
+            node = env_build.make_child("entry", {"id" : "NEWVAR", "value" : "new"}, root=group)
+            env_build.make_child("type", root=node, text="char")
+            self.assertEqual(case.get_value("NEWVAR"), "new")
+
+    def test_read_only_case_is_lazy(self):
+        """A read-only case only parses the env files it needs"""
+        with Case(self._caseroot, read_only=False):
+            pass # writes the missing env files
+        case = Case(self._caseroot)
+        self.assertNotIn("env_run.xml", case.get_read_env_files())
+        self.assertEqual(case.get_value("RUNDIR"), "/a/run")
+        self.assertIn("env_run.xml", case.get_read_env_files())
+        self.assertNotIn("env_build.xml", case.get_read_env_files())
+
+    def _file_value(self, vid):
+        GenericXML.invalidate(os.path.join(self._caseroot, "env_run.xml"))
+        return Case(self._caseroot).get_value(vid)
+
+    def test_transaction_writes_on_commit(self):
+        """Changes in a transaction are written together when it ends"""
+        with Case(self._caseroot, read_only=False) as case:
+            with case.transaction():
+                case.set_value("OUTROOT", "/b")
+                case.flush()
+                self.assertEqual(self._file_value("OUTROOT"), "/a")
+                case.set_value("NCPL_ATM", 12)
+            self.assertEqual(self._file_value("OUTROOT"), "/b")
+            self.assertEqual(self._file_value("NCPL_ATM"), 12)
+
+    def test_transaction_discarded_on_error(self):
+        """A failing transaction leaves the case as it was"""
+        with Case(self._caseroot, read_only=False) as case:
+            with self.assertRaises(CIMEError):
+                with case.transaction():
+                    case.set_value("OUTROOT", "/b")
+                    case.set_value("NOT_A_VARIABLE", "x")
+            self.assertEqual(case.get_value("OUTROOT"), "/a")
+            self.assertEqual(case.get_value("RUNDIR"), "/a/run")
+            self.assertFalse(case.get_env("run").needsrewrite)
+        self.assertEqual(self._file_value("OUTROOT"), "/a")
+
+if __name__ == '__main__':
+    unittest.main()
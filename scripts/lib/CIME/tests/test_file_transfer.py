@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import gzip
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import CIME.file_transfer
+from CIME.file_transfer import FileTransfer
+from CIME.utils import CIMEError
+
+class TestFileTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._rundir = os.path.join(self._tmpdir, "run")
+        self._archive = os.path.join(self._tmpdir, "archive")
+        os.makedirs(self._rundir)
+        os.makedirs(self._archive)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _make_files(self, num_files, size=1000):
+        names = ["case.cam.h0.{:04d}.nc".format(i) for i in range(num_files)]
+        for name in names:
+            with open(os.path.join(self._rundir, name), "w") as fd:
+                fd.write(name[-7:-3] * (size // 4))
+        return names
+
+    def test_many_moves(self):
+        names = self._make_files(50)
+        with FileTransfer(num_threads=4) as transfer:
+            for name in names:
+                transfer.move(os.path.join(self._rundir, name), os.path.join(self._archive, name))
+
+        self.assertEqual(os.listdir(self._rundir), [])
+        self.assertEqual(sorted(os.listdir(self._archive)), names)
+        self.assertEqual(transfer.get_stats()["rename"][:2], (50, 50000))
+
+    def test_cross_file_system_move(self):
+        names = self._make_files(3, size=100000)
+        os.chmod(os.path.join(self._rundir, names[0]), stat.S_IRUSR)
+        same_file_system = CIME.file_transfer._same_file_system # pylint: disable=protected-access
+        CIME.file_transfer._same_file_system = lambda src, tgt: False # pylint: disable=protected-access
+        try:
+            with FileTransfer(num_threads=2) as transfer:
+                for name in names:
+                    transfer.move(os.path.join(self._rundir, name), os.path.join(self._archive, name))
+        finally:
+            CIME.file_transfer._same_file_system = same_file_system # pylint: disable=protected-access
+
+        self.assertEqual(os.listdir(self._rundir), [])
+        for name in names:
+            with open(os.path.join(self._archive, name), "r") as fd:
+                self.assertEqual(fd.read(), name[-7:-3] * 25000)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self._archive, names[0])).st_mode), stat.S_IRUSR)
+        self.assertEqual(list(transfer.get_stats()), ["move"])
+
+    def test_short_kernel_copy(self):
+        name = self._make_files(1, size=100000)[0]
+        src_path = os.path.join(self._rundir, name)
+        tgt_path = os.path.join(self._archive, name)
+        copied = []
+        def short_copy(src_fd, dst_fd, offset, count):
+            copied.append(offset)
+            return os.pwrite(dst_fd, os.pread(src_fd, min(count, 1000), offset), offset) if len(copied) == 1 else 0
+
+        # Nothing copied yet, the next method is used
+        with open(src_path, "rb") as fsrc, open(tgt_path, "wb") as fdst:
+            self.assertFalse(CIME.file_transfer._kernel_copy(lambda *args: 0, fsrc, fdst, 100000)) # pylint: disable=protected-access
+            with self.assertRaises(IOError):
+                CIME.file_transfer._kernel_copy(short_copy, fsrc, fdst, 100000) # pylint: disable=protected-access
+        self.assertEqual(copied, [0, 1000])
+
+    def test_truncated_move_keeps_source(self):
+        name = self._make_files(1, size=100000)[0]
+        saved = CIME.file_transfer._same_file_system, CIME.file_transfer.copy_file_data # pylint: disable=protected-access
+        def truncated_copy(src_path, tgt_path):
+            with open(src_path, "rb") as fsrc, open(tgt_path, "wb") as fdst:
+                fdst.write(fsrc.read(1000))
+        CIME.file_transfer._same_file_system = lambda src, tgt: False # pylint: disable=protected-access
+        CIME.file_transfer.copy_file_data = truncated_copy
+        try:
+            with self.assertRaises(CIMEError):
+                with FileTransfer(num_threads=1) as transfer:
+                    transfer.move(os.path.join(self._rundir, name), os.path.join(self._archive, name))
+        finally:
+            CIME.file_transfer._same_file_system, CIME.file_transfer.copy_file_data = saved # pylint: disable=protected-access
+
+        self.assertEqual(os.path.getsize(os.path.join(self._rundir, name)), 100000)
+
+    def test_copy_then_move(self):
+        name = self._make_files(1)[0]
+        restdir = os.path.join(self._archive, "rest")
+        os.makedirs(restdir)
+        # A read-only copy from an earlier archive is overwritten
+        with open(os.path.join(restdir, name), "w") as fd:
+            fd.write("old")
+        os.chmod(os.path.join(restdir, name), stat.S_IRUSR)
+
+        with FileTransfer(num_threads=4) as transfer:
+            transfer.copy(os.path.join(self._rundir, name), restdir)
+            transfer.wait()
+            transfer.move(os.path.join(self._rundir, name), os.path.join(self._archive, name))
+
+        with open(os.path.join(restdir, name), "r") as fd:
+            self.assertEqual(fd.read(), "0000" * 250)
+        self.assertTrue(os.path.isfile(os.path.join(self._archive, name)))
+        self.assertFalse(os.path.exists(os.path.join(self._rundir, name)))
+
+    def test_errors_raised_at_wait(self):
+        names = self._make_files(2)
+        transfer = FileTransfer(num_threads=2)
+        transfer.move(os.path.join(self._rundir, "missing"), os.path.join(self._archive, "missing"))
+        for name in names:
+            transfer.move(os.path.join(self._rundir, name), os.path.join(self._archive, name))
+        with self.assertRaises(CIMEError):
+            transfer.wait()
+
+        # The other operations still ran and the transfer is usable
+        self.assertEqual(sorted(os.listdir(self._archive)), names)
+        transfer.wait()
+        transfer.close()
+
+    def test_compress(self):
+        names = self._make_files(4, size=100000)
+        with FileTransfer(num_threads=4) as transfer:
+            transfer.compress(os.path.join(self._rundir, names[0]), os.path.join(self._archive, names[0] + ".gz"),
+                              "gzip", keep_source=True)
+            for name in names[1:]:
+                transfer.compress(os.path.join(self._rundir, name), os.path.join(self._archive, name + ".gz"), "gzip")
+
+        self.assertEqual(os.listdir(self._rundir), [names[0]])
+        self.assertEqual(sorted(os.listdir(self._archive)), [name + ".gz" for name in names])
+        for name in names:
+            with gzip.open(os.path.join(self._archive, name + ".gz"), "rb") as fd:
+                self.assertEqual(fd.read(), (name[-7:-3] * 25000).encode())
+        self.assertEqual(transfer.get_stats()["gzip"][:2], (4, 400000))
+
+    def test_failed_compress_keeps_source(self):
+        name = self._make_files(1)[0]
+        gzip_file = CIME.file_transfer.gzip_file
+        def bad_gzip_file(src_path, tgt_path):
+            gzip_file(src_path, tgt_path)
+            with open(tgt_path, "ab") as fd:
+                fd.write(b"garbage")
+            raise IOError("{} does not decompress to {}".format(tgt_path, src_path))
+
+        CIME.file_transfer.gzip_file = bad_gzip_file
+        try:
+            with self.assertRaises(CIMEError):
+                with FileTransfer(num_threads=2) as transfer:
+                    transfer.compress(os.path.join(self._rundir, name), os.path.join(self._archive, name + ".gz"), "gzip")
+        finally:
+            CIME.file_transfer.gzip_file = gzip_file
+
+        self.assertEqual(os.listdir(self._rundir), [name])
+        self.assertEqual(os.listdir(self._archive), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from CIME.netcdf_reader import NetCDFFile, NetCDFError, read_char_variable
+
+try:
+    from importlib.util import find_spec
+except ImportError: # python 2
+    from pkgutil import find_loader as find_spec
+
+_HAVE_NETCDF4 = find_spec("netCDF4") is not None
+
+_TYPES = {"char" : (2, "c", 1), "short" : (3, "h", 2), "int" : (4, "i", 4), "double" : (6, "d", 8)}
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 4)
+
+def _write_netcdf(path, version, dims, variables, attributes=(), numrecs=0):
+    """
+    Write a netCDF file in the classic format version (1, 2 or 5).
+    dims is a list of (name, length), length 0 for the record dimension,
+    variables a list of (name, type, dim names, data as bytes) where the data
+    of record variables is a list of one byte string per record.
+    """
+    count = ">Q" if version == 5 else ">I"
+    def name(value):
+        return struct.pack(count, len(value)) + _pad(value.encode())
+
+    def attr_list(attrs):
+        if not attrs:
+            return struct.pack(">i", 0) + struct.pack(count, 0)
+        header = struct.pack(">i", 12) + struct.pack(count, len(attrs))
+        for attr_name, value in attrs:
+            header += name(attr_name) + struct.pack(">i", 2) + struct.pack(count, len(value)) + _pad(value.encode())
+        return header
+
+    dim_ids = dict((dim_name, i) for i, (dim_name, _) in enumerate(dims))
+    record_dim = [dim_name for dim_name, length in dims if length == 0]
+
+    def header(begins):
+        result = b"CDF" + struct.pack(">B", version) + struct.pack(count, numrecs)
+        result += struct.pack(">i", 10) + struct.pack(count, len(dims))
+        for dim_name, length in dims:
+            result += name(dim_name) + struct.pack(count, length)
+        result += attr_list(attributes)
+        result += struct.pack(">i", 11) + struct.pack(count, len(variables))
+        for (var_name, var_type, var_dims, data), begin in zip(variables, begins):
+            result += name(var_name) + struct.pack(count, len(var_dims))
+            for dim in var_dims:
+                result += struct.pack(count, dim_ids[dim])
+            vsize = len(_pad(data[0] if var_dims[:1] == record_dim else data))
+            result += attr_list(()) + struct.pack(">i", _TYPES[var_type][0]) + struct.pack(count, vsize)
+            result += struct.pack(">i" if version == 1 else ">q", begin)
+        return result
+
+    fixed = [var for var in variables if var[2][:1] != record_dim]
+    record = [var for var in variables if var[2][:1] == record_dim]
+    offset = len(header([0] * len(variables)))
+    begins = {}
+    for var in fixed:
+        begins[var[0]] = offset
+        offset += len(_pad(var[3]))
+    for var in record:
+        begins[var[0]] = offset
+        offset += len(var[3][0]) if len(record) == 1 else len(_pad(var[3][0]))
+
+    with open(path, "wb") as fd:
+        fd.write(header([begins[var[0]] for var in variables]))
+        for var in fixed:
+            fd.write(_pad(var[3]))
+        for recnum in range(numrecs):
+            for var in record:
+                fd.write(var[3][recnum] if len(record) == 1 else _pad(var[3][recnum]))
+
+class TestNetCDFReader(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tmpdir, "case.cam.r.0001-01-02-00000.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def test_formats(self):
+        nhfil = b"./case.cam.h0.0001-01.nc".ljust(32, b" ") + b"\0" * 32 + b"case.cam.h2.0001-01-01-00000.nc\0"
+        for version in [1, 2, 5]:
+            _write_netcdf(self._path, version, [("ptapes", 3), ("max_chars", 32), ("lev", 3)],
+                          [("lev", "double", ["lev"], struct.pack(">3d", 1., 2., 3.)),
+                           ("nhfil", "char", ["ptapes", "max_chars"], nhfil)],
+                          attributes=[("title", "restart")])
+
+            self.assertEqual(read_char_variable(self._path, "nhfil"),
+                             ["./case.cam.h0.0001-01.nc", "", "case.cam.h2.0001-01-01-00000.nc"])
+            ncfile = NetCDFFile(self._path)
+            self.assertEqual(ncfile.version, version)
+            self.assertEqual(ncfile.attributes["title"], "restart")
+            self.assertEqual(ncfile.variables["nhfil"].shape, (3, 32))
+            self.assertEqual(ncfile.read_variable("lev"), [1., 2., 3.])
+
+    def test_record_variables(self):
+        dims = [("time", 0), ("nlen", 6)]
+        locfnh = [b"h0.nc\0", b"h1.nc\0"]
+        # A lone record variable is not padded between records
+        _write_netcdf(self._path, 2, dims, [("locfnh", "char", ["time", "nlen"], locfnh)], numrecs=2)
+        self.assertEqual(read_char_variable(self._path, "locfnh"), ["h0.nc", "h1.nc"])
+
+        _write_netcdf(self._path, 2, dims, [("locfnh", "char", ["time", "nlen"], locfnh),
+                                            ("nstep", "short", ["time"], [struct.pack(">h", 5), struct.pack(">h", 6)])],
+                      numrecs=2)
+        ncfile = NetCDFFile(self._path)
+        self.assertEqual(ncfile.dimensions["time"], 2)
+        self.assertEqual(ncfile.read_strings("locfnh"), ["h0.nc", "h1.nc"])
+        self.assertEqual(ncfile.read_variable("nstep"), [5, 6])
+
+    def test_errors(self):
+        _write_netcdf(self._path, 1, [("n", 4)], [("count", "int", ["n"], struct.pack(">4i", 1, 2, 3, 4))])
+        with self.assertRaises(NetCDFError):
+            read_char_variable(self._path, "count")
+        with self.assertRaises(NetCDFError):
+            read_char_variable(self._path, "missing")
+
+        with open(self._path, "rb") as fd:
+            data = fd.read()
+        with open(self._path, "wb") as fd:
+            fd.write(data[:20])
+        with self.assertRaises(NetCDFError):
+            NetCDFFile(self._path)
+
+    @unittest.skipIf(_HAVE_NETCDF4, "netCDF4 is installed")
+    def test_netcdf4_without_module(self):
+        with open(self._path, "wb") as fd:
+            fd.write(b"\x89HDF\r\n\x1a\n" + b"\0" * 100)
+        with self.assertRaises(NetCDFError):
+            read_char_variable(self._path, "nhfil")
+
+if __name__ == '__main__':
+    unittest.main()
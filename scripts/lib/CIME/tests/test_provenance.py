@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import CIME.provenance
+from CIME.provenance import save_test_phase_times, get_test_phase_times_based_on_past
+
+class TestProvenance(unittest.TestCase):
+
+    def setUp(self):
+        self._baseline_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._baseline_root)
+
+    def test_phase_history_is_bounded(self):
+        test = "ERS.f19_g16.A.mach_gnu"
+        length = CIME.provenance._PHASE_HISTORY_LENGTH # pylint: disable=protected-access
+        for seconds in range(length + 5):
+            save_test_phase_times(self._baseline_root, test, {"MODEL_BUILD" : seconds})
+        save_test_phase_times(self._baseline_root, test, {"RUN" : 42})
+
+        self.assertEqual(get_test_phase_times_based_on_past(self._baseline_root, test),
+                         {"MODEL_BUILD" : length + 4, "RUN" : 42})
+        the_dir = os.path.join(self._baseline_root, "walltimes", test)
+        self.assertEqual(os.listdir(the_dir), ["phasetimes"])
+        with open(os.path.join(the_dir, "phasetimes"), "r") as fd:
+            lines = fd.readlines()
+        self.assertEqual(len(lines), length)
+        self.assertEqual(lines[-1], "RUN=42\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from CIME.test_bundle import run_bundle, write_bundle, read_bundle
+from CIME.test_status import TestStatus, CREATE_NEWCASE_PHASE, RUN_PHASE, \
+    TEST_PASS_STATUS, TEST_PEND_STATUS, TEST_FAIL_STATUS
+
+class _FakeProcess(object):
+    """
+    Stands in for a subprocess.Popen that finishes after a number of polls
+    """
+
+    def __init__(self, polls, returncode):
+        self._polls = polls
+        self.returncode = None
+        self._final_returncode = returncode
+
+    def poll(self):
+        self._polls -= 1
+        if self._polls <= 0:
+            self.returncode = self._final_returncode
+        return self.returncode
+
+class TestTestBundle(unittest.TestCase):
+
+    def setUp(self):
+        self._test_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._test_root)
+
+    def _make_entry(self, test, nodes, walltime=60, cmd="true"):
+        test_dir = os.path.join(self._test_root, test)
+        os.makedirs(test_dir)
+        with TestStatus(test_dir=test_dir, test_name=test) as ts:
+            ts.set_status(CREATE_NEWCASE_PHASE, TEST_PASS_STATUS)
+            ts.set_status(RUN_PHASE, TEST_PEND_STATUS)
+        return {"test" : test, "test_dir" : test_dir, "cmd" : cmd, "nodes" : nodes, "walltime" : walltime}
+
+    def test_node_packing(self):
+        entries = [self._make_entry("A", 3, walltime=100), self._make_entry("B", 2),
+                   self._make_entry("C", 1), self._make_entry("D", 2)]
+        started = []
+        nodes_in_use = [0, 0] # current, max
+        def launch(entry):
+            started.append(entry["test"])
+            nodes_in_use[0] += entry["nodes"]
+            nodes_in_use[1] = max(nodes_in_use)
+            process = _FakeProcess(3 if entry["test"] == "A" else 1, 0)
+            poll = process.poll
+            def tracking_poll():
+                if process.returncode is None and poll() is not None:
+                    nodes_in_use[0] -= entry["nodes"]
+                return process.returncode
+            process.poll = tracking_poll
+            return process
+
+        self.assertTrue(run_bundle(entries, 4, launch=launch, poll_interval=0))
+        # Biggest test first, the 1 node test fills the remaining node
+        self.assertEqual(started[:2], ["A", "C"])
+        self.assertEqual(sorted(started), ["A", "B", "C", "D"])
+        self.assertEqual(nodes_in_use, [0, 4])
+
+    def test_failures(self):
+        entries = [self._make_entry("BIG", 8), self._make_entry("BAD", 1), self._make_entry("GOOD", 1)]
+        launch = lambda entry: _FakeProcess(1, 1 if entry["test"] == "BAD" else 0)
+
+        self.assertFalse(run_bundle(entries, 4, launch=launch, poll_interval=0))
+        for entry, status in zip(entries, [TEST_FAIL_STATUS, TEST_FAIL_STATUS, TEST_PEND_STATUS]):
+            self.assertEqual(TestStatus(test_dir=entry["test_dir"]).get_status(RUN_PHASE), status)
+
+    def test_local_run(self):
+        entries = [self._make_entry("PASSES", 1, cmd="echo running > out.txt"),
+                   self._make_entry("FAILS", 1, cmd="exit 1")]
+        bundle_file = os.path.join(self._test_root, "bundle.json")
+        write_bundle(bundle_file, entries, 2)
+        entries, num_nodes = read_bundle(bundle_file)
+
+        self.assertFalse(run_bundle(entries, num_nodes, poll_interval=0.01))
+        self.assertTrue(os.path.isfile(os.path.join(entries[0]["test_dir"], "out.txt")))
+        self.assertEqual(TestStatus(test_dir=entries[0]["test_dir"]).get_status(RUN_PHASE), TEST_PEND_STATUS)
+        self.assertEqual(TestStatus(test_dir=entries[1]["test_dir"]).get_status(RUN_PHASE), TEST_FAIL_STATUS)
+
+if __name__ == '__main__':
+    unittest.main()
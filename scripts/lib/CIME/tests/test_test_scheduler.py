@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+import time
+from collections import OrderedDict
+from six.moves import configparser
+import CIME.test_scheduler
+from CIME.test_scheduler import TestScheduler, TEST_START
+from CIME.utils import CIMEError
+from CIME.test_status import CREATE_NEWCASE_PHASE, XML_PHASE, SHAREDLIB_BUILD_PHASE, MODEL_BUILD_PHASE, \
+    RUN_PHASE, TEST_PASS_STATUS, TEST_PEND_STATUS, TEST_FAIL_STATUS
+
+# The test doubles set only what the code under test uses
+# pylint: disable=super-init-not-called
+
+class _FakeScheduler(TestScheduler):
+    """
+    A TestScheduler whose phases only record what ran
+    """
+
+    def __init__(self, procs, parallel_jobs, proc_pool, phase_times=None, build_groups=None, phases=None,
+                 memory=None, mem_avail=None, mem_reserve=0):
+        self._tests = OrderedDict((test, (TEST_START, TEST_PASS_STATUS)) for test in procs)
+        self._phases = [TEST_START, CREATE_NEWCASE_PHASE, XML_PHASE] if phases is None else phases
+        self._phase_times = {} if phase_times is None else phase_times
+        self._build_groups = [(test,) for test in procs] if build_groups is None else build_groups
+        self._parallel_jobs = parallel_jobs
+        self._proc_pool = proc_pool
+        self._procs_avail = proc_pool
+        self._procs = procs
+        self._memory = {} if memory is None else memory
+        self._mem_avail = mem_avail
+        self._mem_reserve = mem_reserve
+        self._mem_in_flight = {}
+        self._mem_sampler = None
+        self._lock = threading.Lock()
+        self.running = {}
+        self.max_jobs = 0
+        self.max_procs = 0
+        self.workloads = []
+        self.ran = []
+
+    def _get_procs_needed(self, test, phase, jobs_in_flight=None, no_batch=False):
+        return self._procs[test]
+
+    def _get_phase_times(self, test):
+        return self._phase_times.get(test, {})
+
+    def _get_mem_needed(self, test, phase):
+        return self._memory.get(test, 0)
+
+    def _consumer(self, test, test_phase, phase_method):
+        with self._lock:
+            self.running[test] = self._procs[test]
+            self.max_jobs = max(self.max_jobs, len(self.running))
+            self.max_procs = max(self.max_procs, sum(self.running.values()))
+            self.workloads.append(set(self.running))
+        time.sleep(0.01)
+        with self._lock:
+            del self.running[test]
+            self.ran.append((test, test_phase))
+        self._update_test_status(test, test_phase, TEST_PASS_STATUS)
+
+    def _log_output(self, test, output):
+        pass
+
+    def _update_test_status_file(self, test, test_phase, status):
+        pass
+
+class TestTestSchedulerProducer(unittest.TestCase):
+
+    def test_limits(self):
+        """Every phase runs in order within the job and proc limits"""
+        procs = OrderedDict(("T{:d}".format(idx), 1 + idx % 3) for idx in range(12))
+        scheduler = _FakeScheduler(procs, parallel_jobs=3, proc_pool=4)
+        scheduler._producer() # pylint: disable=protected-access
+
+        self.assertEqual(threading.active_count(), 1)
+        self.assertLessEqual(scheduler.max_jobs, 3)
+        self.assertLessEqual(scheduler.max_procs, 4)
+        for test in procs:
+            self.assertEqual(scheduler._get_test_data(test), (XML_PHASE, TEST_PASS_STATUS)) # pylint: disable=protected-access
+            phases = [phase for name, phase in scheduler.ran if name == test]
+            self.assertEqual(phases, [CREATE_NEWCASE_PHASE, XML_PHASE])
+
+    def test_too_many_procs(self):
+        """A phase needing more procs than the pool fails, others still run"""
+        procs = OrderedDict([("BIG", 5), ("SMALL", 1)])
+        scheduler = _FakeScheduler(procs, parallel_jobs=2, proc_pool=4)
+        scheduler._producer() # pylint: disable=protected-access
+
+        self.assertEqual(scheduler._get_test_data("BIG"), (CREATE_NEWCASE_PHASE, TEST_FAIL_STATUS)) # pylint: disable=protected-access
+        self.assertEqual(scheduler._get_test_data("SMALL"), (XML_PHASE, TEST_PASS_STATUS)) # pylint: disable=protected-access
+        self.assertEqual(scheduler._procs_avail, 4) # pylint: disable=protected-access
+
+    def test_memory_budget(self):
+        """Phases are held back to stay within the memory budget"""
+        procs = OrderedDict(("T{:d}".format(idx), 1) for idx in range(6))
+        memory = dict((test, 3) for test in procs)
+        memory["T0"] = 20
+        scheduler = _FakeScheduler(procs, parallel_jobs=6, proc_pool=6, memory=memory, mem_avail=10)
+        scheduler._producer() # pylint: disable=protected-access
+
+        self.assertEqual(scheduler._mem_avail, 10) # pylint: disable=protected-access
+        for test in procs:
+            self.assertEqual(scheduler._get_test_data(test), (XML_PHASE, TEST_PASS_STATUS)) # pylint: disable=protected-access
+
+        # The phases too big for the budget run on their own
+        for workload in scheduler.workloads:
+            if "T0" in workload:
+                self.assertEqual(workload, set(["T0"]))
+            else:
+                self.assertLessEqual(sum(memory[test] for test in workload), 10)
+        self.assertGreater(max(len(workload) for workload in scheduler.workloads), 1)
+
+class TestTestSchedulerPriority(unittest.TestCase):
+
+    def test_longest_path_first(self):
+        """Tests with the longest estimated path left start first"""
+        procs = OrderedDict([("SHORT", 1), ("LONGBUILD", 1), ("LONGRUN", 1)])
+        phase_times = {"SHORT"     : {CREATE_NEWCASE_PHASE : 10, XML_PHASE : 10},
+                       "LONGBUILD" : {CREATE_NEWCASE_PHASE : 100},
+                       "LONGRUN"   : {XML_PHASE : 50}}
+        scheduler = _FakeScheduler(procs, parallel_jobs=1, proc_pool=1, phase_times=phase_times)
+        scheduler._producer() # pylint: disable=protected-access
+
+        self.assertEqual(scheduler.ran, [("LONGBUILD", CREATE_NEWCASE_PHASE),
+                                         ("LONGRUN", CREATE_NEWCASE_PHASE),
+                                         ("LONGRUN", XML_PHASE),
+                                         ("SHORT", CREATE_NEWCASE_PHASE),
+                                         ("SHORT", XML_PHASE),
+                                         ("LONGBUILD", XML_PHASE)])
+
+    def test_build_group_path(self):
+        """The first test of a build group carries the runs of the group"""
+        phases = [TEST_START, SHAREDLIB_BUILD_PHASE, MODEL_BUILD_PHASE, RUN_PHASE]
+        procs = OrderedDict([("A", 1), ("B", 1), ("C", 1)])
+        phase_times = {"A" : {MODEL_BUILD_PHASE : 10, RUN_PHASE : 5},
+                       "B" : {RUN_PHASE : 100},
+                       "C" : {MODEL_BUILD_PHASE : 20, RUN_PHASE : 20}}
+        scheduler = _FakeScheduler(procs, parallel_jobs=1, proc_pool=1, phase_times=phase_times,
+                                   build_groups=[("A", "B"), ("C",)], phases=phases)
+
+        self.assertEqual(scheduler._get_remaining_time("A"), 110) # pylint: disable=protected-access
+        self.assertEqual(scheduler._get_remaining_time("B"), 100) # pylint: disable=protected-access
+        self.assertEqual(scheduler._get_remaining_time("C"), 40) # pylint: disable=protected-access
+
+        scheduler._update_test_status("A", SHAREDLIB_BUILD_PHASE, TEST_PEND_STATUS) # pylint: disable=protected-access
+        scheduler._update_test_status("A", SHAREDLIB_BUILD_PHASE, TEST_PASS_STATUS) # pylint: disable=protected-access
+        scheduler._update_test_status("A", MODEL_BUILD_PHASE, TEST_PEND_STATUS) # pylint: disable=protected-access
+        scheduler._update_test_status("A", MODEL_BUILD_PHASE, TEST_PASS_STATUS) # pylint: disable=protected-access
+        self.assertEqual(scheduler._get_remaining_time("A"), 5) # pylint: disable=protected-access
+
+class _FakeSharedlibScheduler(TestScheduler):
+    """
+    A TestScheduler with fixed shared library configs
+    """
+
+    def __init__(self, configs):
+        self._tests = OrderedDict((test, (XML_PHASE, TEST_PASS_STATUS)) for test in configs)
+        self._phases = [TEST_START, CREATE_NEWCASE_PHASE, XML_PHASE, SHAREDLIB_BUILD_PHASE]
+        self._build_groups = [(test,) for test in configs]
+        self._cime_model = "cesm"
+        self._no_batch = False
+        self._proc_pool = 8
+        self._model_build_cost = 4
+        self._sharedlib_configs = configs
+        self._sharedlib_configs_built = set()
+
+class TestTestSchedulerSharedlib(unittest.TestCase):
+
+    def test_sharedlib_configs(self):
+        """Only tests with the same shared library config wait on each other"""
+        configs = {"GNU1" : ("gnu", "openmpi", False),
+                   "GNU2" : ("gnu", "openmpi", False),
+                   "INTEL" : ("intel", "openmpi", False),
+                   "GNUDEBUG" : ("gnu", "openmpi", True)}
+        scheduler = _FakeSharedlibScheduler(configs)
+        jobs_in_flight = {"GNU1" : (4, SHAREDLIB_BUILD_PHASE)}
+        get_procs_needed = scheduler._get_procs_needed # pylint: disable=protected-access
+
+        self.assertEqual(get_procs_needed("GNU2", SHAREDLIB_BUILD_PHASE, jobs_in_flight), 9)
+        self.assertEqual(get_procs_needed("INTEL", SHAREDLIB_BUILD_PHASE, jobs_in_flight), 4)
+        self.assertEqual(get_procs_needed("GNUDEBUG", SHAREDLIB_BUILD_PHASE, jobs_in_flight), 4)
+
+        scheduler._sharedlib_configs_built.add(configs["GNU1"]) # pylint: disable=protected-access
+        self.assertEqual(get_procs_needed("GNU2", SHAREDLIB_BUILD_PHASE, {}), 1)
+
+class _FakeCreateScheduler(TestScheduler):
+    """
+    A TestScheduler that only creates cases
+    """
+
+    def __init__(self, test_root):
+        self._test_root = test_root
+        self._cime_root = test_root
+        self._cime_config = configparser.ConfigParser()
+        self._cime_config.add_section("main")
+        self._in_process_create = True
+        self.commands = []
+
+    def _get_test_dir(self, test):
+        return os.path.join(self._test_root, test)
+
+    def _get_create_newcase_args(self, test):
+        return {"grid_name" : "f19_g16"}, None
+
+    def _shell_cmd_for_phase(self, test, cmd, phase, from_dir=None):
+        # create_newcase fails if the case directory exists
+        self.commands.append((cmd, phase, os.path.exists(self._get_test_dir(test))))
+        return True, ""
+
+class TestTestSchedulerCreate(unittest.TestCase):
+
+    def test_child_failure_falls_back(self):
+        """A case the child process could not create is created by create_newcase"""
+        test_root = tempfile.mkdtemp()
+        scheduler = _FakeCreateScheduler(test_root)
+        call_in_child = CIME.test_scheduler._call_in_child # pylint: disable=protected-access
+        def deadlocked_child(func, timeout=None): # pylint: disable=unused-argument
+            os.makedirs(os.path.join(test_root, "ERS.f19_g16.A"))
+            raise CIMEError("Child process 1234 did not finish within 600 seconds")
+
+        CIME.test_scheduler._call_in_child = deadlocked_child # pylint: disable=protected-access
+        try:
+            result = scheduler._create_newcase_phase("ERS.f19_g16.A") # pylint: disable=protected-access
+        finally:
+            CIME.test_scheduler._call_in_child = call_in_child # pylint: disable=protected-access
+            shutil.rmtree(test_root, ignore_errors=True)
+
+        self.assertEqual(result, (True, ""))
+        self.assertEqual(len(scheduler.commands), 1)
+        cmd, phase, test_dir_exists = scheduler.commands[0]
+        self.assertIn("--res f19_g16", cmd)
+        self.assertEqual(phase, CREATE_NEWCASE_PHASE)
+        self.assertFalse(test_dir_exists)
+        self.assertFalse(scheduler._in_process_create) # pylint: disable=protected-access
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import CIME.test_status_index
+from CIME.test_status import TestStatus, load_test_statuses, CREATE_NEWCASE_PHASE, XML_PHASE, \
+    TEST_PASS_STATUS, TEST_FAIL_STATUS, TEST_PEND_STATUS
+from CIME.test_status_index import get_test_status_contents, create_test_status_index, TEST_STATUS_INDEX_FILENAME
+
+class TestTestStatusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._test_root = tempfile.mkdtemp()
+        self._index_path = os.path.join(self._test_root, TEST_STATUS_INDEX_FILENAME)
+        create_test_status_index(self._test_root)
+        # Files written by the tests are trusted right away
+        self._settle_sec = CIME.test_status_index._SETTLE_SEC # pylint: disable=protected-access
+        CIME.test_status_index._SETTLE_SEC = 0 # pylint: disable=protected-access
+
+    def tearDown(self):
+        CIME.test_status_index._SETTLE_SEC = self._settle_sec # pylint: disable=protected-access
+        shutil.rmtree(self._test_root)
+
+    def _make_test(self, test, status):
+        test_dir = os.path.join(self._test_root, test)
+        if not os.path.isdir(test_dir):
+            os.makedirs(test_dir)
+        with TestStatus(test_dir=test_dir, test_name=test) as ts:
+            ts.set_status(CREATE_NEWCASE_PHASE, status)
+        return os.path.join(test_dir, "TestStatus")
+
+    def _read_index(self):
+        with open(self._index_path, "r") as fd:
+            return [json.loads(line) for line in fd]
+
+    def test_flush_updates_index(self):
+        path = self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+        entries = self._read_index()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["name"], "ERS.foo.A")
+        with open(path, "r") as fd:
+            self.assertEqual(entries[0]["contents"], fd.read())
+
+    def test_unchanged_files_not_read(self):
+        paths = [self._make_test("ERS.foo.A", TEST_PASS_STATUS), self._make_test("SMS.foo.A", TEST_FAIL_STATUS)]
+
+        real_open = open
+        opened = []
+        def tracking_open(path, *args, **kwargs):
+            opened.append(path)
+            return real_open(path, *args, **kwargs)
+
+        CIME.test_status_index.open = tracking_open
+        try:
+            statuses = load_test_statuses(paths)
+        finally:
+            del CIME.test_status_index.open
+
+        self.assertEqual(opened, [self._index_path])
+        self.assertEqual([ts.get_name() for ts in statuses], ["ERS.foo.A", "SMS.foo.A"])
+        self.assertEqual(statuses[1].get_status(CREATE_NEWCASE_PHASE), TEST_FAIL_STATUS)
+
+    def test_stale_and_missing_entries(self):
+        path = self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+
+        # Changed without going through TestStatus.flush
+        with open(path, "w") as fd:
+            fd.write("PASS ERS.foo.A CREATE_NEWCASE\nFAIL ERS.foo.A XML\n")
+        ts = load_test_statuses([path])[0]
+        self.assertEqual(ts.get_status(XML_PHASE), TEST_FAIL_STATUS)
+
+        # The rescan was indexed
+        self.assertEqual(self._read_index()[-1]["contents"], open(path).read())
+
+        os.remove(self._index_path)
+        with open(self._index_path, "w") as fd:
+            fd.write('{"name" : "ERS.foo.A", "mti') # truncated entry
+        self.assertEqual(get_test_status_contents([path]), [open(path).read()])
+
+    def test_flushes_racing_to_index(self):
+        path = self._make_test("ERS.foo.A", TEST_PEND_STATUS)
+        first = self._read_index()[-1]
+        self._make_test("ERS.foo.A", TEST_FAIL_STATUS)
+
+        # The first flush's entry lands last, and both have the same mtime
+        with open(self._index_path, "a") as fd:
+            fd.write(json.dumps(first) + "\n")
+        os.utime(path, (first["mtime"], first["mtime"]))
+        self.assertEqual(os.path.getsize(path), first["size"])
+
+        ts = load_test_statuses([path])[0]
+        self.assertEqual(ts.get_status(CREATE_NEWCASE_PHASE), TEST_FAIL_STATUS)
+
+    def test_compaction(self):
+        for _ in range(60):
+            self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+            self._make_test("ERS.foo.A", TEST_FAIL_STATUS)
+
+        self.assertEqual(len(self._read_index()), 120)
+        path = os.path.join(self._test_root, "ERS.foo.A", "TestStatus")
+        ts = load_test_statuses([path])[0]
+        self.assertEqual(ts.get_status(CREATE_NEWCASE_PHASE), TEST_FAIL_STATUS)
+        self.assertEqual(len(self._read_index()), 1)
+
+    def test_compaction_drops_removed_tests(self):
+        self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+        for _ in range(5):
+            self._make_test("SMS.foo.A", TEST_PASS_STATUS)
+        shutil.rmtree(os.path.join(self._test_root, "SMS.foo.A"))
+
+        get_test_status_contents([os.path.join(self._test_root, "ERS.foo.A", "TestStatus")])
+        self.assertEqual([entry["name"] for entry in self._read_index()], ["ERS.foo.A"])
+
+    def test_no_index_outside_test_roots(self):
+        os.remove(self._index_path)
+        path = self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+        self.assertEqual(get_test_status_contents([path]), [open(path).read()])
+        self.assertFalse(os.path.exists(self._index_path))
+
+    def test_unsettled_files_reread(self):
+        CIME.test_status_index._SETTLE_SEC = 60 # pylint: disable=protected-access
+        path = self._make_test("ERS.foo.A", TEST_PASS_STATUS)
+        st = os.stat(path)
+
+        # Rewritten with the same size within the resolution of its mtime
+        with open(path, "r") as fd:
+            contents = fd.read().replace("PASS", "FAIL")
+        with open(path, "w") as fd:
+            fd.write(contents)
+        os.utime(path, (st.st_atime, st.st_mtime))
+
+        self.assertEqual(get_test_status_contents([path]), [contents])
+        self.assertEqual(len(self._read_index()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import CIME.wait_for_tests
+from CIME.wait_for_tests import wait_for_tests_impl, watch_tests
+from CIME.test_status import TestStatus, CREATE_NEWCASE_PHASE, XML_PHASE, SETUP_PHASE, SHAREDLIB_BUILD_PHASE, \
+    MODEL_BUILD_PHASE, SUBMIT_PHASE, RUN_PHASE, TEST_PASS_STATUS, TEST_PEND_STATUS, TEST_FAIL_STATUS
+
+class TestWaitForTests(unittest.TestCase):
+
+    def setUp(self):
+        self._test_root = tempfile.mkdtemp()
+        self._sleep_interval = CIME.wait_for_tests.SLEEP_INTERVAL_SEC
+        CIME.wait_for_tests.SLEEP_INTERVAL_SEC = .01
+
+    def tearDown(self):
+        CIME.wait_for_tests.SLEEP_INTERVAL_SEC = self._sleep_interval
+        shutil.rmtree(self._test_root)
+
+    def _make_test(self, test, run_status):
+        test_dir = os.path.join(self._test_root, test)
+        os.makedirs(test_dir)
+        self._set_run_status(test_dir, test, run_status)
+        return test_dir
+
+    def _set_run_status(self, test_dir, test, run_status):
+        with TestStatus(test_dir=test_dir, test_name=test) as ts:
+            for phase in [CREATE_NEWCASE_PHASE, XML_PHASE, SETUP_PHASE, SHAREDLIB_BUILD_PHASE,
+                          MODEL_BUILD_PHASE, SUBMIT_PHASE]:
+                ts.set_status(phase, TEST_PASS_STATUS)
+            ts.set_status(RUN_PHASE, run_status)
+
+    def test_no_wait(self):
+        passed = self._make_test("PASSES", TEST_PASS_STATUS)
+        pending = self._make_test("PENDS", TEST_PEND_STATUS)
+        missing = os.path.join(self._test_root, "MISSING", "TestStatus")
+
+        results = wait_for_tests_impl([passed, pending, missing], no_wait=True)
+        self.assertEqual(results["PASSES"], (passed, TEST_PASS_STATUS))
+        self.assertEqual(results["PENDS"], (pending, TEST_PEND_STATUS))
+        self.assertTrue(results["MISSING"][1].startswith("File"))
+
+    def test_results_as_they_finish(self):
+        first = self._make_test("FIRST", TEST_PEND_STATUS)
+        second = self._make_test("SECOND", TEST_PEND_STATUS)
+
+        def finish():
+            time.sleep(.1)
+            self._set_run_status(second, "SECOND", TEST_FAIL_STATUS)
+            time.sleep(.1)
+            self._set_run_status(first, "FIRST", TEST_PASS_STATUS)
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        results = list(watch_tests([first, second]))
+        thread.join()
+
+        self.assertEqual(results, [("SECOND", second, TEST_FAIL_STATUS), ("FIRST", first, TEST_PASS_STATUS)])
+
+    def test_unchanged_files_not_parsed(self):
+        test_dir = self._make_test("PENDS", TEST_PEND_STATUS)
+        old_time = time.time() - 60
+        os.utime(os.path.join(test_dir, "TestStatus"), (old_time, old_time))
+
+        parses = []
+        real_test_status = CIME.wait_for_tests.TestStatus
+        def counting_test_status(*args, **kwargs):
+            parses.append(1)
+            return real_test_status(*args, **kwargs)
+
+        CIME.wait_for_tests.TestStatus = counting_test_status
+        try:
+            watcher = CIME.wait_for_tests._TestWatcher(test_dir, False, False, False, False, False) # pylint: disable=protected-access
+            for _ in range(10):
+                self.assertIsNone(watcher.check(True))
+        finally:
+            CIME.wait_for_tests.TestStatus = real_test_status
+
+        self.assertEqual(len(parses), 1)
+        self.assertEqual(watcher.check(False), ("PENDS", test_dir, TEST_PEND_STATUS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,4 @@
-#pylint: disable=import-error
-from six.moves import queue
-import os, time, threading, socket, signal, shutil, glob
+import os, time, socket, signal, shutil, glob
 #pylint: disable=import-error
 from distutils.spawn import find_executable
 import logging
@@ -342,75 +340,125 @@ NightlyStartTime: {5} UTC
     run_cmd_no_fail("ctest -VV -D NightlySubmit", verbose=True)
 
 ###############################################################################
-def wait_for_test(test_path, results, wait, check_throughput, check_memory, ignore_namelists, ignore_memleak, no_run):
+class _TestWatcher(object):
 ###############################################################################
-    if (os.path.isdir(test_path)):
-        test_status_filepath = os.path.join(test_path, TEST_STATUS_FILENAME)
-    else:
-        test_status_filepath = test_path
-
-    logging.debug("Watching file: '{}'".format(test_status_filepath))
-    test_log_path = os.path.join(os.path.dirname(test_status_filepath), ".internal_test_status.log")
-
-    # We don't want to make it a requirement that wait_for_tests has write access
-    # to all case directories
-    try:
-        fd = open(test_log_path, "w")
-        fd.close()
-    except (IOError, OSError):
-        test_log_path = "/dev/null"
-
-    prior_ts = None
-    with open(test_log_path, "w") as log_fd:
-        while (True):
-            if (os.path.exists(test_status_filepath)):
-                ts = TestStatus(test_dir=os.path.dirname(test_status_filepath))
-                test_name = ts.get_name()
-                test_status = ts.get_overall_test_status(wait_for_run=not no_run, # Important
-                                                         no_run=no_run,
-                                                         check_throughput=check_throughput,
-                                                         check_memory=check_memory, ignore_namelists=ignore_namelists,
-                                                         ignore_memleak=ignore_memleak)
-
-                if prior_ts is not None and prior_ts != ts:
+    """
+    Tracks the TestStatus file of one test. The file is only parsed again
+    when a stat shows it may have changed.
+    """
+
+    # A file modified this recently may change again without its mtime or
+    # size changing on file systems with coarse timestamps
+    _SETTLE_SEC = 2
+
+    def __init__(self, test_path, check_throughput, check_memory, ignore_namelists, ignore_memleak, no_run):
+        if (os.path.isdir(test_path)):
+            self.test_status_filepath = os.path.join(test_path, TEST_STATUS_FILENAME)
+        else:
+            self.test_status_filepath = test_path
+
+        self.test_path = test_path
+        self._status_args = {"wait_for_run" : not no_run, # Important
+                             "no_run" : no_run,
+                             "check_throughput" : check_throughput,
+                             "check_memory" : check_memory,
+                             "ignore_namelists" : ignore_namelists,
+                             "ignore_memleak" : ignore_memleak}
+        self._stat = None
+        self._prior_ts = None
+        self._result = None
+
+        logging.debug("Watching file: '{}'".format(self.test_status_filepath))
+        self._test_log_path = os.path.join(os.path.dirname(self.test_status_filepath), ".internal_test_status.log")
+
+        # We don't want to make it a requirement that wait_for_tests has write access
+        # to all case directories
+        try:
+            fd = open(self._test_log_path, "w")
+            fd.close()
+        except (IOError, OSError):
+            self._test_log_path = None
+
+    def _changed(self):
+        try:
+            st = os.stat(self.test_status_filepath)
+        except OSError:
+            return False
+
+        new_stat = (st.st_mtime, st.st_size, st.st_ino)
+        if new_stat != self._stat:
+            self._stat = new_stat
+            return True
+
+        return time.time() - st.st_mtime < self._SETTLE_SEC
+
+    def check(self, wait):
+        """
+        Return (test_name, test_path, test_status) once the test is done, or
+        immediately if wait is False. Return None while it is pending.
+        """
+        if self._changed():
+            ts = TestStatus(test_dir=os.path.dirname(self.test_status_filepath))
+            test_status = ts.get_overall_test_status(**self._status_args)
+
+            if self._prior_ts is not None and self._prior_ts != ts and self._test_log_path is not None:
+                with open(self._test_log_path, "a") as log_fd:
                     log_fd.write(ts.phase_statuses_dump())
                     log_fd.write("OVERALL: {}\n\n".format(test_status))
 
-                prior_ts = ts
-
-                if (test_status == TEST_PEND_STATUS and (wait and not SIGNAL_RECEIVED)):
-                    time.sleep(SLEEP_INTERVAL_SEC)
-                    logging.debug("Waiting for test to finish")
-                else:
-                    results.put( (test_name, test_path, test_status) )
-                    break
+            self._prior_ts = ts
+            self._result = (ts.get_name(), self.test_path, test_status)
 
+        if self._result is None:
+            if wait:
+                logging.debug("File '{}' does not yet exist".format(self.test_status_filepath))
+                return None
             else:
-                if (wait and not SIGNAL_RECEIVED):
-                    logging.debug("File '{}' does not yet exist".format(test_status_filepath))
-                    time.sleep(SLEEP_INTERVAL_SEC)
-                else:
-                    test_name = os.path.abspath(test_status_filepath).split("/")[-2]
-                    results.put( (test_name, test_path, "File '{}' doesn't exist".format(test_status_filepath)) )
-                    break
+                test_name = os.path.abspath(self.test_status_filepath).split("/")[-2]
+                return (test_name, self.test_path, "File '{}' doesn't exist".format(self.test_status_filepath))
+
+        if self._result[2] == TEST_PEND_STATUS and wait:
+            return None
+
+        return self._result
 
 ###############################################################################
-def wait_for_tests_impl(test_paths, no_wait=False, check_throughput=False, check_memory=False, ignore_namelists=False, ignore_memleak=False, no_run=False):
+def watch_tests(test_paths, no_wait=False, check_throughput=False, check_memory=False, ignore_namelists=False, ignore_memleak=False, no_run=False):
 ###############################################################################
-    results = queue.Queue()
-
-    for test_path in test_paths:
-        t = threading.Thread(target=wait_for_test, args=(test_path, results, not no_wait, check_throughput, check_memory, ignore_namelists, ignore_memleak, no_run))
-        t.daemon = True
-        t.start()
+    """
+    Yield (test_name, test_path, test_status) for each test as it finishes.
+    A single loop stats every pending TestStatus file each pass and only
+    parses the ones that changed. inotify is not used since it is not
+    available in the standard library and misses changes made on other
+    nodes of a shared file system.
+    """
+    pending = [_TestWatcher(test_path, check_throughput, check_memory, ignore_namelists, ignore_memleak, no_run)
+               for test_path in test_paths]
+
+    while pending:
+        pass_start = time.time()
+        wait = not no_wait and not SIGNAL_RECEIVED
+        still_pending = []
+        for watcher in pending:
+            result = watcher.check(wait)
+            if result is None:
+                still_pending.append(watcher)
+            else:
+                yield result
 
-    while threading.active_count() > 1:
-        time.sleep(1)
+        pending = still_pending
+        if pending:
+            logging.debug("Waiting for {:d} tests to finish".format(len(pending)))
+            # Keep the watcher under about 5% of a core for very many tests
+            time.sleep(max(SLEEP_INTERVAL_SEC, 20 * (time.time() - pass_start)))
 
+###############################################################################
+def wait_for_tests_impl(test_paths, no_wait=False, check_throughput=False, check_memory=False, ignore_namelists=False, ignore_memleak=False, no_run=False):
+###############################################################################
     test_results = {}
     completed_test_paths = []
-    while (not results.empty()):
-        test_name, test_path, test_status = results.get()
+    for test_name, test_path, test_status in watch_tests(test_paths, no_wait, check_throughput, check_memory, ignore_namelists, ignore_memleak, no_run):
+        logging.debug("Test '{}' finished with status '{}'".format(test_name, test_status))
         if (test_name in test_results):
             prior_path, prior_status = test_results[test_name]
             if (test_status == prior_status):
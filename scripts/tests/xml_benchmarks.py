@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmarks for the GenericXML query layer.
+
+Each benchmark times a GenericXML query against a reference implementation
+of the original algorithm on the same tree and reports both, so a regression
+in the query layer shows up as a drop in the speedup column.  Set
+CIME_XML_BACKEND to compare the xml backends.
+
+Usage:
+    ./xml_benchmarks.py [benchmark ...] [--repeat N]
+"""
+
+import os, sys, timeit, argparse
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib")
+sys.path.append(LIB_DIR)
+
+from CIME.utils import get_cime_root, expect
+from CIME.XML.generic_xml import GenericXML, _Element # pylint: disable=protected-access
+from CIME.XML.xml_backend import get_xml_backend
+
+CONFIG_COMPONENT = os.path.join(get_cime_root(), "src", "drivers", "mct", "cime_config", "config_component.xml")
+
+###############################################################################
+def _linear_get_children(root, name=None, attributes=None):
+###############################################################################
+    """
+    The original GenericXML.get_children: scan every child, wrap every match
+    """
+    children = []
+    for child in root.xml_element:
+        if name is not None and child.tag != name:
+            continue
+        if attributes is not None:
+            if any(key not in child.attrib or (value is not None and child.attrib[key] != value)
+                   for key, value in attributes.items()):
+                continue
+        children.append(type(root)(child))
+    return children
+
+###############################################################################
+def _intersect_scan_children(root, nodename, attributes):
+###############################################################################
+    """
+    The original GenericXML.scan_children: one findall per attribute, then
+    a quadratic intersection of the result lists
+    """
+    nodes = []
+    for key, value in attributes.items():
+        if value is None:
+            xpath = ".//{}[@{}]".format(nodename, key)
+        else:
+            xpath = ".//{}[@{}=\'{}\']".format(nodename, key, value)
+        newnodes = root.xml_element.findall(xpath)
+        if not nodes:
+            nodes = newnodes
+        else:
+            for node in nodes[:]:
+                if node not in newnodes:
+                    nodes.remove(node)
+        if not nodes:
+            return []
+    return [type(root)(node) for node in nodes]
+
+###############################################################################
+def _largest_config_file():
+###############################################################################
+    config_files = []
+    for dirpath, _, filenames in os.walk(get_cime_root()):
+        for filename in filenames:
+            if filename.startswith("config_") and filename.endswith(".xml"):
+                path = os.path.join(dirpath, filename)
+                config_files.append((os.path.getsize(path), path))
+    return max(config_files)[1]
+
+###############################################################################
+def _make_env_file(num_groups=12, entries_per_group=40):
+###############################################################################
+    """
+    Build an in-memory file shaped like a case env_run.xml
+    """
+    envxml = GenericXML()
+    envxml.read_only = False
+    backend = get_xml_backend()
+    envxml.tree = backend.ElementTree(backend.Element("file", {"id" : "env_run.xml", "version" : "2.0"}))
+    envxml.root = _Element(envxml.tree.getroot())
+    envxml.make_child("header", text="benchmark")
+    for gidx in range(num_groups):
+        group = envxml.make_child("group", attributes={"id" : "group{}".format(gidx)})
+        for eidx in range(entries_per_group):
+            entry = envxml.make_child("entry", attributes={"id" : "VAR_{}_{}".format(gidx, eidx), "value" : str(eidx)}, root=group)
+            envxml.make_child("type", root=entry, text="char")
+            values = envxml.make_child("values", root=entry)
+            for comp in ("ATM", "LND", "OCN", "ICE"):
+                envxml.make_child("value", attributes={"compclass" : comp}, root=values, text="1")
+            envxml.make_child("desc", root=entry, text="benchmark entry")
+    return envxml
+
+###############################################################################
+def _report(label, new_time, ref_time):
+###############################################################################
+    print("{:<56} {:>10.2f}us {:>10.2f}us {:>8.1f}x".format(label, new_time*1e6, ref_time*1e6, ref_time/new_time))
+
+###############################################################################
+def _time(func, repeat):
+###############################################################################
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+###############################################################################
+def bench_get_children(repeat):
+###############################################################################
+    config = GenericXML(CONFIG_COMPONENT)
+    entries = config.get_children("entry")
+    last_id = config.get(entries[-1], "id")
+    env = _make_env_file()
+    groups = env.get_children("group")
+    last_group = groups[-1]
+
+    cases = [
+        ("config_component get_children(entry)",
+         lambda config=config: config.get_children("entry"),
+         lambda config=config: _linear_get_children(config.root, "entry")),
+        ("config_component get_child(entry, id=last)",
+         lambda config=config, last_id=last_id: config.get_child("entry", {"id" : last_id}),
+         lambda config=config, last_id=last_id: _linear_get_children(config.root, "entry", {"id" : last_id})),
+        ("config_component get_optional_child(entry, id=missing)",
+         lambda config=config: config.get_optional_child("entry", {"id" : "NOT_THERE"}),
+         lambda config=config: _linear_get_children(config.root, "entry", {"id" : "NOT_THERE"})),
+        ("env_run get_child(group, id=last)",
+         lambda env=env: env.get_child("group", {"id" : "group11"}),
+         lambda env=env: _linear_get_children(env.root, "group", {"id" : "group11"})),
+        ("env_run get_optional_child(entry, id=last)",
+         lambda env=env, group=last_group: env.get_optional_child("entry", {"id" : "VAR_11_39"}, root=group),
+         lambda group=last_group: _linear_get_children(group, "entry", {"id" : "VAR_11_39"})),
+    ]
+    for label, new, ref in cases:
+        new() # build indexes outside of the timing
+        _report(label, _time(new, repeat), _time(ref, repeat))
+
+###############################################################################
+def bench_scan_children(repeat):
+###############################################################################
+    filename = _largest_config_file()
+    config = GenericXML(filename)
+    print("Scanning {}".format(filename))
+
+    # Query for the last element in the file carrying at least two attributes,
+    # the worst case for the intersection
+    target = [node for node in config.root.xml_element.iter() if len(node.attrib) >= 2][-1]
+    attributes = dict(list(target.attrib.items())[:2])
+    any_value = dict((key, None) for key in attributes)
+    single = dict(list(attributes.items())[:1])
+
+    cases = [
+        ("{} one attribute".format(target.tag), single),
+        ("{} two attributes".format(target.tag), attributes),
+        ("{} two attributes, any value".format(target.tag), any_value),
+    ]
+    for label, attribs in cases:
+        expected = _intersect_scan_children(config.root, target.tag, attribs)
+        assert config.scan_children(target.tag, attributes=attribs) == expected, "Results differ for {}".format(label)
+        _report(label,
+                _time(lambda attribs=attribs: config.scan_children(target.tag, attributes=attribs), repeat),
+                _time(lambda attribs=attribs: _intersect_scan_children(config.root, target.tag, attribs), repeat))
+
+BENCHMARKS = {
+    "get_children" : bench_get_children,
+    "scan_children" : bench_scan_children,
+}
+
+###############################################################################
+def _main_func(description):
+###############################################################################
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*",
+                        help="Benchmarks to run, one of {}. Default is all".format(", ".join(sorted(BENCHMARKS))))
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="Number of timings per query, the best is reported")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        expect(name in BENCHMARKS, "Unknown benchmark {}".format(name))
+
+    print("xml backend {}".format(get_xml_backend().name))
+    print("{:<56} {:>12} {:>12} {:>9}".format("query", "current", "reference", "speedup"))
+    for name in (args.benchmarks if args.benchmarks else sorted(BENCHMARKS.keys())):
+        BENCHMARKS[name](args.repeat)
+
+if __name__ == "__main__":
+    _main_func(__doc__)
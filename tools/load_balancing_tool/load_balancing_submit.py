@@ -269,7 +269,7 @@ def load_balancing_submit(compset, res, pesfile, mpilib, compiler, project, mach
         testname =  os.path.join(test_root, test + "." + test_id)
         testnames.append( testname)
         logger.info("test is {}".format(testname))
-        with Case(testname) as case:
+        with Case(testname, read_only=False) as case, case.transaction():
             pes_ntasks, pes_nthrds, pes_rootpe, _, _, _ = \
                                                     pesobj.find_pes_layout('any', 'any', 'any', pesize_opts=pesize_list.pop(0))
             for key in pes_ntasks: